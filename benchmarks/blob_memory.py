@@ -0,0 +1,109 @@
+"""
+输出发送方式的内存基准测试：比较整文件读入后发送blob消息与从文件分块发送blob_chunk消息的峰值常驻内存
+
+用法：
+    python benchmarks/blob_memory.py [--sizes 16,64,256]
+
+每种方式与输出大小在单独的子进程中运行，消息按SDK的方式拆分并序列化后丢弃，子进程报告峰值RSS与耗时
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ['buffered', 'streamed']
+
+
+def make_output(path: str, size_mb: int) -> None:
+    """生成不可压缩的输出文件"""
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+
+def deliver(mode: str, path: str) -> dict:
+    """在子进程中生成并序列化消息，与SDK把blob消息拆成8KB分块后写给守护进程的过程一致"""
+    from dify_plugin.core.server.__base.response_writer import ResponseWriter
+    from dify_plugin.entities.tool import ToolInvokeMessage
+
+    from utils.media_io import BLOB_CHUNK_SIZE, stream_blob
+
+    class NullWriter(ResponseWriter):
+        def __init__(self):
+            self.bytes_written = 0
+
+        def write(self, data: str):
+            self.bytes_written += len(data)
+
+        def done(self):
+            pass
+
+    writer = NullWriter()
+    meta = {"filename": os.path.basename(path), "mime_type": "video/mp4"}
+    started = time.monotonic()
+    if mode == 'buffered':
+        with open(path, 'rb') as f:
+            message = ToolInvokeMessage(
+                type=ToolInvokeMessage.MessageType.BLOB, message=ToolInvokeMessage.BlobMessage(blob=f.read()), meta=meta
+            )
+        blob = message.message.blob
+        chunks = [blob[i:i + BLOB_CHUNK_SIZE] for i in range(0, len(blob), BLOB_CHUNK_SIZE)]
+        for sequence, chunk in enumerate(chunks + [b""]):
+            writer.session_message(data=writer.stream_object(ToolInvokeMessage(
+                type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+                message=ToolInvokeMessage.BlobChunkMessage(
+                    id="bench", sequence=sequence, total_length=len(blob), blob=chunk, end=not chunk
+                ),
+                meta=meta
+            )))
+    else:
+        for message in stream_blob(path, meta):
+            writer.session_message(data=writer.stream_object(message))
+
+    return {
+        "seconds": time.monotonic() - started,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "bytes_written": writer.bytes_written
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='16,64,256', help="comma-separated output sizes in MB")
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(deliver(*args.child)))
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="bench_blob_")
+    try:
+        print(f"{'size_mb':>8}" + ''.join(f"{mode + '_rss_mb':>20}{mode + '_s':>14}" for mode in MODES))
+        for size_mb in [int(size) for size in args.sizes.split(',') if size.strip()]:
+            path = os.path.join(work_dir, f"output_{size_mb}.bin")
+            make_output(path, size_mb)
+            row = f"{size_mb:>8}"
+            for mode in MODES:
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--child', mode, path],
+                    capture_output=True, text=True, check=True
+                )
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                row += f"{result['peak_rss_bytes'] / (1024 * 1024):>20.1f}{result['seconds']:>14.2f}"
+            print(row)
+            os.remove(path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
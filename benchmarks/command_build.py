@@ -0,0 +1,238 @@
+"""
+命令构建开销的微基准测试：比较ffmpeg-python构建节点图再序列化与 utils.command 直接拼接参数列表的耗时
+
+用法：
+    python benchmarks/command_build.py [--number 2000] [--repeat 5]
+
+每种管线使用与对应工具相同的输入、滤镜与输出参数，只测量生成完整参数列表的时间，不启动ffmpeg。
+ffmpeg-python不再是插件的依赖，未安装时只测量新的构建方式。
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.video_thumbnails import FIRST_FRAME, RESET_PTS
+from tools.video_trim import RESET_AUDIO_PTS, RESET_VIDEO_PTS
+from utils.asr_audio import SILENCE_DETECT, SILENCE_MIN_SECONDS, SILENCE_NOISE
+from utils.command import PROGRESS_PREFIX, Command, filter_spec
+
+try:
+    import ffmpeg
+except ImportError:
+    ffmpeg = None
+
+IN_PATH = "/tmp/job/input.mp4"
+WORK_DIR = "/tmp/job/work"
+THREADS = 2
+
+LADDER = [('-2', '720', '2800k'), ('-2', '480', '1400k'), ('-2', '360', '800k')]
+PACKAGE_ARGS = {
+    'c:v': 'libx264', 'preset:v': 'veryfast', 'c:a': 'aac', 'force_key_frames': "expr:gte(t,n_forced*4)",
+    'threads': THREADS, 'f': 'hls', 'hls_time': 4.0, 'hls_playlist_type': 'vod',
+    'hls_segment_filename': os.path.join(WORK_DIR, 'v%v', 'seg%04d.ts'), 'master_pl_name': 'master.m3u8',
+    'var_stream_map': "v:0,a:0 v:1,a:1 v:2,a:2",
+    **{f'b:v:{i}': bitrate for i, (_, _, bitrate) in enumerate(LADDER)}
+}
+THUMBNAIL_TARGETS = [5.0 + 10 * i for i in range(6)]
+TRIM_SEGMENTS = [(10.0 * i, 10.0 * i + 5) for i in range(5)]
+TRIM_ARGS = {'c:v': 'libx264', 'crf': 18, 'preset': 'veryfast', 'threads': THREADS}
+
+
+def _legacy_compile(stream) -> list[str]:
+    """与原先 Stage.run 相同：序列化节点图后插入进度参数"""
+    args = stream.compile(overwrite_output=True)
+    return [args[0], '-benchmark', '-nostats', '-progress', 'pipe:1', *args[1:]]
+
+
+def legacy_pipelines() -> dict:
+    """各工具原先通过ffmpeg-python构建的命令"""
+    def extract_audio():
+        return _legacy_compile(ffmpeg.input(IN_PATH).output(f"{WORK_DIR}/output.mp3", acodec='libmp3lame', threads=THREADS))
+
+    def asr_silence():
+        audio = (
+            ffmpeg.input(IN_PATH).audio
+            .filter('silencedetect', noise=SILENCE_NOISE, d=SILENCE_MIN_SECONDS)
+            .filter('ametadata', mode='print', file=f"{WORK_DIR}/silence.txt")
+        )
+        return _legacy_compile(audio.output(f"{WORK_DIR}/full.wav", ac=1, ar=16000, acodec='pcm_s16le', threads=THREADS))
+
+    def video_compress():
+        return _legacy_compile(ffmpeg.input(IN_PATH).output(f"{WORK_DIR}/output.mp4", crf=28, preset='medium', threads=THREADS))
+
+    def video_convert():
+        return _legacy_compile(
+            ffmpeg.input(IN_PATH).output(f"{WORK_DIR}/output.mkv", threads=THREADS, **{'c:v': 'copy', 'c:a': 'copy'})
+        )
+
+    def chunk_concat():
+        streams = [ffmpeg.input(f"{WORK_DIR}/chunks.txt", f='concat', safe=0)['v'], ffmpeg.input(IN_PATH)['a']]
+        return _legacy_compile(ffmpeg.output(*streams, f"{WORK_DIR}/output.mp4", **{'c:v': 'copy'}))
+
+    def video_package():
+        source = ffmpeg.input(IN_PATH)
+        split = source.video.filter_multi_output('split', len(LADDER))
+        streams = [split.stream(i).filter('scale', int(w), int(h)) for i, (w, h, _) in enumerate(LADDER)]
+        streams.extend(source.audio for _ in LADDER)
+        return _legacy_compile(ffmpeg.output(*streams, f"{WORK_DIR}/v%v/index.m3u8", **PACKAGE_ARGS))
+
+    def thumbnail_branches(reset_pts: bool) -> list:
+        branches = []
+        for i, target in enumerate(THUMBNAIL_TARGETS):
+            branch = (
+                ffmpeg.input(IN_PATH, ss=f"{target:.3f}", skip_frame='nokey', noaccurate_seek=None).video
+                .trim(end_frame=1)
+                .filter('metadata', mode='add', key='thumbnail', value=i)
+                .filter('metadata', mode='print', file=f"{WORK_DIR}/frame{i:03d}.txt")
+                .filter('scale', 320, -2)
+            )
+            branches.append(branch.setpts('PTS-STARTPTS') if reset_pts else branch)
+        return branches
+
+    def thumbnails_even():
+        outputs = [
+            branch.output(f"{WORK_DIR}/frame{i:03d}.jpg", vframes=1) for i, branch in enumerate(thumbnail_branches(False))
+        ]
+        return _legacy_compile(ffmpeg.merge_outputs(*outputs).global_args('-copyts'))
+
+    def contact_sheet():
+        tiles = thumbnail_branches(True)
+        stream = (
+            ffmpeg.concat(*tiles, v=1, a=0)
+            .filter('tile', "3x2", padding=4, margin=4)
+            .output(f"{WORK_DIR}/contact_sheet.jpg", vframes=1)
+        )
+        return _legacy_compile(stream.global_args('-copyts'))
+
+    def trim_segments():
+        base = TRIM_SEGMENTS[0][0]
+        source = ffmpeg.input(IN_PATH, ss=base, to=TRIM_SEGMENTS[-1][1])
+        video_parts = source.video.filter_multi_output('split', len(TRIM_SEGMENTS))
+        audio_parts = source.audio.filter_multi_output('asplit', len(TRIM_SEGMENTS))
+        outputs = []
+        for i, (start, end) in enumerate(TRIM_SEGMENTS):
+            streams = [
+                video_parts[i].trim(start=start - base, end=end - base).setpts('PTS-STARTPTS'),
+                audio_parts[i].filter('atrim', start=start - base, end=end - base).filter('asetpts', 'PTS-STARTPTS')
+            ]
+            outputs.append(ffmpeg.output(*streams, f"{WORK_DIR}/part{i + 1}.mp4", **TRIM_ARGS))
+        return _legacy_compile(ffmpeg.merge_outputs(*outputs))
+
+    return locals()
+
+
+def builder_pipelines() -> dict:
+    """同样的命令通过 utils.command 构建"""
+    def extract_audio():
+        return Command().input(IN_PATH).output(
+            f"{WORK_DIR}/output.mp3", acodec='libmp3lame', threads=THREADS
+        ).compile(PROGRESS_PREFIX)
+
+    def asr_silence():
+        command = Command().input(IN_PATH)
+        audio = command.chain(
+            '0:a', SILENCE_DETECT, filter_spec('ametadata', mode='print', file=f"{WORK_DIR}/silence.txt")
+        )
+        command.output(f"{WORK_DIR}/full.wav", audio, ac=1, ar=16000, acodec='pcm_s16le', threads=THREADS)
+        return command.compile(PROGRESS_PREFIX)
+
+    def video_compress():
+        return Command().input(IN_PATH).output(
+            f"{WORK_DIR}/output.mp4", crf=28, preset='medium', threads=THREADS
+        ).compile(PROGRESS_PREFIX)
+
+    def video_convert():
+        return Command().input(IN_PATH).output(
+            f"{WORK_DIR}/output.mkv", threads=THREADS, **{'c:v': 'copy', 'c:a': 'copy'}
+        ).compile(PROGRESS_PREFIX)
+
+    def chunk_concat():
+        command = Command().input(f"{WORK_DIR}/chunks.txt", f='concat', safe=0).input(IN_PATH)
+        return command.output(f"{WORK_DIR}/output.mp4", '0:v', '1:a', **{'c:v': 'copy'}).compile(PROGRESS_PREFIX)
+
+    def video_package():
+        command = Command().input(IN_PATH)
+        streams = [
+            command.chain(branch, filter_spec('scale', w, h))
+            for branch, (w, h, _) in zip(command.split('0:v', len(LADDER)), LADDER)
+        ]
+        streams.extend('0:a' for _ in LADDER)
+        return command.output(f"{WORK_DIR}/v%v/index.m3u8", *streams, **PACKAGE_ARGS).compile(PROGRESS_PREFIX)
+
+    def thumbnail_branches(command: Command, reset_pts: bool) -> list[str]:
+        scale = filter_spec('scale', 320, -2)
+        branches = []
+        for i, target in enumerate(THUMBNAIL_TARGETS):
+            command.input(IN_PATH, ss=f"{target:.3f}", skip_frame='nokey', noaccurate_seek=None)
+            filters = [
+                FIRST_FRAME,
+                filter_spec('metadata', mode='add', key='thumbnail', value=i),
+                filter_spec('metadata', mode='print', file=f"{WORK_DIR}/frame{i:03d}.txt"),
+                scale
+            ]
+            if reset_pts:
+                filters.append(RESET_PTS)
+            branches.append(command.chain(f"{i}:v", *filters))
+        return branches
+
+    def thumbnails_even():
+        command = Command('-copyts')
+        for i, branch in enumerate(thumbnail_branches(command, False)):
+            command.output(f"{WORK_DIR}/frame{i:03d}.jpg", branch, vframes=1)
+        return command.compile(PROGRESS_PREFIX)
+
+    def contact_sheet():
+        command = Command('-copyts')
+        branches = thumbnail_branches(command, True)
+        sheet = command.chain(
+            branches, filter_spec('concat', n=len(branches), v=1, a=0), filter_spec('tile', "3x2", padding=4, margin=4)
+        )
+        return command.output(f"{WORK_DIR}/contact_sheet.jpg", sheet, vframes=1).compile(PROGRESS_PREFIX)
+
+    def trim_segments():
+        base = TRIM_SEGMENTS[0][0]
+        command = Command().input(IN_PATH, ss=base, to=TRIM_SEGMENTS[-1][1])
+        video_parts = command.split('0:v', len(TRIM_SEGMENTS))
+        audio_parts = command.split('0:a', len(TRIM_SEGMENTS), audio=True)
+        for i, (start, end) in enumerate(TRIM_SEGMENTS):
+            streams = [
+                command.chain(video_parts[i], filter_spec('trim', start=start - base, end=end - base), RESET_VIDEO_PTS),
+                command.chain(audio_parts[i], filter_spec('atrim', start=start - base, end=end - base), RESET_AUDIO_PTS)
+            ]
+            command.output(f"{WORK_DIR}/part{i + 1}.mp4", *streams, **TRIM_ARGS)
+        return command.compile(PROGRESS_PREFIX)
+
+    return {name: value for name, value in locals().items() if name != 'thumbnail_branches'}
+
+
+def per_call_us(build, number: int, repeat: int) -> float:
+    return min(timeit.repeat(build, number=number, repeat=repeat)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=2000, help="builds per timing run")
+    parser.add_argument('--repeat', type=int, default=5, help="timing runs per pipeline, the fastest is reported")
+    args = parser.parse_args()
+
+    builders = builder_pipelines()
+    legacy = {}
+    if ffmpeg is not None:
+        legacy = {name: build for name, build in legacy_pipelines().items() if name in builders}
+
+    print(f"{'pipeline':<18}{'argv':>6}{'ffmpeg_python_us':>18}{'builder_us':>12}{'speedup':>10}")
+    for name, build in builders.items():
+        argv_length = len(build())
+        builder_us = per_call_us(build, args.number, args.repeat)
+        if name in legacy:
+            legacy_us = per_call_us(legacy[name], args.number, args.repeat)
+            print(f"{name:<18}{argv_length:>6}{legacy_us:>18.1f}{builder_us:>12.1f}{legacy_us / builder_us:>10.1f}")
+        else:
+            print(f"{name:<18}{argv_length:>6}{'-':>18}{builder_us:>12.1f}{'-':>10}")
+
+
+if __name__ == '__main__':
+    main()
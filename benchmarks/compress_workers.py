@@ -0,0 +1,121 @@
+"""
+分块并行压缩的基准测试：比较单次编码与1/2/4/8个并行分块的耗时、体积与画质
+
+用法：
+    python benchmarks/compress_workers.py [input.mp4] [--duration 120] [--level medium]
+
+未指定输入时使用lavfi生成测试视频。
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chunked_encode import encode_chunked, plan_chunks
+from utils.command import Command
+from utils.probe import ProbeService
+from utils.scheduler import available_cpus, scheduler
+
+LEVELS = {
+    'low': (23, 'medium'),
+    'medium': (28, 'medium'),
+    'high': (32, 'faster')
+}
+
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+def make_fixture(path: str, duration: int) -> None:
+    """生成带音频的720p测试视频，每2秒一个关键帧"""
+    (
+        Command()
+        .input(f"testsrc2=size=1280x720:rate=25:duration={duration}", f='lavfi')
+        .input(f"sine=frequency=440:duration={duration}", f='lavfi')
+        .output(path, '0:v', '1:a', **{'c:v': 'libx264', 'g': 50, 'pix_fmt': 'yuv420p', 'c:a': 'aac'})
+        .run()
+    )
+
+
+def psnr(reference: str, distorted: str) -> float:
+    """返回distorted相对reference的平均PSNR"""
+    result = subprocess.run(
+        ['ffmpeg', '-i', distorted, '-i', reference, '-lavfi', 'psnr', '-f', 'null', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    match = re.search(r"average:([\d.]+|inf)", result.stderr)
+    return float(match.group(1)) if match else float('nan')
+
+
+def frame_count(path: str) -> int:
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+         '-show_entries', 'stream=nb_read_packets', '-of', 'csv=p=0', path],
+        stdout=subprocess.PIPE, text=True
+    )
+    return int(result.stdout.strip() or 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('--duration', type=int, default=120, help="lavfi fixture duration in seconds")
+    parser.add_argument('--level', choices=list(LEVELS), default='medium')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_compress_")
+    try:
+        in_path = args.input or os.path.join(work_dir, "fixture.mp4")
+        if not args.input:
+            make_fixture(in_path, args.duration)
+
+        crf, preset = LEVELS[args.level]
+        cpus = available_cpus()
+        probes = ProbeService(db_path=os.path.join(work_dir, "probe.sqlite3"))
+        probe = probes.probe(in_path, "bench")
+        keyframes = probes.keyframes(in_path, "bench")
+
+        print(f"input: {in_path} ({probe.duration:.1f}s, {len(keyframes.times)} keyframes), cpus: {cpus}")
+        print(f"{'mode':<12}{'chunks':>8}{'wall_s':>10}{'speedup':>10}{'size_kb':>10}{'size_diff':>11}"
+              f"{'psnr_db':>10}{'psnr_diff':>11}{'frames':>8}")
+
+        # 单次编码作为基准，独占全部CPU线程
+        single_path = os.path.join(work_dir, "single.mp4")
+        started = time.monotonic()
+        Command().input(in_path).output(single_path, crf=crf, preset=preset, threads=cpus).run()
+        single_wall = time.monotonic() - started
+        single_size = os.path.getsize(single_path)
+        single_psnr = psnr(in_path, single_path)
+        print(f"{'single':<12}{1:>8}{single_wall:>10.2f}{1.0:>10.2f}{single_size / 1024:>10.0f}{'':>11}"
+              f"{single_psnr:>10.2f}{'':>11}{frame_count(single_path):>8}")
+
+        for workers in WORKER_COUNTS:
+            # 并行数与每个分块的线程数按可用CPU分配，与插件运行时一致
+            scheduler.max_concurrency = workers
+            scheduler.threads_per_job = max(1, cpus // workers)
+            chunks = plan_chunks(keyframes, probe.duration, workers)
+            if not chunks:
+                print(f"{f'chunked x{workers}':<12}  one chunk, same as single pass")
+                continue
+
+            out_path = os.path.join(work_dir, f"chunked_{workers}.mp4")
+            started = time.monotonic()
+            encode_chunked(in_path, out_path, chunks, {'crf': crf, 'preset': preset},
+                           has_audio=bool(probe.streams('audio')), workers=workers)
+            wall = time.monotonic() - started
+            size = os.path.getsize(out_path)
+            quality = psnr(in_path, out_path)
+            print(f"{f'chunked x{workers}':<12}{len(chunks):>8}{wall:>10.2f}{single_wall / wall:>10.2f}"
+                  f"{size / 1024:>10.0f}{(size - single_size) / single_size * 100:>10.2f}%"
+                  f"{quality:>10.2f}{quality - single_psnr:>11.2f}{frame_count(out_path):>8}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
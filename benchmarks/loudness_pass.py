@@ -0,0 +1,106 @@
+"""
+响度测量的基准测试：比较提取后单独解码一遍测量与在提取命令中附加测量分支的耗时，以及两遍归一化与使用已有测量值的归一化
+
+用法：
+    python benchmarks/loudness_pass.py [input.mp4] [--duration 300] [--format mp3]
+
+对比的方式：
+    extract           只提取音频，作为基准
+    separate          提取后再单独解码一遍测量响度
+    inline            ExtractAudioTool 的 analyze：测量分支与提取共用一次解码
+    normalize         第一次归一化：先测量一遍，再带loudnorm提取
+    normalize_cached  测量值已在探测索引中，只运行带loudnorm的提取
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.audio_analysis import DEFAULT_TARGET_LUFS, add_analysis, loudnorm_filter, parse_analysis
+from utils.capabilities import AUDIO_FORMAT_ENCODERS, capability_cache
+from utils.command import Command
+from utils.probe import ProbeService
+
+
+def make_fixture(path: str, duration: int) -> None:
+    """生成带音频的测试视频，音频每10秒中有3秒静音"""
+    (
+        Command()
+        .input(f"testsrc2=size=640x360:rate=25:duration={duration}", f='lavfi')
+        .input(f"sine=frequency=440:duration={duration}", f='lavfi')
+        .output(
+            path, '0:v', '1:a',
+            **{'c:v': 'libx264', 'preset': 'ultrafast', 'c:a': 'aac', 'af': "volume=enable='gt(mod(t,10),7)':volume=0"}
+        )
+        .run()
+    )
+
+
+def measure(commands: list[Command]) -> tuple[float, float]:
+    """依次运行各ffmpeg命令，返回总耗时与子进程CPU时间"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.monotonic()
+    for command in commands:
+        command.run()
+    wall = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return wall, (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('--duration', type=int, default=300, help="lavfi fixture duration in seconds")
+    parser.add_argument('--format', choices=sorted(AUDIO_FORMAT_ENCODERS), default='mp3')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_loudness_")
+    try:
+        in_path = args.input or os.path.join(work_dir, "fixture.mp4")
+        if not args.input:
+            make_fixture(in_path, args.duration)
+        out_path = os.path.join(work_dir, f"output.{args.format}")
+        silence_path = os.path.join(work_dir, "silence.txt")
+        codec = capability_cache.get().pick_encoder(AUDIO_FORMAT_ENCODERS[args.format])
+
+        def extract(**output_args) -> Command:
+            return Command().input(in_path).output(out_path, acodec=codec, **output_args)
+
+        def analysis() -> Command:
+            command = Command().input(in_path)
+            add_analysis(command, silence_path)
+            return command
+
+        inline = extract()
+        add_analysis(inline, silence_path)
+
+        # 测量值只用于生成归一化命令，不计入耗时
+        duration = ProbeService(db_path=os.path.join(work_dir, "probe.sqlite3")).probe(in_path, "bench").duration
+        measurement = parse_analysis(analysis().run(), silence_path, duration)
+        normalized = extract(af=loudnorm_filter(measurement, DEFAULT_TARGET_LUFS), ar=48000)
+
+        print(f"input: {in_path} ({duration:.1f}s), format: {args.format} ({codec}), "
+              f"integrated: {measurement.integrated_lufs} LUFS, true peak: {measurement.true_peak_dbtp} dBTP")
+        print(f"{'mode':<18}{'decodes':>8}{'wall_s':>10}{'cpu_s':>10}{'wall_x':>10}{'cpu_x':>10}")
+
+        results = [
+            ('extract', 1, *measure([extract()])),
+            ('separate', 2, *measure([extract(), analysis()])),
+            ('inline', 1, *measure([inline])),
+            ('normalize', 2, *measure([analysis(), normalized])),
+            ('normalize_cached', 1, *measure([normalized])),
+        ]
+        base_wall, base_cpu = results[0][2], results[0][3]
+        for mode, decodes, wall, cpu in results:
+            print(f"{mode:<18}{decodes:>8}{wall:>10.2f}{cpu:>10.2f}{wall / base_wall:>10.2f}{cpu / base_cpu:>10.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+多码率打包的基准测试：比较一次解码、split分发给各码率档与每个码率档单独解码的耗时与CPU时间
+
+用法：
+    python benchmarks/package_renditions.py [input.mp4] [--duration 60] [--renditions 720p,480p,360p] [--format hls]
+
+对比三种方式：
+    shared      VideoPackageTool 的做法，一个ffmpeg进程解码一次并行编码所有码率档
+    separate    每个码率档单独运行一次打包，源视频被解码N次
+    compress    每个码率档单独运行一次 video_compress 式的整文件编码（CRF 28），源视频被解码N次
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.video_package import DEFAULT_RENDITIONS, VideoPackageTool
+from utils.command import Command, filter_spec
+from utils.probe import ProbeService
+from utils.scheduler import available_cpus
+
+
+def make_fixture(path: str, duration: int) -> None:
+    """生成带音频的1080p测试视频"""
+    (
+        Command()
+        .input(f"testsrc2=size=1920x1080:rate=25:duration={duration}", f='lavfi')
+        .input(f"sine=frequency=440:duration={duration}", f='lavfi')
+        .output(path, '0:v', '1:a', **{'c:v': 'libx264', 'g': 50, 'pix_fmt': 'yuv420p', 'c:a': 'aac'})
+        .run()
+    )
+
+
+def measure(commands: list[Command]) -> tuple[float, float]:
+    """依次运行各ffmpeg命令，返回总耗时与子进程CPU时间"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.monotonic()
+    for command in commands:
+        command.run()
+    wall = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return wall, (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('--duration', type=int, default=60, help="lavfi fixture duration in seconds")
+    parser.add_argument('--renditions', default=DEFAULT_RENDITIONS)
+    parser.add_argument('--format', choices=['hls', 'dash'], default='hls')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_package_")
+    try:
+        in_path = args.input or os.path.join(work_dir, "fixture.mp4")
+        if not args.input:
+            make_fixture(in_path, args.duration)
+
+        tool = VideoPackageTool.from_credentials({})
+        probe = ProbeService(db_path=os.path.join(work_dir, "probe.sqlite3")).probe(in_path, "bench")
+        has_audio = bool(probe.streams('audio'))
+        names = [name.strip() for name in args.renditions.split(',') if name.strip()]
+        ladder = tool._ladder(probe, names)
+        threads = available_cpus()
+
+        def package_dir(name: str) -> str:
+            path = os.path.join(work_dir, name)
+            os.makedirs(path, exist_ok=True)
+            return path
+
+        print(f"input: {in_path} ({probe.duration:.1f}s), renditions: {', '.join(r['name'] for r in ladder)}, "
+              f"cpus: {threads}")
+        print(f"{'mode':<12}{'decodes':>8}{'wall_s':>10}{'cpu_s':>10}{'wall_x':>10}{'cpu_x':>10}")
+
+        results = []
+        results.append(('shared', 1, *measure([
+            tool._package_command(in_path, package_dir("shared"), args.format, ladder, 4.0, has_audio, threads)
+        ])))
+        results.append(('separate', len(ladder), *measure([
+            tool._package_command(in_path, package_dir(f"separate_{i}"), args.format, [rendition], 4.0, has_audio, threads)
+            for i, rendition in enumerate(ladder)
+        ])))
+        compress_runs = []
+        for i, rendition in enumerate(ladder):
+            command = Command().input(in_path)
+            streams = [command.chain('0:v', filter_spec('scale', *rendition["scale"].split(':')))]
+            streams += ['0:a'] if has_audio else []
+            compress_runs.append(command.output(
+                os.path.join(work_dir, f"compress_{i}.mp4"), *streams, crf=28, preset='medium', threads=threads
+            ))
+        results.append(('compress', len(ladder), *measure(compress_runs)))
+
+        shared_wall, shared_cpu = results[0][2], results[0][3]
+        for mode, decodes, wall, cpu in results:
+            print(f"{mode:<12}{decodes:>8}{wall:>10.2f}{cpu:>10.2f}{wall / shared_wall:>10.2f}{cpu / shared_cpu:>10.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+场景索引的基准测试：比较建立索引、查询已有索引与在原始分辨率上检测场景的耗时，
+以及按目标大小压缩时单次两遍编码与按场景复杂度分配码率的分块编码
+
+用法：
+    python benchmarks/scene_index.py [input.mp4] [--duration 120] [--target-mb 3] [--workers 2]
+
+未指定输入时生成由复杂与简单画面交替组成的测试视频，每个场景10秒
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 与插件进程一样先导入dify_plugin，由它完成gevent的patch；否则分块编码的线程池中启动的子进程会一直等待
+import dify_plugin  # noqa: F401
+
+from tools.video_compress import ALLOCATED_HEADROOM
+from utils.chunked_encode import encode_chunked, plan_chunks
+from utils.command import Command, filter_spec
+from utils.metrics import Stage
+from utils.probe import ProbeService
+from utils.scene_index import SELECT_CUTS, allocate_bitrates, build_scene_index, cached_scene_index
+
+# 交替出现的场景画面，复杂程度差别明显
+SOURCES = [
+    ('testsrc2', {}), ('color', {'c': 'blue'}), ('mandelbrot', {}), ('smptebars', {}), ('cellauto', {'rule': 110}),
+    ('color', {'c': 'red'})
+]
+SCENE_SECONDS = 10
+AUDIO_BITRATE = 128000
+
+
+def make_fixture(path: str, duration: int) -> None:
+    count = max(1, duration // SCENE_SECONDS)
+    command = Command()
+    for i in range(count):
+        name, source_options = SOURCES[i % len(SOURCES)]
+        command.input(filter_spec(name, **source_options, s='1280x720', r=25), f='lavfi', t=SCENE_SECONDS)
+    command.input(f"sine=frequency=440:duration={count * SCENE_SECONDS}", f='lavfi')
+    video = command.chain(
+        [f"{i}:v" for i in range(count)], filter_spec('concat', n=count, v=1, a=0), filter_spec('format', 'yuv420p')
+    )
+    command.output(path, video, f"{count}:a", **{'c:v': 'libx264', 'preset': 'veryfast', 'c:a': 'aac'}).run()
+
+
+def timed(work):
+    started = time.monotonic()
+    value = work()
+    return time.monotonic() - started, value
+
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('--duration', type=int, default=120, help="lavfi fixture duration in seconds")
+    parser.add_argument('--target-mb', type=float, default=3.0, help="target size for the rate allocation comparison")
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_scene_index_")
+    try:
+        in_path = args.input or os.path.join(work_dir, "fixture.mp4")
+        if not args.input:
+            make_fixture(in_path, args.duration)
+        content_hash = f"bench-{os.getpid()}-{time.time()}"
+        duration = ProbeService(db_path=os.path.join(work_dir, "probe.sqlite3")).probe(in_path, "bench").duration
+
+        print(f"input: {in_path} ({duration:.1f}s)")
+        print(f"{'analysis':<22}{'seconds':>10}{'scene_cuts':>12}")
+        command = Command().input(in_path)
+        cuts_path = os.path.join(work_dir, "full_cuts.txt")
+        command.output(
+            os.devnull, command.chain('0:v:0', SELECT_CUTS, filter_spec('metadata', mode='print', file=cuts_path)), f='null'
+        )
+        seconds, _ = timed(command.run)
+        with open(cuts_path) as f:
+            full_cuts = sum(1 for line in f if line.startswith("frame:"))
+        print(f"{'full_resolution':<22}{seconds:>10.3f}{full_cuts:>12}")
+        seconds, index = timed(lambda: build_scene_index(in_path, content_hash, duration, Stage(name="scenes")))
+        print(f"{'build_index':<22}{seconds:>10.3f}{len(index.scene_cuts):>12}")
+        seconds, index = timed(lambda: cached_scene_index(content_hash))
+        print(f"{'cached_index':<22}{seconds:>10.3f}{len(index.scene_cuts):>12}")
+
+        # 与 VideoCompressTool 对较长视频的码率计算相同：容器开销2%，音频128 kbps，分块分配时同样预留余量
+        video_bitrate = int(args.target_mb * 1024 * 1024 * 8 * 0.98 / duration - AUDIO_BITRATE)
+        video_args = {'c:v': 'libx264', 'b:v': video_bitrate, 'maxrate': video_bitrate,
+                      'bufsize': video_bitrate * 2, 'preset': 'medium'}
+        target = args.target_mb * 1024 * 1024
+
+        print(f"\n{'rate_control':<22}{'seconds':>10}{'size_mb':>10}{'of_target':>11}")
+        passlog = os.path.join(work_dir, "passlog")
+        two_pass_path = os.path.join(work_dir, "two_pass.mp4")
+
+        def two_pass():
+            Command().input(in_path).output(
+                os.devnull, f='null', an=None, passlogfile=passlog, **{'pass': 1}, **video_args
+            ).run()
+            Command().input(in_path).output(
+                two_pass_path, passlogfile=passlog, **{'pass': 2, 'b:a': AUDIO_BITRATE}, **video_args
+            ).run()
+
+        seconds, _ = timed(two_pass)
+        size = os.path.getsize(two_pass_path)
+        print(f"{'two_pass':<22}{seconds:>10.2f}{size / 1048576:>10.2f}{size / target:>11.2f}")
+
+        allocated_path = os.path.join(work_dir, "allocated.mp4")
+        chunks = plan_chunks(index.keyframes(), duration, args.workers * 2, index.scene_cuts)
+        bitrates = allocate_bitrates(index, [(c.start, c.end) for c in chunks], int(video_bitrate * ALLOCATED_HEADROOM))
+        for chunk, bitrate in zip(chunks, bitrates):
+            chunk.bitrate = bitrate
+        seconds, _ = timed(lambda: encode_chunked(
+            in_path, allocated_path, chunks, video_args, has_audio=True, workers=args.workers,
+            audio_args={'b:a': AUDIO_BITRATE}
+        ))
+        size = os.path.getsize(allocated_path)
+        print(f"{'allocated_chunks':<22}{seconds:>10.2f}{size / 1048576:>10.2f}{size / target:>11.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
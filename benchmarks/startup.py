@@ -0,0 +1,157 @@
+"""
+启动延迟的基准测试：测量插件进程的冷启动时间、凭据验证耗时与第一次、第二次调用的延迟
+
+用法：
+    python benchmarks/startup.py [--repeat 5] [--idle 2.0]
+
+每次运行启动一个新的子进程，使用各自的临时目录、能力缓存、结果缓存与探测索引：
+    cold        FFMPEG_PREWARM=0，第一次调用承担全部冷启动开销
+    prewarm     FFMPEG_PREWARM=1，与 main.py 一样在启动后于后台预热
+
+cold_start 为从启动子进程到 main.py 构建完 Plugin 的时间，其中 sdk_import 为导入SDK，plugin_init 为解析YAML并加载全部工具模块；
+启动后等待 --idle 秒再发起请求，模拟插件启动与第一个请求之间的间隔。
+页缓存无法在不同运行之间清空，二进制的冷读取时间只在机器首次运行时体现。
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = {
+    'cold': {'FFMPEG_PREWARM': '0'},
+    'prewarm': {'FFMPEG_PREWARM': '1'}
+}
+
+METRICS = ['cold_start_seconds', 'sdk_import_seconds', 'plugin_init_seconds', 'validate_seconds', 'validate_again_seconds',
+           'first_invoke_seconds', 'second_invoke_seconds']
+
+RESULT_MARKER = "BENCHMARK_RESULT "
+
+
+def make_fixture(path: str, frequency: int) -> None:
+    """生成小尺寸测试视频，不同的音频频率使两个素材的内容哈希不同"""
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y',
+         '-f', 'lavfi', '-i', "testsrc2=size=320x240:rate=25:duration=2",
+         '-f', 'lavfi', '-i', f"sine=frequency={frequency}:duration=2",
+         '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', path],
+        check=True
+    )
+
+
+def worker(spec_json: str) -> None:
+    """子进程入口：导入 main.py，按场景预热，再依次验证凭据并调用两次工具"""
+    spec = json.loads(spec_json)
+    import_started = time.perf_counter()
+    import dify_plugin  # noqa: F401
+    sdk_ready = time.perf_counter()
+    import main  # noqa: F401
+    ready_at = time.time()
+    plugin_init_seconds = time.perf_counter() - sdk_ready
+
+    try:
+        from utils.warmup import start_warmup
+        start_warmup()
+    except ImportError:
+        # 没有预热模块的旧版本，两个场景相同
+        pass
+    time.sleep(spec['idle'])
+
+    from dify_plugin.file.entities import FileType
+    from dify_plugin.file.file import File
+
+    from provider.ffmpeg import FfmpegProvider
+    from tools.video_info import VideoInfoTool
+
+    def timed(call) -> float:
+        started = time.perf_counter()
+        call()
+        return time.perf_counter() - started
+
+    def invoke(path: str) -> None:
+        video = File(
+            url=f"file://{path}", filename=os.path.basename(path), extension='.mp4',
+            size=os.path.getsize(path), type=FileType.VIDEO, mime_type='video/mp4'
+        )
+        with open(path, 'rb') as f:
+            video._blob = f.read()
+        tool = VideoInfoTool.from_credentials({})
+        results = [m.message.json_object for m in tool._invoke({'video': video}) if hasattr(m.message, 'json_object')]
+        if not results or results[-1].get('status') != 'success':
+            raise RuntimeError(f"video_info failed: {results[-1] if results else 'no result'}")
+
+    provider = FfmpegProvider()
+    print(RESULT_MARKER + json.dumps({
+        'cold_start_seconds': ready_at - spec['spawned_at'],
+        'sdk_import_seconds': sdk_ready - import_started,
+        'plugin_init_seconds': plugin_init_seconds,
+        'validate_seconds': timed(lambda: provider.validate_credentials({})),
+        'validate_again_seconds': timed(lambda: provider.validate_credentials({})),
+        'first_invoke_seconds': timed(lambda: invoke(spec['fixtures'][0])),
+        'second_invoke_seconds': timed(lambda: invoke(spec['fixtures'][1]))
+    }), flush=True)
+
+
+def run_once(scenario: str, fixtures: list[str], idle: float) -> dict:
+    case_dir = tempfile.mkdtemp(prefix=f"bench_startup_{scenario}_")
+    env = {
+        **os.environ,
+        **SCENARIOS[scenario],
+        'TMPDIR': case_dir,
+        'FFMPEG_CACHE_DIR': os.path.join(case_dir, 'cache'),
+        'FFMPEG_PROBE_DB': os.path.join(case_dir, 'probe.sqlite3'),
+        'FFMPEG_CAPABILITIES_CACHE': os.path.join(case_dir, 'capabilities.json'),
+        'FFMPEG_TMPFS_DIR': '',
+        'PYTHONPATH': ROOT
+    }
+    spec = {'fixtures': fixtures, 'idle': idle, 'spawned_at': time.time()}
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(spec)],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+    finally:
+        shutil.rmtree(case_dir, ignore_errors=True)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'no result')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--repeat', type=int, default=5, help="runs per scenario, the median is reported")
+    parser.add_argument('--idle', type=float, default=2.0, help="seconds between startup and the first request")
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker)
+        return
+
+    fixture_dir = tempfile.mkdtemp(prefix="bench_startup_fixtures_")
+    try:
+        fixtures = [os.path.join(fixture_dir, f"fixture{i}.mp4") for i in range(2)]
+        for i, path in enumerate(fixtures):
+            make_fixture(path, 440 + i * 110)
+
+        print(f"{'scenario':<10}" + ''.join(f"{metric.replace('_seconds', ''):>16}" for metric in METRICS))
+        for scenario in SCENARIOS:
+            runs = [run_once(scenario, fixtures, args.idle) for _ in range(max(1, args.repeat))]
+            print(f"{scenario:<10}" + ''.join(
+                f"{statistics.median(run[metric] for run in runs):>16.4f}" for metric in METRICS
+            ), flush=True)
+    finally:
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+全部工具的基准测试：用lavfi生成确定性的测试素材，逐个调用 Tool._invoke 并记录耗时与资源占用
+
+用法：
+    python benchmarks/suite.py [--fixtures small,sd,hd] [--tools video_info,video_trim] [--repeat 3]
+                               [--output report.json] [--baseline baseline.json] [--threshold 0.15]
+
+每个用例在独立的子进程中运行，使用各自的临时目录、结果缓存与探测索引，测量的都是冷启动下的一次调用。
+指定 --baseline 时与基准报告逐项比较，任一指标超出阈值即视为性能退化，进程以状态码1退出。
+"""
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测试素材：分辨率、时长（秒）
+FIXTURES = {
+    'small': ('320x240', 5),
+    'sd': ('640x480', 15),
+    'hd': ('1280x720', 30)
+}
+
+# 每个工具的模块、类名与调用参数
+CASES = {
+    'video_info': ('tools.video_info', 'VideoInfoTool', {}),
+    'video_convert': ('tools.video_convert', 'VideoConvertTool', {'target_format': 'mkv'}),
+    'video_trim': ('tools.video_trim', 'VideoTrimTool', {'start_time': '1', 'end_time': '4', 'trim_mode': 'copy'}),
+    'video_compress': ('tools.video_compress', 'VideoCompressTool', {'compression_level': 'medium'}),
+    'extract_audio': ('tools.extract_audio', 'ExtractAudioTool', {'audio_format': 'mp3'})
+}
+
+METRICS = ['wall_seconds', 'cpu_seconds', 'peak_rss_bytes', 'child_peak_rss_bytes', 'peak_temp_bytes']
+
+# 低于这些绝对差值的变化视为噪声，不判定为退化
+NOISE_FLOORS = {
+    'wall_seconds': 0.05,
+    'cpu_seconds': 0.05,
+    'peak_rss_bytes': 4 * 1024 * 1024,
+    'child_peak_rss_bytes': 4 * 1024 * 1024,
+    'peak_temp_bytes': 1024 * 1024
+}
+
+RESULT_MARKER = "BENCHMARK_RESULT "
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def make_fixture(path: str, size: str, duration: int) -> None:
+    """用lavfi生成带音频的测试视频，单线程编码并去除版本信息，保证多次生成的结果一致"""
+    subprocess.run(
+        ['ffmpeg', '-v', 'error', '-y',
+         '-f', 'lavfi', '-i', f"testsrc2=size={size}:rate=25:duration={duration}",
+         '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=44100:duration={duration}",
+         '-c:v', 'libx264', '-g', '50', '-pix_fmt', 'yuv420p', '-threads', '1',
+         '-c:a', 'aac', '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact',
+         path],
+        check=True
+    )
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+def run_case(tool: str, fixture: str, fixture_path: str, base_url: str) -> dict:
+    """在子进程中运行一个用例，同时采样其临时目录的峰值占用"""
+    case_dir = tempfile.mkdtemp(prefix=f"bench_{tool}_{fixture}_")
+    env = {
+        **os.environ,
+        'TMPDIR': case_dir,
+        'FFMPEG_CACHE_DIR': os.path.join(case_dir, 'cache'),
+        'FFMPEG_PROBE_DB': os.path.join(case_dir, 'probe.sqlite3'),
+        # 作业工作区不使用tmpfs，全部临时文件都在被采样的目录中
+        'FFMPEG_TMPFS_DIR': '',
+        'PYTHONPATH': ROOT
+    }
+    spec = {'tool': tool, 'url': f"{base_url}/{os.path.basename(fixture_path)}", 'path': fixture_path}
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(spec)],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+
+    peak_temp = 0
+    stop = threading.Event()
+
+    def sample():
+        nonlocal peak_temp
+        while not stop.is_set():
+            peak_temp = max(peak_temp, _dir_size(case_dir))
+            stop.wait(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        stop.set()
+        sampler.join()
+        shutil.rmtree(case_dir, ignore_errors=True)
+
+    for line in reversed(stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            result = json.loads(line[len(RESULT_MARKER):])
+            result['peak_temp_bytes'] = peak_temp
+            return result
+    return {'status': 'error', 'message': stderr.strip().splitlines()[-1] if stderr.strip() else 'no result'}
+
+
+def worker(spec_json: str) -> None:
+    """子进程入口：调用一次工具并输出测量结果"""
+    import importlib
+    import resource
+
+    from dify_plugin.entities.tool import ToolInvokeMessage
+    from dify_plugin.file.entities import FileType
+    from dify_plugin.file.file import File
+
+    from utils.media_io import PeakRSSTracker
+
+    spec = json.loads(spec_json)
+    module_name, class_name, params = CASES[spec['tool']]
+    tool = getattr(importlib.import_module(module_name), class_name).from_credentials({})
+    video = File(
+        url=spec['url'],
+        filename=os.path.basename(spec['path']),
+        extension=os.path.splitext(spec['path'])[1],
+        size=os.path.getsize(spec['path']),
+        type=FileType.VIDEO,
+        mime_type='video/mp4'
+    )
+
+    rss_tracker = PeakRSSTracker()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+
+    status, message = 'error', 'no JSON result'
+    for msg in tool._invoke({'video': video, **params}):
+        if msg.type == ToolInvokeMessage.MessageType.JSON:
+            status = msg.message.json_object.get('status', status)
+            message = msg.message.json_object.get('message', message)
+
+    wall = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = sum(
+        getattr(after, field) - getattr(before, field)
+        for before, after in ((usage_before, usage_after), (children_before, children_after))
+        for field in ('ru_utime', 'ru_stime')
+    )
+
+    print(RESULT_MARKER + json.dumps({
+        'status': status,
+        'message': message,
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'peak_rss_bytes': rss_tracker.peak(),
+        # 子进程是新启动的，RUSAGE_CHILDREN的峰值只包含本次调用的ffmpeg进程
+        'child_peak_rss_bytes': children_after.ru_maxrss * 1024
+    }), flush=True)
+
+
+def ffmpeg_version() -> str:
+    result = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, text=True)
+    return result.stdout.splitlines()[0] if result.stdout else 'unknown'
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """返回相对基准退化的指标说明"""
+    baseline_results = {(r['tool'], r['fixture']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        base = baseline_results.get((result['tool'], result['fixture']))
+        if not base or result.get('status') != 'success' or base.get('status') != 'success':
+            continue
+        for metric in METRICS:
+            current, previous = result.get(metric), base.get(metric)
+            if current is None or not previous:
+                continue
+            if current > previous * (1 + threshold) and current - previous > NOISE_FLOORS[metric]:
+                regressions.append(
+                    f"{result['tool']}/{result['fixture']}: {metric} {previous:.4g} -> {current:.4g} "
+                    f"(+{(current - previous) / previous * 100:.1f}%)"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--fixtures', default=','.join(FIXTURES))
+    parser.add_argument('--tools', default=','.join(CASES))
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, the median is reported")
+    parser.add_argument('--output', default='benchmark-report.json')
+    parser.add_argument('--baseline', help="report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15, help="allowed relative slowdown per metric")
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker)
+        return
+
+    fixtures = [name for name in args.fixtures.split(',') if name]
+    tools = [name for name in args.tools.split(',') if name]
+    fixture_dir = tempfile.mkdtemp(prefix="bench_fixtures_")
+    handler = functools.partial(_QuietHandler, directory=fixture_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        results = []
+        for fixture in fixtures:
+            size, duration = FIXTURES[fixture]
+            fixture_path = os.path.join(fixture_dir, f"{fixture}.mp4")
+            make_fixture(fixture_path, size, duration)
+
+            for tool in tools:
+                runs = [run_case(tool, fixture, fixture_path, base_url) for _ in range(max(1, args.repeat))]
+                failed = next((r for r in runs if r.get('status') != 'success'), None)
+                result = {'tool': tool, 'fixture': fixture, 'runs': len(runs)}
+                if failed:
+                    result.update(status='error', message=failed.get('message'))
+                else:
+                    result['status'] = 'success'
+                    for metric in METRICS:
+                        values = [r[metric] for r in runs if r.get(metric) is not None]
+                        result[metric] = statistics.median(values) if values else None
+                results.append(result)
+                print(
+                    f"{tool:<16}{fixture:<7}"
+                    + (f"wall {result['wall_seconds']:7.3f}s  cpu {result['cpu_seconds']:7.3f}s  "
+                       f"rss {result['peak_rss_bytes'] / 1048576:6.1f}MB  "
+                       f"ffmpeg rss {result['child_peak_rss_bytes'] / 1048576:6.1f}MB  "
+                       f"temp {result['peak_temp_bytes'] / 1048576:6.1f}MB"
+                       if result['status'] == 'success' else f"FAILED: {result.get('message')}"),
+                    flush=True
+                )
+    finally:
+        server.shutdown()
+        shutil.rmtree(fixture_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'ffmpeg': ffmpeg_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}")
+
+    exit_code = 1 if any(r['status'] != 'success' for r in results) else 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            exit_code = 1
+        else:
+            print(f"no regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
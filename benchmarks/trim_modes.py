@@ -0,0 +1,135 @@
+"""
+剪切模式的基准测试：比较 copy、smart 与 reencode 三种模式剪切同一区间的耗时、体积与帧精度
+
+用法：
+    python benchmarks/trim_modes.py [input.mp4] [--duration 120] [--start 7.3] [--end 67.7]
+
+未指定输入时使用lavfi生成测试视频（720p，每2秒一个关键帧）。smart 一行之后列出其各步骤
+（首尾GOP重编码、中间复制、音频、拼接）的耗时；某个模式失败时打印ffmpeg的错误并继续。
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 工具模块先导入dify_plugin，其gevent补丁需要在线程与子进程模块使用之前生效
+from tools.video_trim import VideoTrimTool
+from utils.command import Command, FFmpegError
+from utils.metrics import Stage
+from utils.probe import ProbeService
+from utils.scheduler import available_cpus
+
+SMART_STEPS = ['head', 'middle', 'tail', 'audio', 'concat']
+
+
+class TimedStage(Stage):
+    """逐条记录ffmpeg命令耗时的Stage，smart模式中途失败时也能得到已完成步骤的耗时"""
+
+    def __init__(self, name: str):
+        super().__init__(name=name)
+        self.step_seconds = []
+
+    def run(self, command, expected_seconds=None):
+        started = time.monotonic()
+        try:
+            return super().run(command, expected_seconds)
+        finally:
+            self.step_seconds.append(time.monotonic() - started)
+
+
+def make_fixture(path: str, duration: int) -> None:
+    """生成带音频的720p测试视频，每2秒一个关键帧"""
+    (
+        Command()
+        .input(f"testsrc2=size=1280x720:rate=25:duration={duration}", f='lavfi')
+        .input(f"sine=frequency=440:duration={duration}", f='lavfi')
+        .output(path, '0:v', '1:a', **{'c:v': 'libx264', 'g': 50, 'pix_fmt': 'yuv420p', 'c:a': 'aac'})
+        .run()
+    )
+
+
+def video_summary(path: str) -> tuple[int, float]:
+    """返回输出视频流的帧数与时长"""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+         '-show_entries', 'stream=nb_read_packets,duration', '-of', 'csv=p=0', path],
+        capture_output=True, text=True, check=True
+    )
+    duration, _, frames = result.stdout.strip().partition(',')
+    return int(frames or 0), float(duration or 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('--duration', type=int, default=120, help="lavfi fixture duration in seconds")
+    parser.add_argument('--start', type=float, default=7.3)
+    parser.add_argument('--end', type=float, default=67.7)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_trim_")
+    try:
+        in_path = args.input or os.path.join(work_dir, "fixture.mp4")
+        if not args.input:
+            make_fixture(in_path, args.duration)
+
+        tool = VideoTrimTool.from_credentials({})
+        probes = ProbeService(db_path=os.path.join(work_dir, "probe.sqlite3"))
+        probe = probes.probe(in_path, "bench")
+        keyframes = probes.keyframes(in_path, "bench")
+        threads = available_cpus()
+        start, end = args.start, args.end
+        fps = tool._frame_rate(probe.streams('video')[0])
+        cut_points = tool._find_smart_cut_points(probe, keyframes, start, end)
+
+        def copy(out_path: str, stage: Stage) -> None:
+            stage.run(Command().input(in_path, ss=start, to=end).output(out_path, c='copy'))
+
+        def smart(out_path: str, stage: Stage) -> None:
+            tool._smart_trim(in_path, out_path, start, end, probe, keyframes, cut_points, threads, stage)
+
+        def reencode(out_path: str, stage: Stage) -> None:
+            tool._reencode_trim(in_path, out_path, start, end, probe, threads, stage)
+
+        modes = [('copy', copy), ('smart', smart), ('reencode', reencode)]
+        if cut_points is None:
+            print("smart: no complete GOP in the range or unsupported codec, skipped")
+            modes.remove(('smart', smart))
+
+        print(f"input: {in_path} ({probe.duration:.1f}s, {len(keyframes.times)} keyframes), "
+              f"range: {start}-{end}s ({round((end - start) * fps)} frames), cpus: {threads}")
+        print(f"{'mode':<12}{'wall_s':>10}{'size_kb':>10}{'frames':>8}{'duration_s':>12}")
+
+        for name, trim in modes:
+            out_path = os.path.join(work_dir, f"{name}.mp4")
+            stage = TimedStage(name)
+            started = time.monotonic()
+            try:
+                trim(out_path, stage)
+            except FFmpegError as e:
+                print(f"{name:<12}{time.monotonic() - started:>10.2f}  failed: {e}")
+            else:
+                wall = time.monotonic() - started
+                frames, duration = video_summary(out_path)
+                print(f"{name:<12}{wall:>10.2f}{os.path.getsize(out_path) / 1024:>10.0f}{frames:>8}{duration:>12.3f}")
+            if name == 'smart':
+                # 首尾片段帧数为0时对应步骤会被跳过，这里按实际运行的命令顺序对齐
+                steps = [step for step in SMART_STEPS if step != 'audio' or probe.streams('audio')]
+                first, last = cut_points
+                if round((keyframes.times[first] - start) * fps) <= 0:
+                    steps.remove('head')
+                if round((end - keyframes.times[last]) * fps) <= 0:
+                    steps.remove('tail')
+                for step, seconds in zip(steps, stage.step_seconds):
+                    print(f"  {step:<10}{seconds:>10.2f}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
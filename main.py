@@ -1,6 +1,10 @@
 from dify_plugin import Plugin, DifyPluginEnv
 
+from utils.warmup import start_warmup
+
 plugin = Plugin(DifyPluginEnv(MAX_REQUEST_TIMEOUT=120))
 
 if __name__ == '__main__':
+    # 等待第一个请求期间预热FFmpeg与各项缓存
+    start_warmup()
     plugin.run()
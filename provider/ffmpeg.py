@@ -1,21 +1,24 @@
 from typing import Any
-import subprocess
 
 from dify_plugin import ToolProvider
 from dify_plugin.errors.tool import ToolProviderCredentialValidationError
 
+from utils.capabilities import CapabilityError, capability_cache
+
 
 class FfmpegProvider(ToolProvider):
     def _validate_credentials(self, credentials: dict[str, Any]) -> None:
         try:
-            # 验证FFmpeg是否已安装并可用
-            result = subprocess.run(['ffmpeg', '-version'], 
-                                   stdout=subprocess.PIPE, 
-                                   stderr=subprocess.PIPE, 
-                                   text=True)
-            if result.returncode != 0:
-                raise ToolProviderCredentialValidationError("FFmpeg is not installed or not available. Please install FFmpeg and try again.")
+            # 验证FFmpeg可用并读取当前构建的编码器与封装器；结果按二进制指纹缓存在磁盘上，
+            # 进程内只探测一次，重复验证不再启动ffmpeg进程
+            capabilities = capability_cache.get()
+            if not capabilities.has_muxer('mp4'):
+                raise ToolProviderCredentialValidationError("The installed FFmpeg build cannot write MP4 files.")
                 
+        except ToolProviderCredentialValidationError:
+            raise
+        except CapabilityError as e:
+            raise ToolProviderCredentialValidationError(f"Failed to read FFmpeg capabilities: {str(e)}")
         except FileNotFoundError:
             raise ToolProviderCredentialValidationError("FFmpeg command not found. Please install FFmpeg and ensure it's in your PATH.")
         except Exception as e:
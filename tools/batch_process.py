@@ -0,0 +1,206 @@
+from collections.abc import Generator
+from typing import Any
+import queue
+import threading
+import time
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+# 导入模块而不是工具类：插件加载时要求每个工具文件的命名空间中只有一个Tool子类
+from tools import extract_audio, video_compress, video_convert, video_info
+from utils.deadline import POLL_SECONDS, Deadline
+from utils.metrics import InvocationMetrics
+from utils.scheduler import scheduler
+
+# 支持批量处理的工具及各自接受的参数
+OPERATIONS = {
+    'video_info': (video_info.VideoInfoTool, ['probe_mode']),
+    'extract_audio': (extract_audio.ExtractAudioTool, ['audio_format', 'audio_attrs']),
+    'video_convert': (video_convert.VideoConvertTool, ['target_format']),
+    'video_compress': (video_compress.VideoCompressTool, ['compression_level', 'target_size_mb'])
+}
+
+# 并行处理的文件数上限
+MAX_BATCH_WORKERS = 8
+
+# 预算耗尽后尚未开始的文件的状态
+STATUS_SKIPPED = "skipped"
+
+
+class BatchProcessTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        video_files = tool_parameters.get('videos') or []
+        operation = (tool_parameters.get('operation') or '').lower()
+        workers = tool_parameters.get('workers')
+
+        # 验证输入
+        if not video_files:
+            yield self.create_text_message("No video files provided")
+            yield self.create_json_message({
+                "status": "error",
+                "message": "No video files provided"
+            })
+            return
+
+        if operation not in OPERATIONS:
+            error_msg = f"Invalid operation: {operation}. Supported operations: {', '.join(OPERATIONS)}"
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "status": "error",
+                "message": error_msg
+            })
+            return
+
+        # 默认比调度器的并发数多一个，下一个文件的上传可以与当前文件的处理重叠
+        try:
+            workers = int(workers) if workers else scheduler.max_concurrency + 1
+        except (TypeError, ValueError):
+            yield self.create_text_message(f"Invalid workers value: {workers}. Using {scheduler.max_concurrency + 1} instead.")
+            workers = scheduler.max_concurrency + 1
+        workers = max(1, min(workers, MAX_BATCH_WORKERS, len(video_files)))
+
+        tool_class, option_names = OPERATIONS[operation]
+        # 所有文件共用同一个工具实例，结果缓存、探测索引与编码器能力在进程内共享
+        tool = tool_class(runtime=self.runtime, session=self.session)
+        options = {name: tool_parameters[name] for name in option_names if tool_parameters.get(name) is not None}
+
+        deadline = Deadline()
+        metrics = InvocationMetrics("batch_process")
+        events = queue.Queue(maxsize=workers * 2)
+        pending = iter(enumerate(video_files))
+        pending_lock = threading.Lock()
+        closed = threading.Event()
+
+        def put(event: tuple) -> bool:
+            # 调用方放弃请求后不再等待队列空位
+            while not closed.is_set():
+                try:
+                    events.put(event, timeout=POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            while True:
+                with pending_lock:
+                    index, video_file = next(pending, (None, None))
+                if video_file is None or closed.is_set():
+                    return
+                if deadline.stopped:
+                    put(("done", index, {"status": STATUS_SKIPPED, "message": "Time budget exhausted before processing started"}, 0.0, 0))
+                    continue
+                put(("done", index, *self._process(tool, {'video': video_file, **options}, index, deadline, put, closed)))
+
+        results: list[dict[str, Any]] = [{} for _ in video_files]
+        input_bytes = sum(video_file.size or 0 for video_file in video_files)
+        output_bytes = 0
+        completed = 0
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            yield self.create_text_message(f"Processing {len(video_files)} files with {operation} using {workers} workers...\n")
+            while completed < len(video_files):
+                try:
+                    event = events.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                if event[0] == "message":
+                    yield event[2]
+                    continue
+
+                _, index, result, seconds, blob_bytes = event
+                completed += 1
+                output_bytes += blob_bytes
+                results[index] = {
+                    "index": index,
+                    "filename": video_files[index].filename,
+                    "status": result.get("status", "error"),
+                    "seconds": round(seconds, 3)
+                }
+                if result.get("status") not in ("success", None):
+                    results[index]["message"] = result.get("message")
+                yield self.create_text_message(
+                    f"[{completed}/{len(video_files)}] {video_files[index].filename}: {results[index]['status']}"
+                    + (f" ({seconds:.1f}s)" if seconds else "") + "\n"
+                )
+        finally:
+            # 调用方放弃请求时通知各线程结束正在处理的文件，使其清理临时文件
+            closed.set()
+            deadline.cancel()
+            for thread in threads:
+                thread.join()
+
+        wall_seconds = metrics.to_dict()["total_seconds"]
+        counts = {
+            status: sum(1 for result in results if result["status"] == status)
+            for status in ("success", "partial", "error", "timeout", STATUS_SKIPPED)
+        }
+        summary = {
+            "files": len(video_files),
+            "succeeded": counts["success"],
+            "partial": counts["partial"],
+            "failed": counts["error"] + counts["timeout"],
+            "skipped": counts[STATUS_SKIPPED],
+            "workers": workers,
+            "wall_seconds": round(wall_seconds, 3),
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "files_per_second": round(len(video_files) / wall_seconds, 3) if wall_seconds else None,
+            "mb_per_second": round(input_bytes / 1048576 / wall_seconds, 3) if wall_seconds else None
+        }
+
+        text = f"Batch {operation} finished: {summary['succeeded']}/{summary['files']} succeeded"
+        if summary["failed"]:
+            text += f", {summary['failed']} failed"
+        if summary["skipped"]:
+            text += f", {summary['skipped']} skipped"
+        text += (f"\nThroughput: {summary['files_per_second']} files/s, {summary['mb_per_second']} MB/s "
+                 f"({summary['wall_seconds']}s total)")
+        if summary["succeeded"] == summary["files"]:
+            status = "success"
+        else:
+            status = "partial" if summary["succeeded"] or summary["partial"] else "error"
+        yield self.create_text_message(text)
+        yield self.create_json_message({
+            "status": status,
+            "operation": operation,
+            "summary": summary,
+            "results": results,
+            "metrics": metrics.emit(status)
+        })
+
+    def _process(self, tool: Tool, params: dict[str, Any], index: int, deadline: Deadline, put,
+                 closed: threading.Event) -> tuple[dict[str, Any], float, int]:
+        """处理单个文件，文件和JSON结果立即转发给调用方，返回该文件的JSON结果、耗时与输出字节数"""
+        started = time.monotonic()
+        result: dict[str, Any] = {"status": "error", "message": "No result"}
+        blob_bytes = 0
+        # 预算耗尽时不中断正在转发的分块文件，避免调用方收到不完整的文件
+        streaming = False
+        messages = tool._invoke(params)
+        try:
+            for message in messages:
+                # 预算耗尽或调用方放弃请求，关闭生成器使工具结束ffmpeg并清理临时文件
+                if closed.is_set() or (deadline.stopped and not streaming):
+                    result = {"status": "timeout", "message": "Time budget exhausted during processing"}
+                    break
+                if message.type == ToolInvokeMessage.MessageType.BLOB_CHUNK:
+                    blob_bytes += len(message.message.blob)
+                    streaming = not message.message.end
+                    put(("message", index, message))
+                elif message.type == ToolInvokeMessage.MessageType.BLOB:
+                    blob_bytes += len(message.message.blob)
+                    put(("message", index, message))
+                elif message.type == ToolInvokeMessage.MessageType.JSON:
+                    result = message.message.json_object
+                    put(("message", index, self.create_json_message({"batch_index": index, **result})))
+                # 单个文件的进度与摘要文本不转发，改为每个文件完成后返回一行状态
+        except Exception as e:
+            result = {"status": "error", "message": f"Error processing file: {str(e)}"}
+        finally:
+            messages.close()
+        return result, time.monotonic() - started, blob_bytes
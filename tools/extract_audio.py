@@ -1,20 +1,40 @@
-import ast
 import os
-import tempfile
-import time
 from collections.abc import Generator
-from typing import Any
+from typing import Any, Optional
 
-import ffmpeg
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.audio_analysis import (
+    DEFAULT_TARGET_LUFS, LOUDNESS_ANALYZE, LOUDNESS_NORMALIZE, LOUDNESS_OFF, TARGET_LUFS_RANGE, LoudnessMeasurement,
+    add_analysis, loudnorm_filter, parse_analysis
+)
+from utils.asr_audio import (
+    ASR_CHANNELS, ASR_CODECS, ASR_SAMPLE_RATE, DEFAULT_CHUNK_SECONDS, MODE_FIXED, MODE_SILENCE, extract_asr_chunks
+)
+from utils.audio_options import AudioOptionsError, parse_audio_attrs
+from utils.cache import replay, result_cache
+from utils.capabilities import AUDIO_FORMAT_ENCODERS, CapabilityError, capability_cache
+from utils.command import Command, FFmpegError
+from utils.deadline import Deadline, DeadlineExceeded, timeout_messages
+from utils.decision import PATH_PASSTHROUGH, PATH_STREAM_COPY, PATH_TRANSCODE, Decision, decide_extract_audio
+from utils.media_io import PeakRSSTracker, spool_input, stream_blob
+from utils.metrics import InvocationMetrics, Stage
+from utils.probe import probe_service
+from utils.progress import ProgressTracker
+from utils.scheduler import PRIORITY_AUDIO, PRIORITY_COPY, scheduler
+from utils.workspace import workspace_manager
+
 
 class ExtractAudioTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         video_file = tool_parameters.get('video')
         audio_format = tool_parameters.get('audio_format', 'mp3').lower()
         audio_attrs = tool_parameters.get('audio_attrs', '')
+        asr_mode = (tool_parameters.get('asr_mode') or 'off').lower()
+        chunk_seconds = tool_parameters.get('chunk_seconds')
+        loudness = (tool_parameters.get('loudness') or LOUDNESS_OFF).lower()
+        target_lufs = tool_parameters.get('target_lufs')
 
         # 验证输入
         if not video_file:
@@ -31,6 +51,51 @@ class ExtractAudioTool(Tool):
             yield self.create_text_message(f"Invalid audio format: {audio_format}. Using 'mp3' instead.")
             audio_format = 'mp3'
 
+        # 在读取输入之前校验音频属性，无效的请求不必等到ffmpeg启动后才失败
+        try:
+            audio_options = parse_audio_attrs(audio_attrs)
+        except AudioOptionsError as e:
+            yield self.create_text_message(str(e))
+            yield self.create_json_message({
+                "status": "error",
+                "message": str(e)
+            })
+            return
+
+        if loudness not in (LOUDNESS_OFF, LOUDNESS_ANALYZE, LOUDNESS_NORMALIZE):
+            yield self.create_text_message(f"Invalid loudness option: {loudness}. Loudness processing is turned off.")
+            loudness = LOUDNESS_OFF
+        if loudness == LOUDNESS_NORMALIZE:
+            try:
+                target_lufs = float(target_lufs) if target_lufs is not None else DEFAULT_TARGET_LUFS
+                if not TARGET_LUFS_RANGE[0] <= target_lufs <= TARGET_LUFS_RANGE[1]:
+                    raise ValueError
+            except (TypeError, ValueError):
+                yield self.create_text_message(f"Invalid target loudness: {target_lufs}. Using {DEFAULT_TARGET_LUFS:g} LUFS instead.")
+                target_lufs = DEFAULT_TARGET_LUFS
+
+        progress = ProgressTracker(deadline=Deadline())
+        metrics = InvocationMetrics("extract_audio", progress)
+
+        # 语音识别模式：输出16kHz单声道分块
+        if asr_mode in (MODE_FIXED, MODE_SILENCE):
+            if audio_format not in ASR_CODECS:
+                if tool_parameters.get('audio_format'):
+                    yield self.create_text_message(f"ASR mode outputs wav or flac, not {audio_format}. Using 'wav' instead.")
+                audio_format = 'wav'
+            if loudness != LOUDNESS_OFF:
+                yield self.create_text_message("Loudness options are not available in ASR mode and were ignored.")
+            try:
+                chunk_seconds = float(chunk_seconds) if chunk_seconds else DEFAULT_CHUNK_SECONDS
+                if chunk_seconds <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                yield self.create_text_message(f"Invalid chunk length: {chunk_seconds}. Using {DEFAULT_CHUNK_SECONDS:.0f} seconds instead.")
+                chunk_seconds = DEFAULT_CHUNK_SECONDS
+            yield from self._invoke_asr(video_file, audio_format, asr_mode, chunk_seconds, metrics)
+            return
+        elif asr_mode != 'off':
+            yield self.create_text_message(f"Invalid ASR mode: {asr_mode}. Extracting a single audio file instead.")
         try:
             # 设置临时文件
             video_file_extension = video_file.extension if video_file.extension else '.mp4'
@@ -48,85 +113,307 @@ class ExtractAudioTool(Tool):
                 'flac': 'audio/flac'
             }
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=video_file_extension) as in_temp_file:
-                in_temp_file.write(video_file.blob)
-                in_temp_path = in_temp_file.name
+            rss_tracker = PeakRSSTracker()
 
-            out_temp_path = os.path.join(tempfile.gettempdir(), f"audio_{int(time.time())}.{audio_format}")
+            # 每次调用使用独立的工作区，并发请求的临时文件互不冲突
+            workspace = workspace_manager.job(video_file.size)
+            out_temp_path = workspace.file(f"output.{audio_format}")
 
             try:
+                # 将上传的视频流式写入临时文件
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, video_file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+                in_temp_path = input_media.path
+
+                # 相同内容与参数直接返回缓存结果
+                cache_params = {"filename": video_file.filename, "audio_format": audio_format, "audio_attrs": audio_options}
+                if loudness != LOUDNESS_OFF:
+                    cache_params["loudness"] = loudness
+                if loudness == LOUDNESS_NORMALIZE:
+                    cache_params["target_lufs"] = target_lufs
+                cache_key = result_cache.make_key("extract_audio", input_media.content_hash, cache_params)
+                cached = result_cache.get(cache_key)
+                if cached:
+                    yield from replay(self, cached, result_cache.stats(hit=True), metrics)
+                    return
+
+                # 根据探测结果选择代价最小的处理路径
+                with metrics.stage("probe") as stage:
+                    probe = probe_service.probe(in_temp_path, input_media.content_hash, stage=stage)
+                decision = decide_extract_audio(
+                    probe, audio_format, bool(audio_options), normalize=loudness == LOUDNESS_NORMALIZE
+                )
+
+                # 相同内容的响度只测量一次，之后的分析与归一化直接使用索引中的记录
+                measurement = None
+                measurement_cached = False
+                if loudness != LOUDNESS_OFF and probe.streams('audio'):
+                    stored = probe_service.loudness(input_media.content_hash)
+                    if stored is not None:
+                        measurement = LoudnessMeasurement(**stored)
+                        measurement_cached = True
+                # 没有记录时，分析在提取的同一次解码中完成；归一化需要先单独测量一遍
+                analyze_inline = loudness == LOUDNESS_ANALYZE and measurement is None and bool(probe.streams('audio'))
+                measure_first = loudness == LOUDNESS_NORMALIZE and measurement is None and bool(probe.streams('audio'))
+                progress.total_seconds = probe.duration * (2 if measure_first else 1)
+                analysis_path = workspace.file("silence.txt")
+
                 # 执行提取
                 yield self.create_text_message(f"Extracting audio from video to {audio_format} format...")
-                if audio_attrs.strip():  # 有内容才解析
-                    audio_args_str = "{" + audio_attrs + "}"
-                    output_args = ast.literal_eval(audio_args_str)
+                ticket = None
+                if measure_first or (analyze_inline and decision.path == PATH_PASSTHROUGH):
+                    # 单独的测量只解码音频，不写出任何文件
+                    with metrics.stage("analyze", bytes_in=input_media.size) as stage:
+                        measurement, ticket = yield from progress.drive(
+                            self, "Measuring loudness",
+                            lambda: self._measure(in_temp_path, analysis_path, probe.duration, stage)
+                        )
+                    probe_service.store_loudness(input_media.content_hash, measurement.to_dict())
+                    analyze_inline = False
+
+                normalized = False
+                if loudness == LOUDNESS_NORMALIZE and measurement is not None and not measurement.silent:
+                    # 线性归一化在用户滤镜之前，测量值对应的是未经处理的源音频；loudnorm内部以192kHz处理，输出恢复源采样率
+                    user_filters = audio_options.get('af')
+                    audio_options = {
+                        **audio_options,
+                        'af': loudnorm_filter(measurement, target_lufs) + (f",{user_filters}" if user_filters else "")
+                    }
+                    audio_options.setdefault('ar', int(probe.streams('audio')[0].get('sample_rate') or 48000))
+                    normalized = True
+
+                if decision.path == PATH_PASSTHROUGH:
+                    # 输入已经是目标格式的音频文件，直接作为输出返回
+                    os.replace(in_temp_path, out_temp_path)
                 else:
-                    output_args = {}
-                # 添加 codec（也可以写进 audio_attrs 中）
-                output_args['acodec'] = self._get_codec_for_format(audio_format)
-                # 使用ffmpeg-python库提取音频
-                (
-                    ffmpeg
-                    .input(in_temp_path)
-                    .output(out_temp_path, **output_args)
-                    .run(capture_stdout=True, capture_stderr=True, overwrite_output=True)
-                )
+                    # 直接复制失败时自动改用可用的编码器转码，无需用户重试
+                    attempts = [decision]
+                    if decision.path == PATH_STREAM_COPY:
+                        attempts.append(Decision(PATH_TRANSCODE, "stream copy failed; audio re-encoded"))
+                    with metrics.stage("extract", bytes_in=input_media.size) as stage:
+                        decision, ticket, stderr = yield from progress.drive(
+                            self, "Extracting audio",
+                            lambda: self._extract(
+                                in_temp_path, out_temp_path, attempts, audio_format, audio_options, probe.duration, stage,
+                                analysis_path if analyze_inline else None
+                            )
+                        )
+                        stage.bytes_out = os.path.getsize(out_temp_path)
+                    if analyze_inline:
+                        measurement = parse_analysis(stderr, analysis_path, probe.duration)
+                        probe_service.store_loudness(input_media.content_hash, measurement.to_dict())
 
-                # 读取输出文件
-                with open(out_temp_path, 'rb') as out_file:
-                    audio_data = out_file.read()
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
 
                 # 计算音频文件大小
                 audio_size = os.path.getsize(out_temp_path)
 
-                # 创建结果消息
-                yield self.create_blob_message(
-                    audio_data,
-                    meta={
-                        "filename": output_filename,
-                        "mime_type": mime_types.get(audio_format, f"audio/{audio_format}"),
-                    }
-                )
-
-                yield self.create_json_message({
+                blob_meta = {
+                    "filename": output_filename,
+                    "mime_type": mime_types.get(audio_format, f"audio/{audio_format}"),
+                }
+                result = {
                     "status": "success",
                     "message": f"Successfully extracted audio from video to {audio_format} format",
                     "original_filename": video_file.filename,
                     "audio_filename": output_filename,
                     "audio_format": audio_format,
-                    "audio_size": audio_size
-                })
+                    "audio_size": audio_size,
+                    "decision": decision.to_dict(),
+                    "loudness": None
+                }
+                if loudness != LOUDNESS_OFF:
+                    result["loudness"] = {
+                        "mode": loudness,
+                        "measurement": measurement.to_dict() if measurement else None,
+                        "cached": measurement_cached,
+                        "target_lufs": target_lufs if loudness == LOUDNESS_NORMALIZE else None,
+                        "normalized": normalized
+                    }
 
                 # 生成人类可读的摘要
                 summary = f"Successfully extracted audio from {video_file.filename}\n\n"
                 summary += f"Audio Format: {audio_format}\n"
                 summary += f"Output File: {output_filename}\n"
                 summary += f"Audio Size: {audio_size / (1024 * 1024):.2f} MB"
+                if measurement is not None and not measurement.silent:
+                    summary += (
+                        f"\nLoudness: {measurement.integrated_lufs:g} LUFS, true peak {measurement.true_peak_dbtp:g} dBTP, "
+                        f"{measurement.silence_ratio:.0%} silence"
+                    )
+                    if normalized:
+                        summary += f" (normalized to {target_lufs:g} LUFS)"
+
+                result_cache.put(cache_key, {
+                    "json": result, "text": summary, "blob_meta": blob_meta,
+                    "invocation_keys": ["memory", "workspace", "scheduler"]
+                }, out_temp_path)
+
+                # 创建结果消息
+                with metrics.stage("emit") as stage:
+                    stage.bytes_out = audio_size
+                    yield from stream_blob(out_temp_path, blob_meta)
+
+                yield self.create_json_message({
+                    **result,
+                    "cache": result_cache.stats(hit=False),
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "scheduler": ticket.to_dict() if ticket else None,
+                    "metrics": metrics.emit("success")
+                })
 
                 yield self.create_text_message(summary)
 
+            except DeadlineExceeded as e:
+                # 超时或调用方放弃请求，可能附带ffmpeg已写完的部分输出
+                blob_meta = {"filename": output_filename, "mime_type": mime_types.get(audio_format, f"audio/{audio_format}")}
+                yield from timeout_messages(self, e, metrics, out_temp_path, blob_meta)
+
             finally:
                 # 清理临时文件
-                if os.path.exists(in_temp_path):
-                    os.unlink(in_temp_path)
-                if os.path.exists(out_temp_path):
-                    os.unlink(out_temp_path)
+                workspace.release()
 
         except Exception as e:
             error_msg = f"Error extracting audio: {str(e)}"
             yield self.create_text_message(error_msg)
             yield self.create_json_message({
                 "status": "error",
-                "message": error_msg
+                "message": error_msg,
+                "metrics": metrics.emit("error")
             })
 
+    def _invoke_asr(self, video_file, audio_format: str, asr_mode: str, chunk_seconds: float,
+                    metrics: InvocationMetrics) -> Generator[ToolInvokeMessage, None, None]:
+        """提取语音识别用的16kHz单声道音频，按固定时长或静音位置切分，每个分块作为单独的文件返回"""
+        progress = metrics.progress
+        try:
+            video_file_extension = video_file.extension if video_file.extension else '.mp4'
+            orig_filename = os.path.splitext(video_file.filename)[0]
+            mime_type = 'audio/wav' if audio_format == 'wav' else 'audio/flac'
+
+            rss_tracker = PeakRSSTracker()
+            workspace = workspace_manager.job(video_file.size)
+
+            try:
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, video_file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+
+                with metrics.stage("probe") as stage:
+                    probe = probe_service.probe(input_media.path, input_media.content_hash, stage=stage)
+                if not probe.streams('audio'):
+                    raise ValueError("No audio stream found in the input file")
+                # 静音模式先完整解码一次，再切分一次
+                progress.total_seconds = probe.duration * (2 if asr_mode == MODE_SILENCE else 1)
+
+                yield self.create_text_message(
+                    f"Extracting 16 kHz mono {audio_format} chunks of up to {chunk_seconds:g} seconds ({asr_mode} split)..."
+                )
+                work_dir = workspace.mkdtemp("asr_")
+                with metrics.stage("extract", bytes_in=input_media.size) as stage:
+                    chunks, ticket = yield from progress.drive(
+                        self, "Extracting audio",
+                        lambda: extract_asr_chunks(
+                            input_media.path, work_dir, audio_format, asr_mode, chunk_seconds, probe.duration, stage
+                        )
+                    )
+                    stage.bytes_out = sum(os.path.getsize(chunk.path) for chunk in chunks)
+
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
+
+                chunk_results = []
+                for chunk in chunks:
+                    filename = f"{orig_filename}_{chunk.index:04d}.{audio_format}"
+                    with metrics.stage("emit") as stage:
+                        stage.bytes_out = os.path.getsize(chunk.path)
+                        yield from stream_blob(chunk.path, {"filename": filename, "mime_type": mime_type})
+                    chunk_results.append(chunk.to_dict(filename))
+                    # 分块返回后立即删除，工作区占用不随分块数累积
+                    os.remove(chunk.path)
+
+                yield self.create_json_message({
+                    "status": "success",
+                    "message": f"Successfully extracted {len(chunks)} audio chunks for speech recognition",
+                    "original_filename": video_file.filename,
+                    "audio_format": audio_format,
+                    "asr": {
+                        "mode": asr_mode,
+                        "chunk_seconds": chunk_seconds,
+                        "sample_rate": ASR_SAMPLE_RATE,
+                        "channels": ASR_CHANNELS
+                    },
+                    "chunks": chunk_results,
+                    "total_duration": probe.duration,
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "scheduler": ticket.to_dict(),
+                    "metrics": metrics.emit("success")
+                })
+
+                yield self.create_text_message(
+                    f"Successfully extracted {len(chunks)} audio chunks from {video_file.filename}\n\n"
+                    f"Audio Format: {audio_format} ({ASR_SAMPLE_RATE} Hz, mono)\n"
+                    f"Split: {asr_mode}, up to {chunk_seconds:g} seconds per chunk"
+                )
+
+            except DeadlineExceeded as e:
+                # 分块由同一个ffmpeg进程输出，超时时不返回部分结果
+                yield from timeout_messages(self, e, metrics)
+
+            finally:
+                # 清理临时文件
+                workspace.release()
+
+        except Exception as e:
+            error_msg = f"Error extracting audio: {str(e)}"
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "status": "error",
+                "message": error_msg,
+                "metrics": metrics.emit("error")
+            })
+
+    def _extract(self, in_path: str, out_path: str, attempts: list[Decision], audio_format: str,
+                 audio_options: dict[str, Any], duration: float, stage: Stage, analysis_path: Optional[str] = None):
+        """依次尝试各处理路径，返回成功的路径、调度信息与ffmpeg错误输出的末尾；指定analysis_path时同时测量响度"""
+        for i, attempt in enumerate(attempts):
+            if attempt.path == PATH_STREAM_COPY:
+                # 源音频编码与目标格式一致，直接复制音频流
+                output_args = dict(attempt.output_args)
+            else:
+                # 已校验的音频属性，编码器由目标格式决定
+                output_args = dict(audio_options)
+                output_args['acodec'] = self._get_codec_for_format(audio_format)
+            try:
+                with scheduler.job(PRIORITY_COPY if attempt.path == PATH_STREAM_COPY else PRIORITY_AUDIO) as ticket:
+                    output_args.setdefault('threads', ticket.threads)
+                    command = Command().input(in_path).output(out_path, **output_args)
+                    if analysis_path is not None:
+                        add_analysis(command, analysis_path)
+                    stderr = stage.run(command, expected_seconds=duration)
+                return attempt, ticket, stderr
+            except FFmpegError:
+                if i == len(attempts) - 1:
+                    raise
+                stage.progress.reset()
+
+    def _measure(self, in_path: str, analysis_path: str, duration: float, stage: Stage):
+        """只解码音频并测量响度，返回测量结果与调度信息"""
+        with scheduler.job(PRIORITY_AUDIO) as ticket:
+            command = Command().input(in_path)
+            add_analysis(command, analysis_path)
+            stderr = stage.run(command, expected_seconds=duration)
+        return parse_analysis(stderr, analysis_path, duration), ticket
+
     def _get_codec_for_format(self, audio_format):
-        """根据音频格式返回适当的编解码器"""
-        codecs = {
-            'mp3': 'libmp3lame',
-            'aac': 'aac',
-            'wav': 'pcm_s16le',
-            'ogg': 'libvorbis',
-            'flac': 'flac'
-        }
-        return codecs.get(audio_format, 'copy')
+        """根据音频格式返回当前FFmpeg构建中可用的编码器"""
+        encoder = capability_cache.get().pick_encoder(AUDIO_FORMAT_ENCODERS.get(audio_format, []))
+        if encoder is None:
+            raise CapabilityError(f"No available {audio_format} encoder in this FFmpeg build")
+        return encoder
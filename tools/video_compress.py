@@ -4,16 +4,58 @@ import tempfile
 import os
 import time
 import json
+import shutil
 import subprocess
-import ffmpeg
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.cache import replay, result_cache
+from utils.capabilities import VIDEO_ENCODERS_BY_FORMAT, CapabilityError, capability_cache
+from utils.chunked_encode import CHUNKABLE_EXTENSIONS, encode_chunked, plan_chunks
+from utils.command import Command
+from utils.deadline import Deadline, DeadlineExceeded, timeout_messages
+from utils.decision import PATH_PASSTHROUGH, PATH_TRANSCODE, Decision, decide_compress
+from utils.media_io import PeakRSSTracker, spool_input, stream_blob
+from utils.metrics import InvocationMetrics, Stage
+from utils.probe import ProbeError, probe_service
+from utils.progress import ProgressTracker
+from utils.scene_index import allocate_bitrates, build_scene_index, cached_scene_index
+from utils.scheduler import PRIORITY_ENCODE, scheduler
+from utils.workspace import workspace_manager
+
+# 两遍编码时使用的视频编码器，两遍必须使用同一编码器，未列出的容器使用libx264
+TWO_PASS_ENCODERS = {'.webm': 'libvpx-vp9'}
+
+# 按目标大小压缩时的音频码率上限（bit/s），源音频码率更低时沿用源码率
+TARGET_AUDIO_BITRATE = 128000
+
+# 视频码率下限（bit/s），低于此值画面已无法辨认
+MIN_VIDEO_BITRATE = 50000
+
+# 为容器开销预留的比例
+CONTAINER_OVERHEAD = 0.02
+
+# 容器为每个包记录的索引大小（MP4的stsz、stts等表）与文件头，短视频目标很小时超过按比例预留的开销
+MUX_BYTES_PER_PACKET = 16
+MUX_HEADER_BYTES = 4096
+
+# 按复杂度分配码率时实际使用的比例：各分块只编码一遍，短分块的单遍码率控制容易超出设定值
+ALLOCATED_HEADROOM = 0.92
+
+# 估算模式下抽样编码的片段数与每段时长（秒）
+ESTIMATE_SAMPLES = 5
+ESTIMATE_SAMPLE_SECONDS = 4.0
+
 class VideoCompressTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         video_file = tool_parameters.get('video')
         compression_level = tool_parameters.get('compression_level', 'medium').lower()
+        encode_mode = (tool_parameters.get('encode_mode') or 'single').lower()
+        workers = tool_parameters.get('workers')
+        target_size_mb = tool_parameters.get('target_size_mb')
+        estimate = bool(tool_parameters.get('estimate', False))
+        use_scene_index = bool(tool_parameters.get('scene_index', False))
         
         # 验证输入
         if not video_file:
@@ -30,6 +72,36 @@ class VideoCompressTool(Tool):
             yield self.create_text_message(f"Invalid compression level: {compression_level}. Using 'medium' instead.")
             compression_level = 'medium'
         
+        # 验证编码模式
+        if encode_mode not in ['single', 'chunked']:
+            yield self.create_text_message(f"Invalid encode mode: {encode_mode}. Using 'single' instead.")
+            encode_mode = 'single'
+        
+        try:
+            workers = int(workers) if workers else scheduler.max_concurrency
+        except (TypeError, ValueError):
+            yield self.create_text_message(f"Invalid workers value: {workers}. Using {scheduler.max_concurrency} instead.")
+            workers = scheduler.max_concurrency
+        workers = max(1, min(workers, 16))
+        
+        # 验证目标大小
+        if target_size_mb:
+            try:
+                target_size_mb = float(target_size_mb)
+                if target_size_mb <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                yield self.create_text_message(f"Invalid target size: {target_size_mb}. It must be a positive number of MB.")
+                yield self.create_json_message({
+                    "status": "error",
+                    "message": f"Invalid target size: {target_size_mb}"
+                })
+                return
+        else:
+            target_size_mb = None
+        
+        progress = ProgressTracker(deadline=Deadline())
+        metrics = InvocationMetrics("video_compress", progress)
         try:
             # 设置临时文件
             file_extension = video_file.extension if video_file.extension else '.mp4'
@@ -52,18 +124,45 @@ class VideoCompressTool(Tool):
                 '3gp': 'video/3gpp'
             }
             
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as in_temp_file:
-                in_temp_file.write(video_file.blob)
-                in_temp_path = in_temp_file.name
-                
-            out_temp_path = os.path.join(tempfile.gettempdir(), f"compressed_{int(time.time())}{file_extension}")
+            rss_tracker = PeakRSSTracker()
+            
+            # 每次调用使用独立的工作区，并发请求的临时文件互不冲突
+            workspace = workspace_manager.job(video_file.size)
+            out_temp_path = workspace.file(f"output{file_extension}")
             
             try:
+                # 将上传的视频流式写入临时文件
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+                in_temp_path = input_media.path
+                
+                # 相同内容与参数直接返回缓存结果
+                cache_key = result_cache.make_key(
+                    "video_compress",
+                    input_media.content_hash,
+                    {
+                        "filename": video_file.filename,
+                        "compression_level": compression_level,
+                        "encode_mode": encode_mode,
+                        "workers": workers if encode_mode == 'chunked' else None,
+                        "target_size_mb": target_size_mb,
+                        "estimate": estimate,
+                        "scene_index": use_scene_index if encode_mode == 'chunked' else False
+                    }
+                )
+                cached = result_cache.get(cache_key)
+                if cached:
+                    yield from replay(self, cached, result_cache.stats(hit=True), metrics)
+                    return
+                
                 # 获取原始视频信息
-                probe = ffmpeg.probe(in_temp_path)
+                with metrics.stage("probe") as stage:
+                    probe = probe_service.probe(in_temp_path, input_media.content_hash, stage=stage)
                 
                 # 获取原始文件大小
-                original_size = os.path.getsize(in_temp_path)
+                original_size = input_media.size
                 
                 # 根据压缩级别设置参数
                 if compression_level == 'low':
@@ -76,35 +175,207 @@ class VideoCompressTool(Tool):
                     crf = 32
                     preset = 'faster'
                 
+                # 输入已经满足要求时原样返回，避免无效的重编码
+                target_size = int(target_size_mb * 1024 * 1024) if target_size_mb is not None else None
+                decision = decide_compress(probe, crf, original_size, target_size)
+                
+                # 指定目标大小时根据时长计算码率，改用两遍编码
+                video_args = {'crf': crf, 'preset': preset}
+                rate_control = 'crf'
+                video_bitrate = None
+                if target_size_mb is not None:
+                    if decision.path == PATH_TRANSCODE:
+                        # 只在需要重编码时计算码率，已小于目标大小的输入即使目标码率过低也可以原样返回
+                        video_bitrate = self._target_video_bitrate(target_size_mb, probe)
+                        video_args = {
+                            'c:v': self._two_pass_encoder(file_extension),
+                            'b:v': video_bitrate,
+                            # 限制峰值码率，避免简单画面下平均码率超出目标
+                            'maxrate': video_bitrate,
+                            'bufsize': video_bitrate * 2,
+                            'preset': preset
+                        }
+                    audio_bitrate = self._target_audio_bitrate(probe)
+                    rate_control = 'two_pass'
+                    if encode_mode == 'chunked' and use_scene_index:
+                        # 场景索引提供各块的复杂度，代替两遍编码的第一遍，各分块按分配的码率编码
+                        rate_control = 'allocated'
+                    else:
+                        # 两遍编码的第一遍需要统计整个文件，不能分块
+                        encode_mode = 'single'
+                if decision.path == PATH_PASSTHROUGH:
+                    # 原样返回的输入不经过任何码率控制
+                    rate_control = 'none'
+                
+                # 估算模式只抽样编码几个片段，预测输出大小后直接返回
+                if estimate:
+                    yield self.create_text_message("Estimating compressed size from sampled slices...")
+                    def estimate_size():
+                        with scheduler.job(PRIORITY_ENCODE) as ticket:
+                            return self._estimate_size(
+                                in_temp_path, file_extension, probe, video_args, ticket.threads, stage
+                            ), ticket
+                    
+                    if decision.path == PATH_PASSTHROUGH:
+                        # 实际压缩时会原样返回输入，无需抽样
+                        (estimated_size, sampled_seconds), ticket = (original_size, 0.0), None
+                    else:
+                        with metrics.stage("estimate", bytes_in=original_size) as stage:
+                            (estimated_size, sampled_seconds), ticket = yield from progress.drive(
+                                self, "Estimating", estimate_size
+                            )
+                    
+                    estimated_reduction = ((original_size - estimated_size) / original_size) * 100
+                    result = {
+                        "status": "success",
+                        "message": "Estimated compressed size from sampled slices",
+                        "original_filename": video_file.filename,
+                        "original_size": original_size,
+                        "estimated_size": estimated_size,
+                        "estimated_size_reduction_percent": estimated_reduction,
+                        "sampled_seconds": sampled_seconds,
+                        "compression_level": compression_level,
+                        "rate_control": rate_control,
+                        "target_size_mb": target_size_mb,
+                        "video_bitrate": video_bitrate,
+                        "decision": decision.to_dict()
+                    }
+                    summary = f"Estimated compressed size for {video_file.filename}\n\n"
+                    summary += f"Original Size: {original_size / (1024*1024):.2f} MB\n"
+                    summary += f"Estimated Size: {estimated_size / (1024*1024):.2f} MB\n"
+                    summary += f"Estimated Size Reduction: {estimated_reduction:.2f}%\n"
+                    summary += f"Sampled: {sampled_seconds:.1f} of {probe.duration:.1f} seconds"
+                    
+                    result_cache.put(cache_key, {
+                        "json": result, "text": summary, "invocation_keys": ["memory", "workspace", "scheduler"]
+                    })
+                    
+                    yield self.create_json_message({
+                        **result,
+                        "cache": result_cache.stats(hit=False),
+                        "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                        "workspace": workspace.to_dict(),
+                        "scheduler": ticket.to_dict() if ticket else None,
+                        "metrics": metrics.emit("success")
+                    })
+                    yield self.create_text_message(summary)
+                    return
+                
+                # 分块模式在关键帧处切分，分块数不足或容器不支持拼接时退回单次编码
+                chunks = []
+                index = None
+                if encode_mode == 'chunked':
+                    if (decision.path == PATH_TRANSCODE and probe.streams('video')
+                            and file_extension.lower() in CHUNKABLE_EXTENSIONS):
+                        try:
+                            if use_scene_index:
+                                # 场景索引按内容哈希只分析一次，同时提供关键帧位置
+                                index = cached_scene_index(input_media.content_hash)
+                                index_cached = index is not None
+                                if index is None:
+                                    progress.total_seconds = probe.duration
+                                    with metrics.stage("scenes", bytes_in=original_size) as stage:
+                                        index = yield from progress.drive(
+                                            self, "Indexing scenes",
+                                            lambda: build_scene_index(
+                                                in_temp_path, input_media.content_hash, probe.duration, stage
+                                            )
+                                        )
+                                    progress.reset()
+                                chunks = plan_chunks(index.keyframes(), probe.duration, workers, index.scene_cuts)
+                            else:
+                                with metrics.stage("keyframes") as stage:
+                                    keyframes = probe_service.keyframes(in_temp_path, input_media.content_hash, stage=stage)
+                                chunks = plan_chunks(keyframes, probe.duration, workers)
+                        except ProbeError:
+                            chunks = []
+                    if not chunks:
+                        encode_mode = 'single'
+                if chunks and index is not None:
+                    for chunk in chunks:
+                        chunk.complexity = index.complexity(chunk.start, chunk.end)
+                    if rate_control == 'allocated':
+                        bitrates = allocate_bitrates(
+                            index, [(chunk.start, chunk.end) for chunk in chunks], int(video_bitrate * ALLOCATED_HEADROOM)
+                        )
+                        for chunk, bitrate in zip(chunks, bitrates):
+                            chunk.bitrate = bitrate
+                elif rate_control == 'allocated':
+                    # 无法分块时改用单次的两遍编码
+                    rate_control = 'two_pass'
+                
                 # 执行压缩
                 yield self.create_text_message(f"Compressing video with {compression_level} compression level...")
                 
-                # 使用ffmpeg-python库进行压缩
-                (
-                    ffmpeg
-                    .input(in_temp_path)
-                    .output(out_temp_path, crf=crf, preset=preset)
-                    .run(capture_stdout=True, capture_stderr=True, overwrite_output=True)
-                )
+                def encode():
+                    with scheduler.job(PRIORITY_ENCODE) as ticket:
+                        if rate_control == 'two_pass':
+                            self._two_pass_encode(
+                                in_temp_path, out_temp_path, video_args, audio_bitrate, probe.duration,
+                                ticket.threads, stage
+                            )
+                        else:
+                            stage.run(
+                                Command()
+                                .input(in_temp_path)
+                                .output(out_temp_path, crf=crf, preset=preset, threads=ticket.threads),
+                                expected_seconds=probe.duration
+                            )
+                    return ticket
+                
+                started = time.monotonic()
+                ticket = None
+                allocated_size = None
+                if decision.path == PATH_PASSTHROUGH:
+                    os.replace(in_temp_path, out_temp_path)
+                elif encode_mode == 'chunked':
+                    # 各分块合计输出一遍完整时长，最终拼接再输出一遍
+                    progress.total_seconds = probe.duration * 2
+                    ticket = yield from progress.drive(
+                        self, "Compressing",
+                        lambda: encode_chunked(
+                            in_temp_path, out_temp_path, chunks, video_args,
+                            has_audio=bool(probe.streams('audio')), workers=workers, metrics=metrics,
+                            audio_args={'b:a': audio_bitrate or TARGET_AUDIO_BITRATE} if rate_control == 'allocated' else None
+                        )
+                    )
+                else:
+                    progress.total_seconds = probe.duration * (2 if rate_control == 'two_pass' else 1)
+                    with metrics.stage("encode", bytes_in=original_size) as stage:
+                        ticket = yield from progress.drive(self, "Compressing", encode)
+                
+                # 各分块只编码一遍，超出目标大小时改用两遍编码重新压缩整个文件，保证不超过目标
+                if rate_control == 'allocated' and os.path.getsize(out_temp_path) > target_size:
+                    allocated_size = os.path.getsize(out_temp_path)
+                    yield self.create_text_message("Allocated chunks exceeded the target size, re-encoding with two passes...")
+                    rate_control = 'two_pass'
+                    encode_mode = 'single'
+                    progress.reset()
+                    progress.total_seconds = probe.duration * 2
+                    with metrics.stage("encode", bytes_in=original_size) as stage:
+                        ticket = yield from progress.drive(self, "Compressing", encode)
+                encode_seconds = time.monotonic() - started
                 
                 # 获取压缩后文件大小
                 compressed_size = os.path.getsize(out_temp_path)
-                reduction_percent = ((original_size - compressed_size) / original_size) * 100
                 
-                # 读取输出文件
-                with open(out_temp_path, 'rb') as out_file:
-                    compressed_data = out_file.read()
+                # 重编码结果没有变小时返回原文件
+                if compressed_size >= original_size and decision.path == PATH_TRANSCODE:
+                    os.replace(in_temp_path, out_temp_path)
+                    compressed_size = original_size
+                    decision = Decision(PATH_PASSTHROUGH, "re-encoded output was not smaller than the input")
+                    rate_control = 'none'
                 
-                # 创建结果消息
-                yield self.create_blob_message(
-                    compressed_data,
-                    meta={
-                        "filename": output_filename,
-                        "mime_type": mime_types.get(format_type, f"video/{format_type}"),
-                    }
-                )
+                reduction_percent = ((original_size - compressed_size) / original_size) * 100
                 
-                yield self.create_json_message({
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
+                
+                blob_meta = {
+                    "filename": output_filename,
+                    "mime_type": mime_types.get(format_type, f"video/{format_type}"),
+                }
+                result = {
                     "status": "success",
                     "message": f"Successfully compressed video with {compression_level} compression level",
                     "original_filename": video_file.filename,
@@ -112,8 +383,22 @@ class VideoCompressTool(Tool):
                     "original_size": original_size,
                     "compressed_size": compressed_size,
                     "size_reduction_percent": reduction_percent,
-                    "compression_level": compression_level
-                })
+                    "compression_level": compression_level,
+                    "encode_mode": encode_mode,
+                    "rate_control": rate_control,
+                    "decision": decision.to_dict()
+                }
+                if target_size_mb is not None:
+                    result["target_size_mb"] = target_size_mb
+                if rate_control in ('two_pass', 'allocated'):
+                    result["video_bitrate"] = video_bitrate
+                if allocated_size is not None:
+                    result["allocated_size"] = allocated_size
+                if encode_mode == 'chunked':
+                    result["chunks"] = [chunk.to_dict() for chunk in chunks]
+                    result["workers"] = workers
+                if index is not None:
+                    result["scene_index"] = index.summary(index_cached)
                 
                 # 生成人类可读的摘要
                 summary = f"Successfully compressed {video_file.filename}\n\n"
@@ -121,20 +406,175 @@ class VideoCompressTool(Tool):
                 summary += f"Compressed Size: {compressed_size / (1024*1024):.2f} MB\n"
                 summary += f"Size Reduction: {reduction_percent:.2f}%\n"
                 summary += f"Compression Level: {compression_level}"
+                if target_size_mb is not None:
+                    summary += f"\nTarget Size: {target_size_mb:.2f} MB"
+                    if rate_control in ('two_pass', 'allocated'):
+                        summary += f" (video bitrate {video_bitrate // 1000} kbps)"
+                if encode_mode == 'chunked':
+                    summary += f"\nEncode Mode: chunked ({len(chunks)} chunks, {workers} workers)"
+                    if rate_control == 'allocated':
+                        summary += "\nBitrate allocated per chunk by scene complexity"
+                if allocated_size is not None:
+                    summary += f"\nAllocated chunks came out at {allocated_size / (1024*1024):.2f} MB, re-encoded with two passes"
+                
+                result_cache.put(cache_key, {
+                    "json": result, "text": summary, "blob_meta": blob_meta,
+                    "invocation_keys": ["memory", "workspace", "timings", "scheduler"]
+                }, out_temp_path)
+                
+                # 创建结果消息
+                with metrics.stage("emit") as stage:
+                    stage.bytes_out = compressed_size
+                    yield from stream_blob(out_temp_path, blob_meta)
+                
+                yield self.create_json_message({
+                    **result,
+                    "cache": result_cache.stats(hit=False),
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "timings": {"encode": round(encode_seconds, 4)},
+                    "scheduler": ticket.to_dict() if ticket else None,
+                    "metrics": metrics.emit("success")
+                })
                 
                 yield self.create_text_message(summary)
                 
+            except DeadlineExceeded as e:
+                # 超时或调用方放弃请求，可能附带ffmpeg已写完的部分输出
+                blob_meta = {"filename": output_filename, "mime_type": mime_types.get(format_type, f"video/{format_type}")}
+                yield from timeout_messages(self, e, metrics, out_temp_path, blob_meta)
+            
             finally:
                 # 清理临时文件
-                if os.path.exists(in_temp_path):
-                    os.unlink(in_temp_path)
-                if os.path.exists(out_temp_path):
-                    os.unlink(out_temp_path)
+                workspace.release()
                     
         except Exception as e:
             error_msg = f"Error compressing video: {str(e)}"
             yield self.create_text_message(error_msg)
             yield self.create_json_message({
                 "status": "error",
-                "message": error_msg
-            })
\ No newline at end of file
+                "message": error_msg,
+                "metrics": metrics.emit("error")
+            })
+    
+    def _two_pass_encoder(self, file_extension: str) -> str:
+        """两遍编码使用的编码器，首选编码器不可用时改用容器兼容的其他编码器"""
+        candidates = [TWO_PASS_ENCODERS.get(file_extension.lower(), 'libx264')]
+        candidates += VIDEO_ENCODERS_BY_FORMAT.get(file_extension.lower().lstrip('.'), [])
+        encoder = capability_cache.get().pick_encoder(candidates)
+        if encoder is None:
+            raise CapabilityError(f"No available video encoder for {file_extension} in this FFmpeg build")
+        return encoder
+    
+    def _target_audio_bitrate(self, probe) -> int:
+        """按目标大小压缩时的音频码率（bit/s），没有音频时为0"""
+        audio_streams = probe.streams('audio')
+        if not audio_streams:
+            return 0
+        source_bitrate = int(audio_streams[0].get('bit_rate') or TARGET_AUDIO_BITRATE)
+        return min(TARGET_AUDIO_BITRATE, source_bitrate)
+    
+    def _container_overhead(self, target_bytes: float, probe) -> float:
+        """预留的容器开销（字节）：按比例预留与按包数估算中的较大者"""
+        packets = 0.0
+        for stream in probe.streams('video')[:1] + probe.streams('audio')[:1]:
+            if str(stream.get('nb_frames') or '').isdigit():
+                packets += int(stream['nb_frames'])
+            elif stream.get('codec_type') == 'video':
+                num, _, den = (stream.get('avg_frame_rate') or '0/1').partition('/')
+                try:
+                    packets += probe.duration * float(num) / float(den or 1)
+                except (ValueError, ZeroDivisionError):
+                    pass
+            else:
+                # AAC每帧1024个采样
+                packets += probe.duration * int(stream.get('sample_rate') or 0) / 1024
+        return max(target_bytes * CONTAINER_OVERHEAD, MUX_HEADER_BYTES + packets * MUX_BYTES_PER_PACKET)
+    
+    def _target_video_bitrate(self, target_size_mb: float, probe) -> int:
+        """根据目标大小与时长计算视频码率（bit/s），扣除音频码率与容器开销"""
+        duration = probe.duration
+        if duration <= 0:
+            raise ValueError("Cannot compress to a target size: the video duration is unknown")
+        
+        target_bytes = target_size_mb * 1024 * 1024
+        total_bitrate = (target_bytes - self._container_overhead(target_bytes, probe)) * 8 / duration
+        video_bitrate = int(total_bitrate - self._target_audio_bitrate(probe))
+        if video_bitrate < MIN_VIDEO_BITRATE:
+            raise ValueError(
+                f"Target size {target_size_mb} MB is too small for a {duration:.1f} second video"
+            )
+        return video_bitrate
+    
+    def _two_pass_encode(self, in_path: str, out_path: str, video_args: dict[str, Any], audio_bitrate: int,
+                         duration: float, threads: int, stage: Stage):
+        """两遍编码：第一遍只统计复杂度，第二遍按统计结果分配码率"""
+        work_dir = tempfile.mkdtemp(prefix="two_pass_", dir=os.path.dirname(out_path))
+        try:
+            passlogfile = os.path.join(work_dir, "passlog")
+            # 两遍的帧数必须一致：null与mp4默认的帧率同步方式不同，可能多出重复帧导致第二遍读取统计失败
+            stage.run(
+                Command()
+                .input(in_path)
+                .output(
+                    os.devnull, f='null', an=None, vsync='passthrough', threads=threads, passlogfile=passlogfile,
+                    **{'pass': 1}, **video_args
+                ),
+                expected_seconds=duration
+            )
+            stage.run(
+                Command()
+                .input(in_path)
+                .output(
+                    out_path, vsync='passthrough', threads=threads, passlogfile=passlogfile,
+                    **{'pass': 2, 'b:a': audio_bitrate or TARGET_AUDIO_BITRATE},
+                    **video_args
+                ),
+                expected_seconds=duration
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def _estimate_size(self, in_path: str, file_extension: str, probe, video_args: dict[str, Any],
+                       threads: int, stage: Stage) -> tuple[int, float]:
+        """预测输出大小：CRF模式在全片均匀抽样编码几个短片段并按码率外推，返回预测字节数与抽样总时长"""
+        duration = probe.duration
+        if duration <= 0:
+            raise ValueError("Cannot estimate the compressed size: the video duration is unknown")
+        
+        # 两遍编码能准确达到目标码率，直接按码率计算，无需抽样
+        if 'b:v' in video_args:
+            return int((video_args['b:v'] + self._target_audio_bitrate(probe)) * duration / 8), 0.0
+        
+        # 视频较短时只编码一个覆盖全片的片段
+        sample_seconds = min(ESTIMATE_SAMPLE_SECONDS, duration)
+        count = max(1, min(ESTIMATE_SAMPLES, int(duration // sample_seconds)))
+        step = duration / count
+        
+        if stage.progress is not None:
+            stage.progress.total_seconds = count * sample_seconds
+        
+        work_dir = tempfile.mkdtemp(prefix="estimate_", dir=os.path.dirname(in_path))
+        try:
+            sampled_bytes = 0
+            sampled_seconds = 0.0
+            for i in range(count):
+                sample_path = os.path.join(work_dir, f"sample{i}{file_extension}")
+                # 取每个区间的中间位置，避开片头片尾
+                start = max(0.0, i * step + (step - sample_seconds) / 2)
+                stage.run(
+                    Command()
+                    .input(in_path, ss=start, t=sample_seconds)
+                    .output(sample_path, an=None, threads=threads, **video_args),
+                    expected_seconds=sample_seconds
+                )
+                sampled_bytes += os.path.getsize(sample_path)
+                sampled_seconds += sample_seconds
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        # 音频不参与抽样，音频编码器通常保持与源相近的码率
+        audio_streams = probe.streams('audio')
+        audio_bitrate = int(audio_streams[0].get('bit_rate') or TARGET_AUDIO_BITRATE) if audio_streams else 0
+        estimated = sampled_bytes / sampled_seconds * duration + audio_bitrate * duration / 8
+        return int(estimated), sampled_seconds
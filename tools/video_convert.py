@@ -1,14 +1,24 @@
 from collections.abc import Generator
 from typing import Any
-import tempfile
 import os
 import subprocess
-import time
-import ffmpeg
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.cache import replay, result_cache
+from utils.capabilities import CapabilityError, FORMAT_MUXERS, capability_cache
+from utils.command import Command, FFmpegError
+from utils.deadline import Deadline, DeadlineExceeded, timeout_messages
+from utils.decision import PATH_PASSTHROUGH, PATH_REMUX, PATH_TRANSCODE, Decision, decide_convert
+from utils.media_io import PeakRSSTracker, spool_input, stream_blob
+from utils.metrics import InvocationMetrics, Stage
+from utils.probe import ProbeResult, probe_service
+from utils.progress import ProgressTracker
+from utils.scheduler import PRIORITY_COPY, PRIORITY_ENCODE, scheduler
+from utils.workspace import workspace_manager
+
+
 class VideoConvertTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         video_file = tool_parameters.get('video')
@@ -41,7 +51,13 @@ class VideoConvertTool(Tool):
             })
             return
         
+        progress = ProgressTracker(deadline=Deadline())
+        metrics = InvocationMetrics("video_convert", progress)
         try:
+            # 确认当前FFmpeg构建可以写入目标格式
+            if not capability_cache.get().has_muxer(FORMAT_MUXERS[target_format]):
+                raise CapabilityError(f"This FFmpeg build cannot write {target_format} files")
+            
             # 设置临时文件
             input_file_extension = video_file.extension if video_file.extension else '.mp4'
             output_file_extension = f'.{target_format}'
@@ -63,58 +79,135 @@ class VideoConvertTool(Tool):
                 '3gp': 'video/3gpp'
             }
             
-            with tempfile.NamedTemporaryFile(delete=False, suffix=input_file_extension) as in_temp_file:
-                in_temp_file.write(video_file.blob)
-                in_temp_path = in_temp_file.name
-                
-            out_temp_path = os.path.join(tempfile.gettempdir(), f"out_{int(time.time())}{output_file_extension}")
+            rss_tracker = PeakRSSTracker()
+            
+            # 每次调用使用独立的工作区，并发请求的临时文件互不冲突
+            workspace = workspace_manager.job(video_file.size)
+            out_temp_path = workspace.file(f"output{output_file_extension}")
             
             try:
-                # 执行转换
-                yield self.create_text_message(f"Converting video to {target_format} format...")
+                # 将上传的视频流式写入临时文件
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, input_file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+                in_temp_path = input_media.path
                 
-                # 使用ffmpeg-python库进行转换
-                (
-                    ffmpeg
-                    .input(in_temp_path)
-                    .output(out_temp_path, **{'c:v': 'copy', 'c:a': 'copy'})
-                    .run(capture_stdout=True, capture_stderr=True, overwrite_output=True)
+                # 相同内容与参数直接返回缓存结果
+                cache_key = result_cache.make_key(
+                    "video_convert",
+                    input_media.content_hash,
+                    {"filename": video_file.filename, "target_format": target_format}
                 )
+                cached = result_cache.get(cache_key)
+                if cached:
+                    yield from replay(self, cached, result_cache.stats(hit=True), metrics)
+                    return
                 
-                # 读取输出文件
-                with open(out_temp_path, 'rb') as out_file:
-                    converted_data = out_file.read()
+                # 根据探测结果选择代价最小的处理路径
+                with metrics.stage("probe") as stage:
+                    probe = probe_service.probe(in_temp_path, input_media.content_hash, stage=stage)
+                decision = decide_convert(probe, input_file_extension, target_format)
+                progress.total_seconds = probe.duration
                 
-                # 创建结果消息
-                yield self.create_blob_message(
-                    converted_data,
-                    meta={
-                        "filename": output_filename,
-                        "mime_type": mime_types.get(target_format, f"video/{target_format}"),
-                    }
-                )
+                # 执行转换
+                yield self.create_text_message(f"Converting video to {target_format} format...")
                 
-                yield self.create_json_message({
+                ticket = None
+                output_args = {}
+                if decision.path == PATH_PASSTHROUGH:
+                    # 输入已经是目标格式，直接作为输出返回
+                    os.replace(in_temp_path, out_temp_path)
+                else:
+                    # 流复制失败时（如码流格式与容器不兼容）自动改用可用的编码器重编码，无需用户重试
+                    attempts = [decision]
+                    if 'copy' in decision.output_args.values():
+                        attempts.append(Decision(PATH_TRANSCODE, "stream copy failed; all streams re-encoded"))
+                    with metrics.stage("convert", bytes_in=input_media.size) as stage:
+                        decision, output_args, ticket = yield from progress.drive(
+                            self, "Converting",
+                            lambda: self._convert(in_temp_path, out_temp_path, attempts, target_format, probe, stage)
+                        )
+                        stage.bytes_out = os.path.getsize(out_temp_path)
+                
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
+                
+                blob_meta = {
+                    "filename": output_filename,
+                    "mime_type": mime_types.get(target_format, f"video/{target_format}"),
+                }
+                result = {
                     "status": "success",
                     "message": f"Successfully converted video to {target_format} format",
                     "original_filename": video_file.filename,
                     "converted_filename": output_filename,
-                    "target_format": target_format
+                    "target_format": target_format,
+                    "decision": decision.to_dict(),
+                    "codecs": {key: value for key, value in output_args.items() if key in ('c:v', 'c:a')}
+                }
+                summary = f"Successfully converted {video_file.filename} to {target_format} format."
+                result_cache.put(cache_key, {
+                    "json": result, "text": summary, "blob_meta": blob_meta,
+                    "invocation_keys": ["memory", "workspace", "scheduler"]
+                }, out_temp_path)
+                
+                # 创建结果消息
+                with metrics.stage("emit") as stage:
+                    stage.bytes_out = os.path.getsize(out_temp_path)
+                    yield from stream_blob(out_temp_path, blob_meta)
+                
+                yield self.create_json_message({
+                    **result,
+                    "cache": result_cache.stats(hit=False),
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "scheduler": ticket.to_dict() if ticket else None,
+                    "metrics": metrics.emit("success")
                 })
                 
-                yield self.create_text_message(f"Successfully converted {video_file.filename} to {target_format} format.")
+                yield self.create_text_message(summary)
                 
+            except DeadlineExceeded as e:
+                # 超时或调用方放弃请求，可能附带ffmpeg已写完的部分输出
+                blob_meta = {"filename": output_filename, "mime_type": mime_types.get(target_format, f"video/{target_format}")}
+                yield from timeout_messages(self, e, metrics, out_temp_path, blob_meta)
+            
             finally:
                 # 清理临时文件
-                if os.path.exists(in_temp_path):
-                    os.unlink(in_temp_path)
-                if os.path.exists(out_temp_path):
-                    os.unlink(out_temp_path)
+                workspace.release()
                     
         except Exception as e:
             error_msg = f"Error converting video: {str(e)}"
             yield self.create_text_message(error_msg)
             yield self.create_json_message({
                 "status": "error",
-                "message": error_msg
-            }) 
\ No newline at end of file
+                "message": error_msg,
+                "metrics": metrics.emit("error")
+            }) 
+    
+    def _convert(self, in_path: str, out_path: str, attempts: list[Decision], target_format: str,
+                 probe: ProbeResult, stage: Stage):
+        """依次尝试各处理路径，返回成功的路径、输出参数与调度信息"""
+        for i, attempt in enumerate(attempts):
+            output_args = self._encoder_args(attempt.output_args, target_format, probe)
+            try:
+                with scheduler.job(PRIORITY_COPY if attempt.path == PATH_REMUX else PRIORITY_ENCODE) as ticket:
+                    stage.run(
+                        Command().input(in_path).output(out_path, threads=ticket.threads, **output_args),
+                        expected_seconds=probe.duration
+                    )
+                return attempt, output_args, ticket
+            except FFmpegError:
+                if i == len(attempts) - 1:
+                    raise
+                stage.progress.reset()
+    
+    def _encoder_args(self, output_args: dict[str, Any], target_format: str, probe) -> dict[str, Any]:
+        """为没有直接复制的流选择当前构建中最快的兼容编码器"""
+        capabilities = capability_cache.get()
+        args = dict(output_args)
+        for codec_type in ('video', 'audio'):
+            if probe.streams(codec_type) and f"c:{codec_type[0]}" not in args:
+                args.update(capabilities.transcode_args(target_format, codec_type))
+        return args
\ No newline at end of file
@@ -1,16 +1,19 @@
 from collections.abc import Generator
 from typing import Any
-import tempfile
-import os
-import json
-import subprocess
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.cache import replay, result_cache
+from utils.media_io import PeakRSSTracker, spool_header, spool_input
+from utils.metrics import InvocationMetrics
+from utils.probe import ProbeError, probe_service
+from utils.workspace import workspace_manager
+
 class VideoInfoTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         video_file = tool_parameters.get('video')
+        probe_mode = tool_parameters.get('probe_mode', 'full') or 'full'
         
         if not video_file:
             yield self.create_text_message("No video file provided")
@@ -20,38 +23,47 @@ class VideoInfoTool(Tool):
             })
             return
         
+        metrics = InvocationMetrics("video_info")
         try:
-            # 创建临时文件保存上传的视频
-            file_extension = video_file.extension if video_file.extension else '.mp4'
+            rss_tracker = PeakRSSTracker()
             
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                temp_file.write(video_file.blob)
-                temp_file_path = temp_file.name
+            # 将上传的视频流式写入临时文件，快速模式只写入文件头部
+            file_extension = video_file.extension if video_file.extension else '.mp4'
+            # 只保存输入文件，无需为输出预留空间
+            workspace = workspace_manager.job(video_file.size, factor=1)
             
             try:
-                # 使用ffprobe获取视频信息
-                command = [
-                    'ffprobe', 
-                    '-v', 'quiet',
-                    '-print_format', 'json',
-                    '-show_format',
-                    '-show_streams',
-                    temp_file_path
-                ]
+                with metrics.stage("input") as stage:
+                    if probe_mode == 'fast':
+                        input_media = spool_header(video_file, file_extension, directory=workspace.path)
+                    else:
+                        input_media = spool_input(video_file, file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
                 
-                result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                # 相同内容的视频直接返回缓存结果
+                cache_key = result_cache.make_key(
+                    "video_info", input_media.content_hash, {"filename": video_file.filename}
+                )
+                cached = result_cache.get(cache_key)
+                if cached:
+                    yield from replay(self, cached, result_cache.stats(hit=True), metrics)
+                    return
                 
-                if result.returncode != 0:
-                    error_msg = f"Error analyzing video file: {result.stderr}"
+                # 使用共享的探测服务获取视频信息
+                try:
+                    with metrics.stage("probe") as stage:
+                        probe = probe_service.probe(input_media.path, input_media.content_hash, stage=stage)
+                except ProbeError as e:
+                    error_msg = f"Error analyzing video file: {str(e)}"
                     yield self.create_text_message(error_msg)
                     yield self.create_json_message({
                         "status": "error",
-                        "message": error_msg
+                        "message": error_msg,
+                        "metrics": metrics.emit("error")
                     })
                     return
                 
-                # 解析JSON结果
-                info = json.loads(result.stdout)
+                info = probe.info
                 
                 # 提取关键信息
                 formatted_info = {
@@ -121,19 +133,31 @@ class VideoInfoTool(Tool):
                 else:
                     summary = f"No video streams found in {video_file.filename}"
                 
+                result_cache.put(cache_key, {
+                    "json": formatted_info, "text": summary,
+                    "order": ["text", "json"], "invocation_keys": ["memory", "scheduler", "probe"]
+                })
+                
                 # 返回结果
                 yield self.create_text_message(summary)
-                yield self.create_json_message(formatted_info)
+                yield self.create_json_message({
+                    **formatted_info,
+                    "cache": result_cache.stats(hit=False),
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "scheduler": probe.ticket.to_dict() if probe.ticket else None,
+                    "probe": {"mode": probe_mode, "cached": probe.cached, "complete_input": input_media.complete},
+                    "metrics": metrics.emit("success")
+                })
                 
             finally:
                 # 清理临时文件
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
+                workspace.release()
                     
         except Exception as e:
             error_msg = f"Error processing video file: {str(e)}"
             yield self.create_text_message(error_msg)
             yield self.create_json_message({
                 "status": "error",
-                "message": error_msg
+                "message": error_msg,
+                "metrics": metrics.emit("error")
             }) 
\ No newline at end of file
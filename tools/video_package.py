@@ -0,0 +1,283 @@
+from collections.abc import Generator
+from typing import Any
+import os
+import zipfile
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.capabilities import CapabilityError, capability_cache
+from utils.command import Command, filter_spec
+from utils.deadline import Deadline, DeadlineExceeded, timeout_messages
+from utils.media_io import PeakRSSTracker, spool_input, stream_blob
+from utils.metrics import InvocationMetrics
+from utils.probe import ProbeResult, probe_service
+from utils.progress import ProgressTracker
+from utils.scheduler import PRIORITY_ENCODE, scheduler
+from utils.workspace import workspace_manager
+
+# 码率阶梯：名称 -> (短边像素, 视频码率, 音频码率)
+RENDITIONS = {
+    '1080p': (1080, 5000, 128),
+    '720p': (720, 2800, 128),
+    '480p': (480, 1400, 96),
+    '360p': (360, 800, 96),
+    '240p': (240, 400, 64)
+}
+
+DEFAULT_RENDITIONS = '720p,480p,360p'
+
+DEFAULT_SEGMENT_SECONDS = 4.0
+
+# 峰值码率与缓冲区相对于目标码率的倍数，使各分段码率接近播放列表中声明的带宽
+MAXRATE_FACTOR = 1.07
+BUFSIZE_FACTOR = 1.5
+
+# 各打包格式的入口文件
+ENTRY_FILES = {'hls': 'master.m3u8', 'dash': 'manifest.mpd'}
+
+
+class VideoPackageTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        video_file = tool_parameters.get('video')
+        package_format = (tool_parameters.get('package_format') or 'hls').lower()
+        renditions = tool_parameters.get('renditions') or DEFAULT_RENDITIONS
+        segment_seconds = tool_parameters.get('segment_seconds')
+
+        # 验证输入
+        if not video_file:
+            yield self.create_text_message("No video file provided")
+            yield self.create_json_message({
+                "status": "error",
+                "message": "No video file provided"
+            })
+            return
+
+        if package_format not in ENTRY_FILES:
+            yield self.create_text_message(f"Invalid package format: {package_format}. Using 'hls' instead.")
+            package_format = 'hls'
+
+        names = []
+        for name in renditions.split(','):
+            name = name.strip().lower()
+            if name and name not in names:
+                names.append(name)
+        unknown = [name for name in names if name not in RENDITIONS]
+        if unknown or not names:
+            error_msg = f"Invalid renditions: {renditions}. Supported renditions: {', '.join(RENDITIONS)}"
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "status": "error",
+                "message": error_msg
+            })
+            return
+        # 从高到低排列，播放器按此顺序列出各档
+        names.sort(key=lambda name: RENDITIONS[name][0], reverse=True)
+
+        try:
+            segment_seconds = float(segment_seconds) if segment_seconds else DEFAULT_SEGMENT_SECONDS
+            if not 1 <= segment_seconds <= 30:
+                raise ValueError
+        except (TypeError, ValueError):
+            yield self.create_text_message(
+                f"Invalid segment length: {segment_seconds}. Using {DEFAULT_SEGMENT_SECONDS:.0f} seconds instead."
+            )
+            segment_seconds = DEFAULT_SEGMENT_SECONDS
+
+        progress = ProgressTracker(deadline=Deadline())
+        metrics = InvocationMetrics("video_package", progress)
+        try:
+            file_extension = video_file.extension if video_file.extension else '.mp4'
+            orig_filename = os.path.splitext(video_file.filename)[0]
+            output_filename = f"{orig_filename}_{package_format}.zip"
+
+            capabilities = capability_cache.get()
+            if not capabilities.has_muxer(package_format):
+                raise CapabilityError(f"The installed FFmpeg build cannot write {package_format.upper()} output")
+
+            rss_tracker = PeakRSSTracker()
+            workspace = workspace_manager.job(video_file.size)
+
+            try:
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+
+                with metrics.stage("probe") as stage:
+                    probe = probe_service.probe(input_media.path, input_media.content_hash, stage=stage)
+                if not probe.streams('video'):
+                    raise ValueError("No video stream found in the input file")
+                ladder = self._ladder(probe, names)
+                progress.total_seconds = probe.duration
+
+                package_dir = workspace.mkdtemp("package_")
+                yield self.create_text_message(
+                    f"Packaging {len(ladder)} renditions ({', '.join(r['name'] for r in ladder)}) as {package_format.upper()}..."
+                )
+
+                def package():
+                    with scheduler.job(PRIORITY_ENCODE) as ticket:
+                        stage.run(
+                            self._package_command(
+                                input_media.path, package_dir, package_format, ladder, segment_seconds,
+                                bool(probe.streams('audio')), ticket.threads
+                            ),
+                            expected_seconds=probe.duration
+                        )
+                    return ticket
+
+                with metrics.stage("package", bytes_in=input_media.size) as stage:
+                    ticket = yield from progress.drive(self, "Packaging", package)
+                    files = sorted(
+                        os.path.relpath(os.path.join(dirpath, name), package_dir)
+                        for dirpath, _, filenames in os.walk(package_dir) for name in filenames
+                    )
+                    stage.bytes_out = sum(os.path.getsize(os.path.join(package_dir, name)) for name in files)
+
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
+
+                # 分段已经是压缩过的媒体，打包时只存储不再压缩
+                zip_path = workspace.file(output_filename)
+                with metrics.stage("zip") as stage:
+                    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+                        for name in files:
+                            archive.write(os.path.join(package_dir, name), name)
+                    stage.bytes_out = os.path.getsize(zip_path)
+
+                package_size = os.path.getsize(zip_path)
+                with metrics.stage("emit") as stage:
+                    stage.bytes_out = package_size
+                    yield from stream_blob(zip_path, {"filename": output_filename, "mime_type": "application/zip"})
+
+                segment_count = sum(1 for name in files if not name.endswith(('.m3u8', '.mpd')))
+                yield self.create_json_message({
+                    "status": "success",
+                    "message": f"Successfully packaged {len(ladder)} renditions as {package_format.upper()}",
+                    "original_filename": video_file.filename,
+                    "package_filename": output_filename,
+                    "package_format": package_format,
+                    "entry": ENTRY_FILES[package_format],
+                    "renditions": ladder,
+                    "segment_seconds": segment_seconds,
+                    "files": len(files),
+                    "segments": segment_count,
+                    "package_size": package_size,
+                    # 所有码率档共用一次解码
+                    "decodes": 1,
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "scheduler": ticket.to_dict(),
+                    "metrics": metrics.emit("success")
+                })
+
+                rendition_summary = ', '.join(f"{r['name']} ({r['video_bitrate']})" for r in ladder)
+                yield self.create_text_message(
+                    f"Successfully packaged {video_file.filename} as {package_format.upper()}.\n\n"
+                    f"Renditions: {rendition_summary}\n"
+                    f"Entry: {ENTRY_FILES[package_format]}\n"
+                    f"Package Size: {package_size / (1024 * 1024):.2f} MB"
+                )
+
+            except DeadlineExceeded as e:
+                # 各码率档由同一个ffmpeg进程输出，超时时不返回部分结果
+                yield from timeout_messages(self, e, metrics)
+
+            finally:
+                # 清理临时文件
+                workspace.release()
+
+        except Exception as e:
+            error_msg = f"Error packaging video: {str(e)}"
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "status": "error",
+                "message": error_msg,
+                "metrics": metrics.emit("error")
+            })
+
+    def _ladder(self, probe: ProbeResult, names: list[str]) -> list[dict[str, Any]]:
+        """按源视频的尺寸生成各码率档，不放大超过源分辨率的档位"""
+        video = probe.streams('video')[0]
+        width, height = int(video.get('width') or 0), int(video.get('height') or 0)
+        short_side = min(width, height) if width and height else 0
+
+        fitting = [name for name in names if not short_side or RENDITIONS[name][0] <= short_side]
+        # 源分辨率低于所有请求的档位时，保留最低一档并以源分辨率输出
+        selected = fitting or [names[-1]]
+        ladder = []
+        for name in selected:
+            size, video_kbps, audio_kbps = RENDITIONS[name]
+            if short_side:
+                size = min(size, short_side // 2 * 2)
+            # 竖屏视频按宽度缩放，使短边与档位一致
+            scale = (-2, size) if width >= height else (size, -2)
+            ladder.append({
+                "name": name,
+                "scale": f"{scale[0]}:{scale[1]}",
+                "video_bitrate": f"{video_kbps}k",
+                "audio_bitrate": f"{audio_kbps}k"
+            })
+        return ladder
+
+    def _package_command(self, in_path: str, package_dir: str, package_format: str, ladder: list[dict[str, Any]],
+                         segment_seconds: float, has_audio: bool, threads: int) -> Command:
+        """解码一次，用split滤镜把画面分给各码率档，在同一个ffmpeg进程中并行编码并切片"""
+        capabilities = capability_cache.get()
+        command = Command().input(in_path)
+        streams = [
+            command.chain(branch, filter_spec('scale', *rendition["scale"].split(':')))
+            for branch, rendition in zip(command.split('0:v', len(ladder)), ladder)
+        ]
+
+        output_args: dict[str, Any] = {
+            **capabilities.transcode_args('mp4', 'video'),
+            # 所有档位在相同时间点插入关键帧，分段边界对齐，播放器可以在分段之间切换码率
+            'force_key_frames': f"expr:gte(t,n_forced*{segment_seconds:g})",
+            'threads': threads
+        }
+        for i, rendition in enumerate(ladder):
+            kbps = int(rendition["video_bitrate"].rstrip('k'))
+            output_args[f'b:v:{i}'] = rendition["video_bitrate"]
+            output_args[f'maxrate:v:{i}'] = f"{int(kbps * MAXRATE_FACTOR)}k"
+            output_args[f'bufsize:v:{i}'] = f"{int(kbps * BUFSIZE_FACTOR)}k"
+
+        if has_audio:
+            output_args.update(capabilities.transcode_args('mp4', 'audio'))
+
+        if package_format == 'hls':
+            # HLS的每个码率档都是独立的播放列表，各自带一路音频
+            if has_audio:
+                streams.extend('0:a' for _ in ladder)
+                for i, rendition in enumerate(ladder):
+                    output_args[f'b:a:{i}'] = rendition["audio_bitrate"]
+                stream_map = ' '.join(f"v:{i},a:{i}" for i in range(len(ladder)))
+            else:
+                stream_map = ' '.join(f"v:{i}" for i in range(len(ladder)))
+            output_args.update({
+                'f': 'hls',
+                'hls_time': segment_seconds,
+                'hls_playlist_type': 'vod',
+                'hls_segment_filename': os.path.join(package_dir, 'v%v', 'seg%04d.ts'),
+                'master_pl_name': ENTRY_FILES['hls'],
+                'var_stream_map': stream_map
+            })
+            target = os.path.join(package_dir, 'v%v', 'index.m3u8')
+        else:
+            # DASH的音频是单独的自适应集，所有视频档共用一路音频
+            adaptation_sets = "id=0,streams=v"
+            if has_audio:
+                streams.append('0:a')
+                output_args['b:a'] = ladder[0]["audio_bitrate"]
+                adaptation_sets += " id=1,streams=a"
+            output_args.update({
+                'f': 'dash',
+                'seg_duration': segment_seconds,
+                'use_template': 1,
+                'use_timeline': 1,
+                'adaptation_sets': adaptation_sets
+            })
+            target = os.path.join(package_dir, ENTRY_FILES['dash'])
+
+        return command.output(target, *streams, **output_args)
@@ -0,0 +1,295 @@
+from bisect import bisect_right
+from collections.abc import Generator
+from typing import Any, Optional
+import math
+import os
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.command import Command, filter_spec
+from utils.deadline import Deadline, DeadlineExceeded, timeout_messages
+from utils.media_io import PeakRSSTracker, spool_input, stream_blob
+from utils.metrics import InvocationMetrics, Stage
+from utils.probe import ProbeError, probe_service
+from utils.progress import ProgressTracker
+from utils.scene_index import SCENE_THRESHOLD
+from utils.scheduler import PRIORITY_ENCODE, PRIORITY_SEEK, scheduler
+from utils.workspace import workspace_manager
+
+# 单次调用最多提取的帧数
+MAX_FRAMES = 50
+
+# 缩略图宽度的上限（像素）
+MAX_WIDTH = 1920
+
+# 各模式共用的滤镜：seek模式每个输入只取一帧，场景模式选出第一帧与镜头切换处的关键帧
+FIRST_FRAME = filter_spec('trim', end_frame=1)
+SELECT_SCENES = filter_spec('select', f"eq(n,0)+gt(scene,{SCENE_THRESHOLD})")
+RESET_PTS = filter_spec('setpts', 'PTS-STARTPTS')
+
+MIME_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png'}
+
+
+def _read_frame_times(path: str) -> list[float]:
+    """读取 metadata=mode=print 输出的各帧显示时间"""
+    times = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("frame:"):
+                    for field in line.split():
+                        if field.startswith("pts_time:"):
+                            times.append(float(field[len("pts_time:"):]))
+    except (OSError, ValueError):
+        pass
+    return times
+
+
+class VideoThumbnailsTool(Tool):
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        video_file = tool_parameters.get('video')
+        mode = (tool_parameters.get('mode') or 'even').lower()
+        count = tool_parameters.get('count')
+        width = tool_parameters.get('width')
+        image_format = (tool_parameters.get('image_format') or 'jpg').lower()
+
+        # 验证输入
+        if not video_file:
+            yield self.create_text_message("No video file provided")
+            yield self.create_json_message({
+                "status": "error",
+                "message": "No video file provided"
+            })
+            return
+
+        if mode not in ['even', 'scene', 'contact_sheet']:
+            yield self.create_text_message(f"Invalid mode: {mode}. Using 'even' instead.")
+            mode = 'even'
+
+        if image_format not in MIME_TYPES:
+            yield self.create_text_message(f"Invalid image format: {image_format}. Using 'jpg' instead.")
+            image_format = 'jpg'
+
+        try:
+            count = int(count) if count else 6
+            width = int(width) if width else 320
+        except (TypeError, ValueError):
+            yield self.create_text_message("Invalid frame count or width. Using 6 frames at 320 pixels instead.")
+            count, width = 6, 320
+        count = max(1, min(count, MAX_FRAMES))
+        # 宽度取偶数，便于后续编码
+        width = max(16, min(width, MAX_WIDTH)) // 2 * 2
+
+        progress = ProgressTracker(deadline=Deadline())
+        metrics = InvocationMetrics("video_thumbnails", progress)
+        try:
+            file_extension = video_file.extension if video_file.extension else '.mp4'
+            orig_filename = os.path.splitext(video_file.filename)[0]
+
+            rss_tracker = PeakRSSTracker()
+            # 输出只有少量图片，无需为输出预留空间
+            workspace = workspace_manager.job(video_file.size, factor=1)
+
+            try:
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+
+                # 使用共享的探测结果确定时长，不再单独探测
+                try:
+                    with metrics.stage("probe") as stage:
+                        probe = probe_service.probe(input_media.path, input_media.content_hash, stage=stage)
+                except ProbeError as e:
+                    raise ValueError(f"Error analyzing video file: {str(e)}")
+                if not probe.streams('video'):
+                    raise ValueError("No video stream found in the input file")
+                duration = probe.duration
+                start_time = float(probe.info.get("format", {}).get("start_time", 0) or 0)
+
+                # 拼图中的每一格必须是不同的帧，按关键帧索引预先去掉落在同一关键帧上的时间点
+                keyframe_times = None
+                if mode == 'contact_sheet':
+                    try:
+                        with metrics.stage("keyframes") as stage:
+                            keyframes = probe_service.keyframes(input_media.path, input_media.content_hash, stage=stage)
+                        keyframe_times = [t - start_time for t in keyframes.times]
+                    except ProbeError:
+                        keyframe_times = None
+
+                work_dir = workspace.mkdtemp("thumbnails_")
+                label = {"even": "frames", "scene": "scene-change frames", "contact_sheet": "contact sheet tiles"}[mode]
+                yield self.create_text_message(f"Extracting {count} {label} from video...")
+
+                def extract():
+                    # 场景检测需要解码整个视频，与编码任务同级；其余模式只在各时间点解码少量帧
+                    with scheduler.job(PRIORITY_ENCODE if mode == 'scene' else PRIORITY_SEEK) as ticket:
+                        if mode == 'scene':
+                            frames = self._extract_scenes(input_media.path, work_dir, count, width, image_format, stage)
+                        else:
+                            frames = self._extract_seek(
+                                input_media.path, work_dir, duration, count, width, image_format,
+                                mode == 'contact_sheet', stage, keyframe_times
+                            )
+                    return frames, ticket
+
+                with metrics.stage("extract", bytes_in=input_media.size) as stage:
+                    (paths, times), ticket = yield from progress.drive(self, "Extracting frames", extract)
+                    stage.bytes_out = sum(os.path.getsize(path) for path in paths)
+                extract_seconds = metrics.stages[-1].seconds
+
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
+
+                frame_results = []
+                for i, path in enumerate(paths):
+                    if mode == 'contact_sheet':
+                        filename = f"{orig_filename}_contact_sheet.{image_format}"
+                    else:
+                        filename = f"{orig_filename}_frame{i + 1:03d}.{image_format}"
+                    image_size = os.path.getsize(path)
+                    with metrics.stage("emit") as stage:
+                        stage.bytes_out = image_size
+                        yield from stream_blob(path, {"filename": filename, "mime_type": MIME_TYPES[image_format]})
+                    frame_results.append({"filename": filename, "size": image_size})
+
+                # 帧时间相对于文件开头
+                frame_times = [round(max(0.0, t - start_time), 3) for t in times]
+                if mode == 'contact_sheet':
+                    frame_results[0].update({"tiles": len(frame_times), "grid": self._grid(len(frame_times)), "times": frame_times})
+                else:
+                    for result, frame_time in zip(frame_results, frame_times):
+                        result["time"] = frame_time
+
+                extracted = len(frame_times)
+                yield self.create_json_message({
+                    "status": "success",
+                    "message": f"Successfully extracted {extracted} {label}",
+                    "original_filename": video_file.filename,
+                    "mode": mode,
+                    "duration": duration,
+                    "images": frame_results,
+                    "frames_extracted": extracted,
+                    "frames_per_second": round(extracted / extract_seconds, 2) if extract_seconds > 0 else None,
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "scheduler": ticket.to_dict(),
+                    "metrics": metrics.emit("success")
+                })
+
+                yield self.create_text_message(
+                    f"Successfully extracted {extracted} {label} from {video_file.filename} "
+                    f"in {extract_seconds:.2f} seconds."
+                )
+
+            except DeadlineExceeded as e:
+                yield from timeout_messages(self, e, metrics)
+
+            finally:
+                # 清理临时文件
+                workspace.release()
+
+        except Exception as e:
+            error_msg = f"Error extracting frames: {str(e)}"
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "status": "error",
+                "message": error_msg,
+                "metrics": metrics.emit("error")
+            })
+
+    def _grid(self, tiles: int) -> str:
+        """接近正方形的拼图网格，列数不少于行数"""
+        columns = math.ceil(math.sqrt(tiles))
+        return f"{columns}x{math.ceil(tiles / columns)}"
+
+    def _extract_seek(self, in_path: str, work_dir: str, duration: float, count: int, width: int,
+                      image_format: str, contact_sheet: bool, stage: Stage,
+                      keyframe_times: Optional[list[float]] = None) -> tuple[list[str], list[float]]:
+        """在一次ffmpeg调用中为每个时间点打开一个输入，快速定位到其前一个关键帧并只解码关键帧
+
+        返回输出图片的路径与各帧实际的显示时间（去掉落在同一关键帧上的重复帧）；
+        传入keyframe_times（相对于文件开头）时在构建命令前就去掉这些时间点
+        """
+        targets = [duration * (i + 0.5) / count for i in range(count)] if duration > 0 else [0.0]
+        if keyframe_times:
+            targets = self._distinct_keyframe_targets(targets, keyframe_times)
+        command = Command('-copyts')
+        scale = filter_spec('scale', width, -2)
+        branches = []
+        metadata_paths = []
+        for i, target in enumerate(targets):
+            metadata_path = os.path.join(work_dir, f"frame{i:03d}.txt")
+            metadata_paths.append(metadata_path)
+            command.input(in_path, ss=f"{target:.3f}", skip_frame='nokey', noaccurate_seek=None)
+            filters = [
+                FIRST_FRAME,
+                # 帧上没有元数据时metadata不会输出，先添加一个键以记录该帧的时间
+                filter_spec('metadata', mode='add', key='thumbnail', value=i),
+                filter_spec('metadata', mode='print', file=metadata_path),
+                scale
+            ]
+            if contact_sheet:
+                filters.append(RESET_PTS)
+            branches.append(command.chain(f"{i}:v", *filters))
+
+        if contact_sheet:
+            sheet_path = os.path.join(work_dir, f"contact_sheet.{image_format}")
+            sheet = command.chain(
+                branches,
+                filter_spec('concat', n=len(branches), v=1, a=0),
+                filter_spec('tile', self._grid(len(branches)), padding=4, margin=4)
+            )
+            stage.run(command.output(sheet_path, sheet, vframes=1))
+            times = [t for path in metadata_paths for t in _read_frame_times(path)[:1]]
+            return [sheet_path], times
+
+        for i, branch in enumerate(branches):
+            command.output(os.path.join(work_dir, f"frame{i:03d}.{image_format}"), branch, vframes=1)
+        stage.run(command)
+
+        paths, times = [], []
+        for i, metadata_path in enumerate(metadata_paths):
+            frame_times = _read_frame_times(metadata_path)
+            path = os.path.join(work_dir, f"frame{i:03d}.{image_format}")
+            # 相邻时间点落在同一个关键帧上时只保留一张
+            if not frame_times or not os.path.exists(path) or (times and frame_times[0] == times[-1]):
+                continue
+            paths.append(path)
+            times.append(frame_times[0])
+        return paths, times
+
+    def _distinct_keyframe_targets(self, targets: list[float], keyframe_times: list[float]) -> list[float]:
+        """定位会落到时间点前的关键帧上，每个关键帧只保留第一个时间点"""
+        distinct, last = [], None
+        for target in targets:
+            # 第一个关键帧之前的时间点同样定位到第一个关键帧
+            keyframe = max(0, bisect_right(keyframe_times, target) - 1)
+            if keyframe != last:
+                distinct.append(target)
+                last = keyframe
+        return distinct
+
+    def _extract_scenes(self, in_path: str, work_dir: str, count: int, width: int, image_format: str,
+                        stage: Stage) -> tuple[list[str], list[float]]:
+        """只解码关键帧，选出第一帧与场景分数超过阈值的关键帧，达到数量后停止"""
+        metadata_path = os.path.join(work_dir, "scenes.txt")
+        command = Command('-copyts').input(in_path, skip_frame='nokey')
+        scenes = command.chain(
+            '0:v',
+            SELECT_SCENES,
+            filter_spec('metadata', mode='add', key='thumbnail', value=1),
+            filter_spec('metadata', mode='print', file=metadata_path),
+            filter_spec('scale', width, -2)
+        )
+        command.output(os.path.join(work_dir, f"scene%03d.{image_format}"), scenes, vframes=count, vsync='vfr')
+        stage.run(command)
+
+        times = _read_frame_times(metadata_path)
+        paths = []
+        for i in range(1, len(times) + 1):
+            path = os.path.join(work_dir, f"scene{i:03d}.{image_format}")
+            if os.path.exists(path):
+                paths.append(path)
+        return paths, times[:len(paths)]
@@ -1,19 +1,73 @@
 from collections.abc import Generator
-from typing import Any
+from typing import Any, Optional
 import tempfile
 import os
 import time
 import re
-import ffmpeg
+import shutil
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 
+from utils.cache import replay, result_cache
+from utils.capabilities import capability_cache
+from utils.command import Command, filter_spec
+from utils.deadline import Deadline, DeadlineExceeded, timeout_messages
+from utils.media_io import PeakRSSTracker, spool_input, stream_blob
+from utils.metrics import InvocationMetrics, Stage
+from utils.probe import KeyframeIndex, ProbeResult, probe_service
+from utils.progress import ProgressTracker
+from utils.scene_index import SceneIndex, build_scene_index, cached_scene_index
+from utils.scheduler import PRIORITY_COPY, PRIORITY_ENCODE, scheduler
+from utils.workspace import workspace_manager
+
+# 设置MIME类型映射
+MIME_TYPES = {
+    'mp4': 'video/mp4',
+    'avi': 'video/x-msvideo',
+    'mov': 'video/quicktime',
+    'mkv': 'video/x-matroska',
+    'webm': 'video/webm',
+    'flv': 'video/x-flv',
+    'wmv': 'video/x-ms-wmv',
+    'm4v': 'video/x-m4v',
+    '3gp': 'video/3gpp'
+}
+
+# 单次调用最多生成的片段数
+MAX_SEGMENTS = 50
+
+# 对齐到场景切换时剪切点默认最多移动的秒数
+DEFAULT_SNAP_TOLERANCE = 2.0
+
+# 重编码时与源视频编码对应的编码器
+VIDEO_ENCODERS = {
+    'h264': 'libx264',
+    'hevc': 'libx265'
+}
+
+# 重编码音频时与源音频编码对应的编码器
+AUDIO_ENCODERS = {
+    'aac': 'aac',
+    'mp3': 'libmp3lame',
+    'opus': 'libopus',
+    'vorbis': 'libvorbis',
+    'flac': 'flac'
+}
+
+# 多片段重编码时各片段的时间戳从0开始
+RESET_VIDEO_PTS = filter_spec('setpts', 'PTS-STARTPTS')
+RESET_AUDIO_PTS = filter_spec('asetpts', 'PTS-STARTPTS')
+
 class VideoTrimTool(Tool):
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         video_file = tool_parameters.get('video')
         start_time = tool_parameters.get('start_time', '')
         end_time = tool_parameters.get('end_time', '')
+        trim_mode = (tool_parameters.get('trim_mode') or 'copy').lower()
+        ranges = (tool_parameters.get('ranges') or '').strip()
+        snap_to_scene = bool(tool_parameters.get('snap_to_scene', False))
+        snap_tolerance = tool_parameters.get('snap_tolerance')
         
         # 验证输入
         if not video_file:
@@ -24,6 +78,32 @@ class VideoTrimTool(Tool):
             })
             return
         
+        # 验证剪切模式
+        valid_modes = ['copy', 'smart', 'reencode']
+        if trim_mode not in valid_modes:
+            yield self.create_text_message(f"Invalid trim mode: {trim_mode}. Using 'copy' instead.")
+            trim_mode = 'copy'
+        
+        # 验证对齐容差，不对齐时为None
+        if snap_to_scene:
+            try:
+                snap_tolerance = float(snap_tolerance) if snap_tolerance is not None else DEFAULT_SNAP_TOLERANCE
+                if snap_tolerance < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                yield self.create_text_message(f"Invalid snap tolerance: {snap_tolerance}. Using {DEFAULT_SNAP_TOLERANCE:g} seconds instead.")
+                snap_tolerance = DEFAULT_SNAP_TOLERANCE
+        else:
+            snap_tolerance = None
+        
+        progress = ProgressTracker(deadline=Deadline())
+        metrics = InvocationMetrics("video_trim", progress)
+        
+        # 指定了多个区间时，一次解复用生成所有片段
+        if ranges:
+            yield from self._invoke_segments(video_file, ranges, trim_mode, metrics, snap_tolerance)
+            return
+        
         if not start_time:
             yield self.create_text_message("No start time provided")
             yield self.create_json_message({
@@ -70,75 +150,164 @@ class VideoTrimTool(Tool):
             orig_filename = os.path.splitext(video_file.filename)[0]
             output_filename = f"{orig_filename}_trimmed{file_extension}"
             
-            # 设置MIME类型映射
-            mime_types = {
-                'mp4': 'video/mp4',
-                'avi': 'video/x-msvideo',
-                'mov': 'video/quicktime',
-                'mkv': 'video/x-matroska',
-                'webm': 'video/webm',
-                'flv': 'video/x-flv',
-                'wmv': 'video/x-ms-wmv',
-                'm4v': 'video/x-m4v',
-                '3gp': 'video/3gpp'
-            }
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as in_temp_file:
-                in_temp_file.write(video_file.blob)
-                in_temp_path = in_temp_file.name
-                
-            out_temp_path = os.path.join(tempfile.gettempdir(), f"trimmed_{int(time.time())}{file_extension}")
+            rss_tracker = PeakRSSTracker()
+            
+            # 每次调用使用独立的工作区，并发请求的临时文件互不冲突
+            workspace = workspace_manager.job(video_file.size)
+            out_temp_path = workspace.file(f"output{file_extension}")
             
             try:
+                # 将上传的视频流式写入临时文件
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+                in_temp_path = input_media.path
+                
+                # 相同内容与参数直接返回缓存结果
+                cache_params = {"filename": video_file.filename, "start": start_seconds, "end": end_seconds, "trim_mode": trim_mode}
+                if snap_tolerance is not None:
+                    cache_params["snap_tolerance"] = snap_tolerance
+                cache_key = result_cache.make_key("video_trim", input_media.content_hash, cache_params)
+                cached = result_cache.get(cache_key)
+                if cached:
+                    yield from replay(self, cached, result_cache.stats(hit=True), metrics)
+                    return
+                
+                # 起止时间移动到附近的场景切换处，场景索引按内容哈希只建立一次
+                index = None
+                scene_snap = None
+                if snap_tolerance is not None:
+                    with metrics.stage("probe") as stage:
+                        probe = probe_service.probe(in_temp_path, input_media.content_hash, stage=stage)
+                    index, index_cached = yield from self._load_scene_index(input_media, probe.duration, metrics)
+                    requested = (start_seconds, end_seconds)
+                    start_seconds, end_seconds = self._snap(index, start_seconds, end_seconds, snap_tolerance)
+                    scene_snap = {
+                        "requested_start": requested[0],
+                        "requested_end": requested[1],
+                        "start": start_seconds,
+                        "end": end_seconds,
+                        "tolerance": snap_tolerance,
+                        "index": index.summary(index_cached)
+                    }
+                
                 # 执行剪切
                 yield self.create_text_message(f"Trimming video from {start_time} to {end_time}...")
                 
-                # 使用ffmpeg-python库进行剪切
-                (
-                    ffmpeg
-                    .input(in_temp_path, ss=start_seconds, to=end_seconds)
-                    .output(out_temp_path, c='copy')
-                    .run(capture_stdout=True, capture_stderr=True, overwrite_output=True)
-                )
+                started = time.monotonic()
+                timings = {}
                 
-                # 读取输出文件
-                with open(out_temp_path, 'rb') as out_file:
-                    trimmed_data = out_file.read()
+                duration = end_seconds - start_seconds
+                progress.total_seconds = duration
+                if trim_mode == 'copy':
+                    def trim():
+                        with scheduler.job(PRIORITY_COPY) as ticket:
+                            stage.run(
+                                Command()
+                                .input(in_temp_path, ss=start_seconds, to=end_seconds)
+                                .output(out_temp_path, c='copy'),
+                                expected_seconds=duration
+                            )
+                        return ticket
+                    
+                    with metrics.stage("trim", bytes_in=input_media.size) as stage:
+                        ticket = yield from progress.drive(self, "Trimming", trim)
+                else:
+                    # 探测和关键帧索引在申请执行槽位之前完成，避免嵌套占用槽位
+                    with metrics.stage("probe") as stage:
+                        probe = probe_service.probe(in_temp_path, input_media.content_hash, stage=stage)
+                        if trim_mode == 'smart':
+                            # 已有场景索引时直接使用其中的关键帧位置
+                            if index is not None:
+                                keyframes = index.keyframes()
+                            else:
+                                keyframes = probe_service.keyframes(in_temp_path, input_media.content_hash, stage=stage)
+                            cut_points = self._find_smart_cut_points(probe, keyframes, start_seconds, end_seconds)
+                            if not cut_points:
+                                # 区间内没有完整的GOP或编码不支持，退回完整重编码
+                                trim_mode = 'reencode'
+                    
+                    def trim():
+                        if trim_mode == 'smart':
+                            with scheduler.job(PRIORITY_COPY) as ticket:
+                                return self._smart_trim(
+                                    in_temp_path, out_temp_path, start_seconds, end_seconds,
+                                    probe, keyframes, cut_points, ticket.threads, stage
+                                ), ticket
+                        with scheduler.job(PRIORITY_ENCODE) as ticket:
+                            self._reencode_trim(
+                                in_temp_path, out_temp_path, start_seconds, end_seconds, probe, ticket.threads, stage
+                            )
+                        return {}, ticket
+                    
+                    if trim_mode == 'smart':
+                        # 视频片段、音频与最终拼接各输出一遍区间时长
+                        progress.total_seconds = duration * (3 if probe.streams('audio') else 2)
+                    with metrics.stage("trim", bytes_in=input_media.size) as stage:
+                        timings, ticket = yield from progress.drive(self, "Trimming", trim)
                 
-                # 创建结果消息
-                yield self.create_blob_message(
-                    trimmed_data,
-                    meta={
-                        "filename": output_filename,
-                        "mime_type": mime_types.get(format_type, f"video/{format_type}"),
-                    }
-                )
+                timings["total"] = round(time.monotonic() - started, 4)
                 
-                yield self.create_json_message({
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
+                
+                blob_meta = {
+                    "filename": output_filename,
+                    "mime_type": MIME_TYPES.get(format_type, f"video/{format_type}"),
+                }
+                result = {
                     "status": "success",
                     "message": f"Successfully trimmed video from {start_time} to {end_time}",
                     "original_filename": video_file.filename,
                     "trimmed_filename": output_filename,
                     "start_time": start_time,
                     "end_time": end_time,
-                    "duration": end_seconds - start_seconds
+                    "duration": end_seconds - start_seconds,
+                    "trim_mode": trim_mode,
+                    "timings": timings
+                }
+                summary = f"Successfully trimmed video from {start_time} to {end_time}. New duration: {end_seconds - start_seconds:.2f} seconds."
+                if scene_snap is not None:
+                    result["scene_snap"] = scene_snap
+                    summary += f" Snapped to scene changes: {start_seconds:.2f}s to {end_seconds:.2f}s."
+                result_cache.put(cache_key, {
+                    "json": result, "text": summary, "blob_meta": blob_meta,
+                    "invocation_keys": ["memory", "workspace", "scheduler"]
+                }, out_temp_path)
+                
+                # 创建结果消息
+                with metrics.stage("emit") as stage:
+                    stage.bytes_out = os.path.getsize(out_temp_path)
+                    yield from stream_blob(out_temp_path, blob_meta)
+                
+                yield self.create_json_message({
+                    **result,
+                    "cache": result_cache.stats(hit=False),
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "scheduler": ticket.to_dict(),
+                    "metrics": metrics.emit("success")
                 })
                 
-                yield self.create_text_message(f"Successfully trimmed video from {start_time} to {end_time}. New duration: {end_seconds - start_seconds:.2f} seconds.")
+                yield self.create_text_message(summary)
                 
+            except DeadlineExceeded as e:
+                # 超时或调用方放弃请求，可能附带ffmpeg已写完的部分输出
+                blob_meta = {"filename": output_filename, "mime_type": MIME_TYPES.get(format_type, f"video/{format_type}")}
+                yield from timeout_messages(self, e, metrics, out_temp_path, blob_meta)
+            
             finally:
                 # 清理临时文件
-                if os.path.exists(in_temp_path):
-                    os.unlink(in_temp_path)
-                if os.path.exists(out_temp_path):
-                    os.unlink(out_temp_path)
+                workspace.release()
                     
         except Exception as e:
             error_msg = f"Error trimming video: {str(e)}"
             yield self.create_text_message(error_msg)
             yield self.create_json_message({
                 "status": "error",
-                "message": error_msg
+                "message": error_msg,
+                "metrics": metrics.emit("error")
             })
     
     def _parse_time(self, time_str):
@@ -158,4 +327,326 @@ class VideoTrimTool(Tool):
             return float(time_str)
             
         else:
-            raise ValueError(f"Invalid time format: {time_str}. Use HH:MM:SS, MM:SS or seconds.") 
\ No newline at end of file
+            raise ValueError(f"Invalid time format: {time_str}. Use HH:MM:SS, MM:SS or seconds.") 
+
+    def _parse_ranges(self, ranges: str) -> list[tuple[float, float]]:
+        """解析多个时间区间，格式为 start-end，以逗号、分号或换行分隔"""
+        segments = []
+        for part in re.split(r'[,;\n]+', ranges):
+            part = part.strip()
+            if not part:
+                continue
+            if part.count('-') != 1:
+                raise ValueError(f"Invalid time range: {part}. Use start-end, e.g. 00:01:00-00:01:30 or 60-90.")
+            start_str, end_str = part.split('-')
+            start, end = self._parse_time(start_str.strip()), self._parse_time(end_str.strip())
+            if start >= end:
+                raise ValueError(f"Start time must be before end time in range: {part}")
+            segments.append((float(start), float(end)))
+        
+        if not segments:
+            raise ValueError("No time ranges provided")
+        if len(segments) > MAX_SEGMENTS:
+            raise ValueError(f"Too many time ranges: {len(segments)}. At most {MAX_SEGMENTS} are supported.")
+        return segments
+    
+    def _segment_command(self, in_path: str, segments: list[tuple[float, float]], out_paths: list[str],
+                         trim_mode: str, probe: Optional[ProbeResult], threads: int) -> Command:
+        """构建单次调用ffmpeg的多路输出：复制模式每个区间单独定位一个输入，重编码模式共用一次解码后split"""
+        if trim_mode == 'copy':
+            # 与单区间复制相同在输入端定位，从区间前的关键帧开始复制；在输出端定位会丢弃到下一个关键帧为止的视频包
+            command = Command()
+            for i, ((start, end), path) in enumerate(zip(segments, out_paths)):
+                command.input(in_path, ss=start, to=end)
+                command.output(path, str(i), c='copy')
+            return command
+        
+        # 只解码所有区间覆盖的范围
+        base = min(start for start, _ in segments)
+        command = Command().input(in_path, ss=base, to=max(end for _, end in segments))
+        video_parts = command.split('0:v', len(segments)) if probe.streams('video') else None
+        audio_parts = command.split('0:a', len(segments), audio=True) if probe.streams('audio') else None
+        output_args = self._reencode_args(probe, threads)
+        
+        for i, ((start, end), path) in enumerate(zip(segments, out_paths)):
+            streams = []
+            if video_parts is not None:
+                streams.append(command.chain(
+                    video_parts[i], filter_spec('trim', start=start - base, end=end - base), RESET_VIDEO_PTS
+                ))
+            if audio_parts is not None:
+                streams.append(command.chain(
+                    audio_parts[i], filter_spec('atrim', start=start - base, end=end - base), RESET_AUDIO_PTS
+                ))
+            command.output(path, *streams, **output_args)
+        return command
+    
+    def _invoke_segments(self, video_file, ranges: str, trim_mode: str, metrics: InvocationMetrics,
+                         snap_tolerance: Optional[float] = None) -> Generator[ToolInvokeMessage, None, None]:
+        """一次调用ffmpeg剪切多个片段，每个片段作为单独的文件返回"""
+        try:
+            segments = self._parse_ranges(ranges)
+        except ValueError as e:
+            yield self.create_text_message(str(e))
+            yield self.create_json_message({
+                "status": "error",
+                "message": str(e)
+            })
+            return
+        
+        # 智能剪切需要逐段处理，多区间时改为共用一次解码的重编码
+        if trim_mode == 'smart':
+            trim_mode = 'reencode'
+        
+        try:
+            file_extension = video_file.extension if video_file.extension else '.mp4'
+            format_type = file_extension.lstrip('.')
+            orig_filename = os.path.splitext(video_file.filename)[0]
+            
+            rss_tracker = PeakRSSTracker()
+            workspace = workspace_manager.job(video_file.size)
+            
+            try:
+                with metrics.stage("input") as stage:
+                    input_media = spool_input(video_file, file_extension, directory=workspace.path)
+                    stage.bytes_in = input_media.size
+                workspace.check_quota()
+                out_paths = [workspace.file(f"part{i}{file_extension}") for i in range(1, len(segments) + 1)]
+                probe = None
+                if trim_mode != 'copy' or snap_tolerance is not None:
+                    with metrics.stage("probe") as stage:
+                        probe = probe_service.probe(input_media.path, input_media.content_hash, stage=stage)
+                
+                requested = segments
+                index = None
+                if snap_tolerance is not None:
+                    index, index_cached = yield from self._load_scene_index(input_media, probe.duration, metrics)
+                    segments = [self._snap(index, start, end, snap_tolerance) for start, end in segments]
+                
+                yield self.create_text_message(f"Trimming {len(segments)} segments from video...")
+                
+                def trim():
+                    with scheduler.job(PRIORITY_COPY if trim_mode == 'copy' else PRIORITY_ENCODE) as ticket:
+                        command = self._segment_command(input_media.path, segments, out_paths, trim_mode, probe, ticket.threads)
+                        # 各片段同时输出，进度以最长的片段为准
+                        stage.run(command, expected_seconds=metrics.progress.total_seconds)
+                    return ticket
+                
+                metrics.progress.total_seconds = max(end - start for start, end in segments)
+                started = time.monotonic()
+                with metrics.stage("trim", bytes_in=input_media.size) as stage:
+                    ticket = yield from metrics.progress.drive(self, "Trimming", trim)
+                    stage.bytes_out = sum(os.path.getsize(path) for path in out_paths)
+                total_seconds = time.monotonic() - started
+                
+                # 提前删除输入文件，释放磁盘空间
+                input_media.release()
+                
+                segment_results = []
+                for i, ((start, end), path, (requested_start, requested_end)) in enumerate(
+                        zip(segments, out_paths, requested), start=1):
+                    filename = f"{orig_filename}_part{i}{file_extension}"
+                    with metrics.stage("emit") as stage:
+                        stage.bytes_out = os.path.getsize(path)
+                        yield from stream_blob(path, {
+                            "filename": filename,
+                            "mime_type": MIME_TYPES.get(format_type, f"video/{format_type}"),
+                        })
+                    segment_result = {
+                        "index": i,
+                        "filename": filename,
+                        "start": start,
+                        "end": end,
+                        "duration": end - start,
+                        "size": os.path.getsize(path)
+                    }
+                    if index is not None:
+                        segment_result["requested_start"] = requested_start
+                        segment_result["requested_end"] = requested_end
+                    segment_results.append(segment_result)
+                
+                total_duration = sum(end - start for start, end in segments)
+                yield self.create_json_message({
+                    "status": "success",
+                    "message": f"Successfully trimmed {len(segments)} segments from video",
+                    "original_filename": video_file.filename,
+                    "trim_mode": trim_mode,
+                    "segments": segment_results,
+                    "total_duration": total_duration,
+                    "timings": {"total": round(total_seconds, 4)},
+                    "scene_index": index.summary(index_cached) if index is not None else None,
+                    "memory": {"peak_rss_bytes": rss_tracker.peak()},
+                    "workspace": workspace.to_dict(),
+                    "scheduler": ticket.to_dict(),
+                    "metrics": metrics.emit("success")
+                })
+                
+                yield self.create_text_message(
+                    f"Successfully trimmed {len(segments)} segments from {video_file.filename}. "
+                    f"Total duration: {total_duration:.2f} seconds."
+                )
+            
+            except DeadlineExceeded as e:
+                # 多个片段由同一个ffmpeg进程输出，超时时不返回部分结果
+                yield from timeout_messages(self, e, metrics)
+            
+            finally:
+                # 清理临时文件
+                workspace.release()
+        
+        except Exception as e:
+            error_msg = f"Error trimming video: {str(e)}"
+            yield self.create_text_message(error_msg)
+            yield self.create_json_message({
+                "status": "error",
+                "message": error_msg,
+                "metrics": metrics.emit("error")
+            })
+    
+    def _load_scene_index(self, input_media, duration: float, metrics: InvocationMetrics):
+        """返回场景索引与是否来自探测索引，没有记录时解码一遍建立"""
+        index = cached_scene_index(input_media.content_hash)
+        if index is not None:
+            return index, True
+        progress = metrics.progress
+        progress.total_seconds = duration
+        with metrics.stage("scenes", bytes_in=input_media.size) as stage:
+            index = yield from progress.drive(
+                self, "Indexing scenes",
+                lambda: build_scene_index(input_media.path, input_media.content_hash, duration, stage)
+            )
+        # 剪切的进度单独计算
+        progress.reset()
+        return index, False
+    
+    def _snap(self, index: SceneIndex, start: float, end: float, tolerance: float) -> tuple[float, float]:
+        """起止时间分别移动到tolerance秒以内最近的场景切换处，移动后区间为空时保持原样"""
+        snapped_start, snapped_end = index.snap(start, tolerance), index.snap(end, tolerance)
+        if snapped_start >= snapped_end:
+            return start, end
+        return snapped_start, snapped_end
+    
+    def _frame_rate(self, video_stream: dict[str, Any]) -> float:
+        """解析视频流的平均帧率，未知时返回0"""
+        num, _, den = (video_stream.get('avg_frame_rate') or '0/0').partition('/')
+        try:
+            return float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            return 0.0
+    
+    def _find_smart_cut_points(self, probe: ProbeResult, keyframes: KeyframeIndex, start: float, end: float):
+        """返回剪切区间内第一个和最后一个关键帧的序号，无法智能剪切时返回None"""
+        video_streams = probe.streams('video')
+        if not video_streams or video_streams[0].get('codec_name') not in VIDEO_ENCODERS:
+            return None
+        # 首尾片段必须用与源相同的编码重编码，当前构建没有对应编码器时无法智能剪切
+        if not capability_cache.get().has_encoder(VIDEO_ENCODERS[video_streams[0]['codec_name']]):
+            return None
+        if self._frame_rate(video_streams[0]) <= 0:
+            return None
+        
+        inner = [i for i, t in enumerate(keyframes.times) if start <= t <= end]
+        if len(inner) < 2:
+            return None
+        return inner[0], inner[-1]
+    
+    def _reencode_args(self, probe: ProbeResult, threads: int) -> dict[str, Any]:
+        """重编码输出参数，已知编码沿用对应编码器，否则使用容器默认编码器"""
+        video_streams = probe.streams('video')
+        output_args = {'threads': threads}
+        encoder = VIDEO_ENCODERS.get(video_streams[0].get('codec_name')) if video_streams else None
+        if encoder and capability_cache.get().has_encoder(encoder):
+            output_args.update({'c:v': encoder, 'crf': 18, 'preset': 'veryfast'})
+        return output_args
+    
+    def _reencode_trim(self, in_path: str, out_path: str, start: float, end: float, probe: ProbeResult,
+                       threads: int, stage: Stage):
+        """完整重编码剪切区间，帧精确但速度最慢"""
+        stage.run(
+            Command()
+            .input(in_path, ss=start, to=end)
+            .output(out_path, **self._reencode_args(probe, threads)),
+            expected_seconds=end - start
+        )
+    
+    def _smart_trim(self, in_path: str, out_path: str, start: float, end: float, probe: ProbeResult,
+                    keyframes: KeyframeIndex, cut_points, threads: int, stage: Stage) -> dict[str, float]:
+        """智能剪切：只重编码首尾不完整的GOP，中间部分直接复制，最后无损拼接"""
+        first, last = cut_points
+        first_key, last_key = keyframes.times[first], keyframes.times[last]
+        video_stream = probe.streams('video')[0]
+        audio_streams = probe.streams('audio')
+        fps = self._frame_rate(video_stream)
+        
+        # 按帧数而不是时间切分，保证片段之间既不重叠也不缺帧
+        head_frames = round((first_key - start) * fps)
+        tail_frames = round((end - last_key) * fps)
+        middle_frames = keyframes.packets_between(first, last)
+        head_start = first_key - head_frames / fps
+        
+        encode_args = {
+            'c:v': VIDEO_ENCODERS[video_stream['codec_name']],
+            'crf': 18,
+            'preset': 'veryfast',
+            'threads': threads
+        }
+        if video_stream.get('pix_fmt'):
+            encode_args['pix_fmt'] = video_stream['pix_fmt']
+        
+        timings = {}
+        work_dir = tempfile.mkdtemp(prefix="smart_trim_", dir=os.path.dirname(out_path))
+        try:
+            # 视频片段写成MPEG-TS，码流内携带参数集，拼接编码参数不同的片段也能正确解码
+            segments = [
+                ('head', head_start, head_frames, encode_args),
+                ('middle', first_key, middle_frames, {'c:v': 'copy'}),
+                ('tail', last_key, tail_frames, encode_args)
+            ]
+            segment_paths = []
+            for name, seg_start, frames, video_args in segments:
+                if frames <= 0:
+                    continue
+                seg_path = os.path.join(work_dir, f"{name}.ts")
+                step_started = time.monotonic()
+                stage.run(
+                    Command()
+                    .input(in_path, ss=seg_start)
+                    .output(seg_path, an=None, f='mpegts', **{'frames:v': frames}, **video_args),
+                    expected_seconds=frames / fps
+                )
+                timings[name] = round(time.monotonic() - step_started, 4)
+                segment_paths.append(seg_path)
+            
+            list_path = os.path.join(work_dir, "segments.txt")
+            with open(list_path, 'w') as f:
+                for seg_path in segment_paths:
+                    f.write(f"file '{seg_path}'\n")
+            
+            command = Command().input(list_path, f='concat', safe=0)
+            streams = ['0:v']
+            
+            if audio_streams:
+                # 音频单独按精确区间重编码，避免拼接处出现间隙
+                audio_path = os.path.join(work_dir, "audio.mka")
+                audio_duration = (head_frames + middle_frames + tail_frames) / fps
+                step_started = time.monotonic()
+                stage.run(
+                    Command()
+                    .input(in_path, ss=head_start, t=audio_duration)
+                    .output(audio_path, vn=None, **{'c:a': AUDIO_ENCODERS.get(audio_streams[0].get('codec_name'), 'aac')}),
+                    expected_seconds=audio_duration
+                )
+                timings['audio'] = round(time.monotonic() - step_started, 4)
+                command.input(audio_path)
+                streams.append('1:a')
+            
+            step_started = time.monotonic()
+            stage.run(
+                command.output(out_path, *streams, c='copy'),
+                expected_seconds=(head_frames + middle_frames + tail_frames) / fps
+            )
+            timings['concat'] = round(time.monotonic() - step_started, 4)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        return timings
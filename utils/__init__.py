@@ -0,0 +1,3 @@
+"""
+工具共享的辅助模块，包含缓存等各工具通用的基础设施
+"""
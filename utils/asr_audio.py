@@ -0,0 +1,170 @@
+"""
+面向语音识别的音频提取：一次解码输出16kHz单声道PCM/FLAC，按固定时长或静音位置切分为多个分块
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+import csv
+import os
+
+from utils.command import Command, filter_spec
+from utils.metrics import Stage
+from utils.scheduler import PRIORITY_AUDIO, PRIORITY_COPY, JobTicket, scheduler
+
+# 语音识别模型通用的采样率与声道数
+ASR_SAMPLE_RATE = 16000
+ASR_CHANNELS = 1
+
+# 分块的输出格式与编码器
+ASR_CODECS = {'wav': 'pcm_s16le', 'flac': 'flac'}
+
+MODE_FIXED = "fixed"
+MODE_SILENCE = "silence"
+
+DEFAULT_CHUNK_SECONDS = 30.0
+
+# 低于该音量且持续不短于SILENCE_MIN_SECONDS的片段视为静音
+SILENCE_NOISE = "-35dB"
+SILENCE_MIN_SECONDS = 0.5
+SILENCE_DETECT = filter_spec('silencedetect', noise=SILENCE_NOISE, d=SILENCE_MIN_SECONDS)
+
+# 静音切分时分块至少达到最长时长的该比例，避免产生大量过短的分块
+MIN_CHUNK_FRACTION = 0.5
+
+# 末尾剩余不足该时长时并入前一个分块；时长恰为分块时长整数倍时segment封装器会多输出一个只有文件头的分块
+MIN_TAIL_SECONDS = 0.1
+
+
+@dataclass
+class AudioChunk:
+    index: int
+    path: str
+    start: float
+    end: float
+
+    def to_dict(self, filename: str) -> dict[str, Any]:
+        return {
+            "index": self.index,
+            "filename": filename,
+            "start": round(self.start, 3),
+            "end": round(self.end, 3),
+            "duration": round(self.end - self.start, 3),
+            "size": os.path.getsize(self.path)
+        }
+
+
+def parse_silences(path: str, until: Optional[float] = None) -> list[tuple[float, float]]:
+    """读取 ametadata 输出的 silencedetect 结果，返回各静音区间的起止时间
+
+    到结尾仍未结束的静音没有结束时间，指定until时计到该时间为止，否则忽略
+    """
+    silences = []
+    start = None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.strip().partition("=")
+                if key == "lavfi.silence_start":
+                    start = float(value)
+                elif key == "lavfi.silence_end" and start is not None:
+                    silences.append((max(0.0, start), float(value)))
+                    start = None
+    except (OSError, ValueError):
+        return []
+    if start is not None and until is not None and until > start:
+        silences.append((max(0.0, start), until))
+    return silences
+
+
+def plan_splits(silences: list[tuple[float, float]], duration: float, chunk_seconds: float) -> list[float]:
+    """在每个分块允许的最长时长内选择最后一个静音区间的中点切分，没有静音时按最长时长硬切分
+
+    切分后剩余不足MIN_TAIL_SECONDS时不再切分，最后一个分块可能比最长时长多出不到该时长
+    """
+    splits = []
+    start = 0.0
+    while duration - start > chunk_seconds:
+        limit = start + chunk_seconds
+        candidates = [
+            (silence_start + silence_end) / 2 for silence_start, silence_end in silences
+            if start + chunk_seconds * MIN_CHUNK_FRACTION <= (silence_start + silence_end) / 2 <= limit
+        ]
+        split = candidates[-1] if candidates else limit
+        if duration - split < MIN_TAIL_SECONDS:
+            break
+        splits.append(round(split, 3))
+        start = split
+    return splits
+
+
+def _read_segment_list(list_path: str, work_dir: str) -> list[AudioChunk]:
+    """解析segment封装器输出的CSV列表：文件名、起始时间、结束时间
+
+    探测时长比实际音频长时最后一个切分点之后可能几乎没有采样，这样的末尾分块直接丢弃
+    """
+    chunks = []
+    with open(list_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            chunks.append(AudioChunk(
+                index=len(chunks), path=os.path.join(work_dir, row[0]), start=float(row[1]), end=float(row[2])
+            ))
+    if len(chunks) > 1 and chunks[-1].end - chunks[-1].start < MIN_TAIL_SECONDS:
+        os.remove(chunks.pop().path)
+    return chunks
+
+
+def _segment_split_args(splits: list[float], chunk_seconds: float) -> dict[str, Any]:
+    """按给定的切分点切分；没有切分点时整段不超过最长时长或时长未知，交给segment封装器按时长切分"""
+    if splits:
+        return {'segment_times': ",".join(f"{split:.3f}" for split in splits)}
+    return {'segment_time': chunk_seconds}
+
+
+def extract_asr_chunks(in_path: str, work_dir: str, audio_format: str, mode: str, chunk_seconds: float,
+                       duration: float, stage: Stage) -> tuple[list[AudioChunk], JobTicket]:
+    """提取16kHz单声道音频并切分
+
+    固定模式在一次解码中直接由segment封装器切分；静音模式在同一次解码中检测静音并写出完整的PCM，
+    再按静音位置无损切分（FLAC分块只从PCM编码，不再解码源文件）
+    """
+    codec = ASR_CODECS[audio_format]
+    pattern = os.path.join(work_dir, f"chunk%04d.{audio_format}")
+    list_path = os.path.join(work_dir, "chunks.csv")
+    segment_args = {'f': 'segment', 'segment_list': list_path, 'segment_list_type': 'csv', 'reset_timestamps': 1}
+
+    if mode == MODE_FIXED:
+        # 切分点按探测时长预先计算，而不是交给segment_time，避免末尾产生过短的分块
+        segment_args.update(_segment_split_args(plan_splits([], duration, chunk_seconds), chunk_seconds))
+        with scheduler.job(PRIORITY_AUDIO) as ticket:
+            stage.run(
+                Command()
+                .input(in_path)
+                .output(pattern, vn=None, sn=None, ac=ASR_CHANNELS, ar=ASR_SAMPLE_RATE, acodec=codec,
+                        threads=ticket.threads, **segment_args),
+                expected_seconds=duration
+            )
+        return _read_segment_list(list_path, work_dir), ticket
+
+    pcm_path = os.path.join(work_dir, "full.wav")
+    silence_path = os.path.join(work_dir, "silence.txt")
+    with scheduler.job(PRIORITY_AUDIO) as ticket:
+        command = Command().input(in_path)
+        # 静音区间写入文件而不是从错误输出中解析，长音频的日志不会被截断
+        audio = command.chain('0:a', SILENCE_DETECT, filter_spec('ametadata', mode='print', file=silence_path))
+        stage.run(
+            command.output(pcm_path, audio, ac=ASR_CHANNELS, ar=ASR_SAMPLE_RATE, acodec='pcm_s16le', threads=ticket.threads),
+            expected_seconds=duration
+        )
+
+    splits = plan_splits(parse_silences(silence_path), duration, chunk_seconds)
+    segment_args.update(_segment_split_args(splits, chunk_seconds))
+    with scheduler.job(PRIORITY_COPY if codec == 'pcm_s16le' else PRIORITY_AUDIO) as ticket:
+        stage.run(
+            Command()
+            .input(pcm_path)
+            .output(pattern, acodec='copy' if codec == 'pcm_s16le' else codec, threads=ticket.threads, **segment_args),
+            expected_seconds=duration
+        )
+    os.remove(pcm_path)
+    return _read_segment_list(list_path, work_dir), ticket
@@ -0,0 +1,110 @@
+"""
+响度与音频统计：ebur128、astats与静音检测作为提取命令的一条分支，与输出共用同一次解码；
+测量结果按内容哈希记录在探测索引中，两遍响度归一化的第二遍不必重新测量
+"""
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+import os
+import re
+
+from utils.asr_audio import SILENCE_DETECT, parse_silences
+from utils.command import Command, filter_spec
+
+LOUDNESS_OFF = "off"
+LOUDNESS_ANALYZE = "analyze"
+LOUDNESS_NORMALIZE = "normalize"
+
+# 常见流媒体平台的目标响度与真峰值上限
+DEFAULT_TARGET_LUFS = -16.0
+TARGET_LUFS_RANGE = (-70.0, -5.0)
+TARGET_TRUE_PEAK = -1.5
+TARGET_LRA = 11.0
+# 各版本loudnorm都接受的最大响度范围，超过时线性归一化会退化为动态压缩
+MAX_TARGET_LRA = 20.0
+# ebur128的绝对门限，低于该值的音频视为静音，不做归一化
+SILENT_LUFS = -70.0
+
+# 错误输出中ebur128的汇总与astats的整体统计
+_SUMMARY = re.compile(r"Summary:\s*$", re.MULTILINE)
+_INTEGRATED = re.compile(r"I:\s+(\S+) LUFS\s+Threshold:\s+(\S+) LUFS")
+_RANGE = re.compile(r"LRA:\s+(\S+) LU\b")
+_TRUE_PEAK = re.compile(r"Peak:\s+(\S+) dBFS")
+_SAMPLE_PEAK = re.compile(r"Peak level dB: (\S+)")
+_RMS = re.compile(r"RMS level dB: (\S+)")
+
+
+@dataclass
+class LoudnessMeasurement:
+    integrated_lufs: Optional[float]
+    threshold_lufs: Optional[float]
+    loudness_range_lu: Optional[float]
+    true_peak_dbtp: Optional[float]
+    sample_peak_dbfs: Optional[float]
+    rms_dbfs: Optional[float]
+    silence_seconds: float
+    silence_ratio: float
+
+    @property
+    def silent(self) -> bool:
+        return self.integrated_lufs is None or self.integrated_lufs <= SILENT_LUFS
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def _number(match: Optional[re.Match], group: int = 1) -> Optional[float]:
+    """解析测量值，-inf（完全静音）与缺失的值返回None，使结果可以写入JSON"""
+    if match is None:
+        return None
+    try:
+        value = float(match.group(group))
+    except ValueError:
+        return None
+    return value if value not in (float('inf'), float('-inf')) else None
+
+
+def add_analysis(command: Command, silence_path: str) -> None:
+    """在命令中加入测量分支：第一条音频流解码后依次经过各测量滤镜，输出丢弃"""
+    measured = command.chain(
+        '0:a',
+        filter_spec('ebur128', peak='true', framelog='quiet'),
+        filter_spec('astats', measure_perchannel='none'),
+        SILENCE_DETECT,
+        filter_spec('ametadata', mode='print', file=silence_path)
+    )
+    command.output(os.devnull, measured, f='null')
+
+
+def parse_analysis(stderr: str, silence_path: str, duration: float) -> LoudnessMeasurement:
+    """从ffmpeg错误输出的末尾与静音文件中读取测量结果，到结尾仍未结束的静音计到duration为止"""
+    summary = list(_SUMMARY.finditer(stderr))
+    ebur128 = stderr[summary[-1].end():] if summary else ""
+    integrated = _INTEGRATED.search(ebur128)
+    silences = parse_silences(silence_path, until=duration)
+    silence_seconds = sum(end - start for start, end in silences)
+    return LoudnessMeasurement(
+        integrated_lufs=_number(integrated, 1),
+        threshold_lufs=_number(integrated, 2),
+        loudness_range_lu=_number(_RANGE.search(ebur128)),
+        true_peak_dbtp=_number(_TRUE_PEAK.search(ebur128)),
+        sample_peak_dbfs=_number(_SAMPLE_PEAK.search(stderr)),
+        rms_dbfs=_number(_RMS.search(stderr)),
+        silence_seconds=round(silence_seconds, 3),
+        silence_ratio=round(min(1.0, silence_seconds / duration), 4) if duration > 0 else 0.0
+    )
+
+
+def loudnorm_filter(measurement: LoudnessMeasurement, target_lufs: float) -> str:
+    """使用已有测量值的线性loudnorm，只调整增益而不做动态压缩"""
+    lra = min(max(TARGET_LRA, measurement.loudness_range_lu or 0.0), MAX_TARGET_LRA)
+    return filter_spec(
+        'loudnorm',
+        I=target_lufs,
+        TP=TARGET_TRUE_PEAK,
+        LRA=lra,
+        measured_I=measurement.integrated_lufs,
+        measured_TP=measurement.true_peak_dbtp if measurement.true_peak_dbtp is not None else SILENT_LUFS,
+        measured_LRA=measurement.loudness_range_lu or 0.0,
+        measured_thresh=measurement.threshold_lufs if measurement.threshold_lufs is not None else SILENT_LUFS,
+        linear='true'
+    )
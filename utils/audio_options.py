@@ -0,0 +1,144 @@
+"""
+音频输出属性（audio_attrs）的解析与校验：在读取输入之前按固定的选项表检查，解析结果按属性字符串缓存
+"""
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any
+import ast
+import re
+
+# 属性字符串的最大长度，超出时不解析
+MAX_ATTRS_LENGTH = 1024
+
+# 允许在af中使用的音频滤镜，不包含可以读取文件或网络的源滤镜（如amovie）
+ALLOWED_AUDIO_FILTERS = {
+    'acompressor', 'adelay', 'afade', 'aformat', 'apad', 'aresample', 'areverse', 'asetrate', 'atempo', 'atrim',
+    'bandpass', 'bandreject', 'bass', 'dynaudnorm', 'equalizer', 'highpass', 'loudnorm', 'lowpass', 'pan',
+    'silenceremove', 'treble', 'volume'
+}
+
+SAMPLE_FORMATS = {'u8', 's16', 's32', 'flt', 'dbl', 's64', 'u8p', 's16p', 's32p', 'fltp', 'dblp', 's64p'}
+
+_BITRATE = re.compile(r"^(\d+(?:\.\d+)?)([kKmM]?)$")
+_FILTER = re.compile(r"^([a-z0-9_]+)(?:=(.*))?$")
+
+
+class AudioOptionsError(ValueError):
+    """audio_attrs 包含无法识别或取值无效的选项"""
+
+
+def _int_range(low: int, high: int) -> Callable[[Any], int]:
+    def validate(value: Any) -> int:
+        if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+            raise ValueError(f"must be an integer between {low} and {high}")
+        number = int(value)
+        if not low <= number <= high:
+            raise ValueError(f"must be between {low} and {high}")
+        return number
+    return validate
+
+
+def _quality(value: Any) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("must be a number between 0 and 10")
+    if isinstance(value, bool) or not 0 <= number <= 10:
+        raise ValueError("must be a number between 0 and 10")
+    return number
+
+
+def _bitrate(value: Any) -> str:
+    """接受比特每秒的整数或带k/M后缀的字符串，统一为ffmpeg的写法"""
+    match = _BITRATE.match(str(value).strip()) if not isinstance(value, bool) else None
+    if not match:
+        raise ValueError("must be a bitrate such as 128k or 128000")
+    scale = {'': 1, 'k': 1000, 'm': 1000000}[match.group(2).lower()]
+    bits = float(match.group(1)) * scale
+    if not 8000 <= bits <= 1536000:
+        raise ValueError("must be between 8k and 1536k")
+    return f"{bits / 1000:g}k"
+
+
+def _sample_fmt(value: Any) -> str:
+    if value not in SAMPLE_FORMATS:
+        raise ValueError(f"must be one of {', '.join(sorted(SAMPLE_FORMATS))}")
+    return value
+
+
+def _filters(value: Any) -> str:
+    """只允许由白名单滤镜组成的线性滤镜链，不允许多输入输出的滤镜图"""
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("must be a filter chain such as 'volume=0.5,highpass=f=200'")
+    if any(char in value for char in ';[]\n'):
+        raise ValueError("must be a single filter chain without labels or ';'")
+    for part in value.split(','):
+        match = _FILTER.match(part.strip())
+        if not match:
+            raise ValueError(f"contains an invalid filter '{part.strip()}'")
+        if match.group(1) not in ALLOWED_AUDIO_FILTERS:
+            raise ValueError(
+                f"uses unsupported filter '{match.group(1)}'; allowed filters: {', '.join(sorted(ALLOWED_AUDIO_FILTERS))}"
+            )
+    return value.strip()
+
+
+# 选项名 -> (ffmpeg输出参数名, 校验与规范化函数)
+AUDIO_OPTION_SCHEMA: dict[str, tuple[str, Callable[[Any], Any]]] = {
+    'ar': ('ar', _int_range(8000, 384000)),
+    'ac': ('ac', _int_range(1, 8)),
+    'b:a': ('b:a', _bitrate),
+    'q:a': ('q:a', _quality),
+    'af': ('af', _filters),
+    'sample_fmt': ('sample_fmt', _sample_fmt),
+    'compression_level': ('compression_level', _int_range(0, 12))
+}
+
+# 与ffmpeg命令行一致的别名
+AUDIO_OPTION_ALIASES = {'ab': 'b:a', 'aq': 'q:a', 'filter:a': 'af'}
+
+
+@lru_cache(maxsize=256)
+def _parse(audio_attrs: str) -> tuple[tuple[str, Any], ...]:
+    if len(audio_attrs) > MAX_ATTRS_LENGTH:
+        raise AudioOptionsError(f"Audio attributes are longer than {MAX_ATTRS_LENGTH} characters")
+    try:
+        # 只接受字面量字典，不执行任何表达式
+        tree = ast.parse("{" + audio_attrs + "}", mode="eval")
+    except SyntaxError:
+        raise AudioOptionsError(f"Audio attributes must look like \"'ar': 16000, 'ac': 1\", got: {audio_attrs}")
+    if not isinstance(tree.body, ast.Dict):
+        raise AudioOptionsError(f"Audio attributes must look like \"'ar': 16000, 'ac': 1\", got: {audio_attrs}")
+
+    options: dict[str, Any] = {}
+    for key_node, value_node in zip(tree.body.keys, tree.body.values):
+        if not isinstance(key_node, ast.Constant) or not isinstance(key_node.value, str):
+            raise AudioOptionsError("Audio attribute names must be quoted strings")
+        # 负数在语法树中是一元运算，取值范围由各选项的校验函数检查
+        if (isinstance(value_node, ast.UnaryOp) and isinstance(value_node.op, ast.USub)
+                and isinstance(value_node.operand, ast.Constant) and isinstance(value_node.operand.value, (int, float))):
+            value_node = ast.Constant(-value_node.operand.value)
+        if not isinstance(value_node, ast.Constant):
+            raise AudioOptionsError(f"Audio attribute '{key_node.value}' must be a number or a string")
+        name = AUDIO_OPTION_ALIASES.get(key_node.value, key_node.value)
+        if name not in AUDIO_OPTION_SCHEMA:
+            raise AudioOptionsError(
+                f"Unsupported audio attribute '{key_node.value}'. Supported attributes: "
+                f"{', '.join([*AUDIO_OPTION_SCHEMA, *AUDIO_OPTION_ALIASES])}"
+            )
+        if name in options:
+            raise AudioOptionsError(f"Audio attribute '{key_node.value}' is given more than once")
+        output_name, validate = AUDIO_OPTION_SCHEMA[name]
+        try:
+            options[output_name] = validate(value_node.value)
+        except ValueError as e:
+            raise AudioOptionsError(f"Audio attribute '{key_node.value}' {e}")
+    return tuple(options.items())
+
+
+def parse_audio_attrs(audio_attrs: str) -> dict[str, Any]:
+    """解析形如 "'ar': 16000, 'ac': 1" 的属性字符串，返回ffmpeg输出参数，无效时抛出 AudioOptionsError"""
+    audio_attrs = (audio_attrs or "").strip()
+    if not audio_attrs:
+        return {}
+    return dict(_parse(audio_attrs))
@@ -0,0 +1,190 @@
+"""
+按内容寻址的结果缓存，所有工具共享
+"""
+from collections.abc import Generator
+from dataclasses import dataclass
+from typing import Any, Optional
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import yaml
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.media_io import stream_blob
+from utils.metrics import InvocationMetrics
+
+# 缓存总容量上限取 manifest.yaml 中声明的存储配额 resource.permission.storage.size，读取失败时使用该值
+DEFAULT_MAX_BYTES = 268435456
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "manifest.yaml")
+
+META_FILENAME = "meta.json"
+DATA_FILENAME = "data"
+
+
+def storage_budget(manifest_path: str = MANIFEST_PATH) -> int:
+    """返回 manifest.yaml 中声明的插件存储配额（字节）"""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = yaml.safe_load(f) or {}
+        return int(manifest["resource"]["permission"]["storage"]["size"])
+    except (OSError, KeyError, TypeError, ValueError, yaml.YAMLError):
+        return DEFAULT_MAX_BYTES
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    meta: dict[str, Any]
+    data_path: Optional[str] = None
+
+
+class ResultCache:
+    """磁盘结果缓存，键为输入内容哈希加规范化后的工具参数，超出容量时按LRU淘汰"""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = root or os.environ.get(
+            "FFMPEG_CACHE_DIR", os.path.join(tempfile.gettempdir(), "dify_ffmpeg_cache")
+        )
+        # 环境变量只能调低上限，缓存总量不超过声明的存储配额
+        budget = storage_budget()
+        self.max_bytes = min(budget, max_bytes or int(os.environ.get("FFMPEG_CACHE_MAX_BYTES", budget)))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(tool_name: str, content_hash: str, params: dict[str, Any]) -> str:
+        """根据工具名、内容哈希和参数生成缓存键"""
+        normalized = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{tool_name}\0{content_hash}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """查询缓存，命中时刷新LRU时间戳"""
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, META_FILENAME)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        data_path = os.path.join(entry_dir, DATA_FILENAME)
+        if not os.path.exists(data_path):
+            data_path = None
+            if meta.get("has_data"):
+                with self._lock:
+                    self.misses += 1
+                return None
+
+        now = time.time()
+        try:
+            os.utime(meta_path, (now, now))
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+        return CacheEntry(key=key, meta=meta, data_path=data_path)
+
+    def put(self, key: str, meta: dict[str, Any], data_path: Optional[str] = None) -> None:
+        """写入缓存，失败时静默忽略，不影响工具主流程"""
+        try:
+            data_size = os.path.getsize(data_path) if data_path else 0
+            if data_size > self.max_bytes:
+                return
+
+            entry_dir = self._entry_dir(key)
+            staging_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+            os.makedirs(staging_dir, exist_ok=True)
+
+            if data_path:
+                staged_data = os.path.join(staging_dir, DATA_FILENAME)
+                try:
+                    # 同一文件系统下使用硬链接，避免额外的磁盘拷贝
+                    os.link(data_path, staged_data)
+                except OSError:
+                    shutil.copyfile(data_path, staged_data)
+
+            with open(os.path.join(staging_dir, META_FILENAME), "w", encoding="utf-8") as f:
+                json.dump({**meta, "has_data": bool(data_path)}, f)
+
+            with self._lock:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(staging_dir, entry_dir)
+                self._evict()
+        except OSError:
+            shutil.rmtree(f"{self._entry_dir(key)}.{os.getpid()}.{threading.get_ident()}.tmp", ignore_errors=True)
+
+    def _evict(self) -> None:
+        """按最近使用时间淘汰旧条目，直到总容量低于上限"""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.is_dir() or entry.name.endswith(".tmp"):
+                    continue
+                size = 0
+                last_used = 0.0
+                for f in os.scandir(entry.path):
+                    stat = f.stat()
+                    size += stat.st_size
+                    if f.name == META_FILENAME:
+                        last_used = stat.st_mtime
+                entries.append((last_used, size, entry.path))
+                total += size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def stats(self, hit: bool) -> dict[str, Any]:
+        """返回用于JSON输出的命中统计"""
+        return {"hit": hit, "hits": self.hits, "misses": self.misses}
+
+
+def replay(
+    tool: Tool, entry: CacheEntry, cache_stats: dict[str, Any], metrics: Optional[InvocationMetrics] = None
+) -> Generator[ToolInvokeMessage, None, None]:
+    """将缓存条目重新生成为工具消息
+
+    消息顺序与首次调用相同；首次结果中只对本次调用有意义的字段（调度、内存等）保留为null
+    """
+    result = {
+        **{key: None for key in entry.meta.get("invocation_keys", ())},
+        **entry.meta["json"],
+        "cache": cache_stats
+    }
+    if entry.data_path:
+        if metrics is None:
+            yield from stream_blob(entry.data_path, entry.meta.get("blob_meta"))
+        else:
+            with metrics.stage("emit") as stage:
+                stage.bytes_out = os.path.getsize(entry.data_path)
+                yield from stream_blob(entry.data_path, entry.meta.get("blob_meta"))
+
+    if metrics is not None:
+        result["metrics"] = metrics.emit("success")
+    for kind in entry.meta.get("order", ("json", "text")):
+        if kind == "json":
+            yield tool.create_json_message(result)
+        elif entry.meta.get("text"):
+            yield tool.create_text_message(entry.meta["text"])
+
+
+result_cache = ResultCache()
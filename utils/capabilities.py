@@ -0,0 +1,219 @@
+"""
+FFmpeg能力探测：记录当前构建可用的编码器、封装器与编解码器，结果缓存在磁盘上
+"""
+from dataclasses import dataclass
+from typing import Any, Optional
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+# 目标格式对应的封装器
+FORMAT_MUXERS = {
+    'mp4': 'mp4',
+    'm4v': 'ipod',
+    'mov': 'mov',
+    '3gp': '3gp',
+    'mkv': 'matroska',
+    'webm': 'webm',
+    'avi': 'avi',
+    'flv': 'flv',
+    'wmv': 'asf'
+}
+
+# 各容器兼容的视频编码器，按速度从快到慢排列
+VIDEO_ENCODERS_BY_FORMAT = {
+    'mp4': ['libx264', 'libopenh264', 'mpeg4'],
+    'm4v': ['libx264', 'libopenh264', 'mpeg4'],
+    'mov': ['libx264', 'libopenh264', 'mpeg4'],
+    '3gp': ['libx264', 'mpeg4', 'h263'],
+    'mkv': ['libx264', 'libopenh264', 'mpeg4'],
+    'webm': ['libvpx', 'libvpx-vp9', 'libsvtav1', 'libaom-av1'],
+    'avi': ['mpeg4', 'libx264', 'mjpeg'],
+    'flv': ['libx264', 'flv'],
+    'wmv': ['wmv2', 'wmv1', 'msmpeg4']
+}
+
+# 各容器兼容的音频编码器，按速度从快到慢排列
+AUDIO_ENCODERS_BY_FORMAT = {
+    'mp4': ['aac', 'libfdk_aac', 'libmp3lame'],
+    'm4v': ['aac', 'libfdk_aac'],
+    'mov': ['aac', 'libfdk_aac', 'pcm_s16le'],
+    '3gp': ['aac', 'libfdk_aac'],
+    'mkv': ['aac', 'libopus', 'libvorbis', 'libmp3lame'],
+    'webm': ['libopus', 'libvorbis'],
+    'avi': ['libmp3lame', 'ac3', 'pcm_s16le'],
+    'flv': ['aac', 'libmp3lame'],
+    'wmv': ['wmav2', 'wmav1']
+}
+
+# 音频提取格式可用的编码器，按优先级排列
+AUDIO_FORMAT_ENCODERS = {
+    'mp3': ['libmp3lame', 'libshine'],
+    'aac': ['aac', 'libfdk_aac'],
+    'wav': ['pcm_s16le'],
+    'ogg': ['libvorbis', 'libopus'],
+    'flac': ['flac']
+}
+
+# 自动选择编码器时附加的提速参数
+ENCODER_SPEED_ARGS = {
+    'libx264': {'preset:v': 'veryfast'},
+    'libvpx': {'deadline': 'realtime', 'cpu-used': 8},
+    'libvpx-vp9': {'deadline': 'realtime', 'cpu-used': 8, 'row-mt': 1},
+    'libsvtav1': {'preset:v': 12},
+    'libaom-av1': {'cpu-used': 8, 'row-mt': 1}
+}
+
+CODEC_TYPES = {'V': 'video', 'A': 'audio', 'S': 'subtitle', 'D': 'data', 'T': 'attachment'}
+
+
+class CapabilityError(Exception):
+    """当前FFmpeg构建缺少完成请求所需的编码器或封装器"""
+
+
+@dataclass
+class Capabilities:
+    # 编码器名 -> {"type": 流类型, "experimental": 是否为实验性编码器}
+    encoders: dict[str, dict[str, Any]]
+    muxers: list[str]
+    # 编解码器名 -> {"type": 流类型, "encoders": 可用的编码器}
+    codecs: dict[str, dict[str, Any]]
+
+    def has_encoder(self, name: str) -> bool:
+        """编码器存在且不是实验性的"""
+        encoder = self.encoders.get(name)
+        return bool(encoder) and not encoder.get("experimental")
+
+    def has_muxer(self, name: str) -> bool:
+        return name in self.muxers
+
+    def pick_encoder(self, candidates: list[str]) -> Optional[str]:
+        """返回候选列表中第一个可用的编码器"""
+        return next((name for name in candidates if self.has_encoder(name)), None)
+
+    def transcode_args(self, target_format: str, codec_type: str) -> dict[str, Any]:
+        """为目标容器选择最快的可用编码器，返回对应的输出参数"""
+        candidates = (VIDEO_ENCODERS_BY_FORMAT if codec_type == 'video' else AUDIO_ENCODERS_BY_FORMAT).get(
+            target_format, []
+        )
+        encoder = self.pick_encoder(candidates)
+        if encoder is None:
+            raise CapabilityError(f"No available {codec_type} encoder for {target_format} in this FFmpeg build")
+        return {f"c:{codec_type[0]}": encoder, **ENCODER_SPEED_ARGS.get(encoder, {})}
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"encoders": self.encoders, "muxers": self.muxers, "codecs": self.codecs}
+
+
+def _run_ffmpeg(flag: str) -> list[str]:
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', flag], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0:
+        raise CapabilityError(f"ffmpeg {flag} failed: {result.stderr.strip()}")
+    # 跳过说明部分，只保留分隔线之后的列表
+    lines = result.stdout.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip().startswith('--'):
+            return lines[i + 1:]
+    return lines
+
+
+def probe_capabilities() -> Capabilities:
+    """调用 ffmpeg -encoders/-muxers/-codecs 解析当前构建的能力"""
+    encoders = {}
+    for line in _run_ffmpeg('-encoders'):
+        parts = line.split(None, 2)
+        if len(parts) < 2 or len(parts[0]) != 6:
+            continue
+        flags, name = parts[0], parts[1]
+        encoders[name] = {"type": CODEC_TYPES.get(flags[0], "other"), "experimental": flags[3] == 'X'}
+
+    muxers = []
+    for line in _run_ffmpeg('-muxers'):
+        parts = line.split(None, 2)
+        if len(parts) >= 2 and 'E' in parts[0]:
+            # 部分封装器以逗号分隔列出多个名称
+            muxers.extend(parts[1].split(','))
+
+    codecs = {}
+    for line in _run_ffmpeg('-codecs'):
+        parts = line.split(None, 2)
+        if len(parts) < 2 or len(parts[0]) != 6:
+            continue
+        flags, name = parts[0], parts[1]
+        codec_encoders = []
+        if flags[1] == 'E':
+            description = parts[2] if len(parts) > 2 else ""
+            marker = "(encoders:"
+            if marker in description:
+                codec_encoders = description.split(marker, 1)[1].split(")", 1)[0].split()
+            else:
+                codec_encoders = [name]
+        codecs[name] = {"type": CODEC_TYPES.get(flags[2], "other"), "encoders": codec_encoders}
+
+    return Capabilities(encoders=encoders, muxers=sorted(set(muxers)), codecs=codecs)
+
+
+class CapabilityCache:
+    """能力探测只在FFmpeg二进制变化时重新执行，结果保存在磁盘上供后续进程复用"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get(
+            "FFMPEG_CAPABILITIES_CACHE", os.path.join(tempfile.gettempdir(), "dify_ffmpeg_capabilities.json")
+        )
+        self._lock = threading.Lock()
+        self._capabilities: Optional[Capabilities] = None
+
+    @staticmethod
+    def _fingerprint() -> Optional[dict[str, Any]]:
+        """FFmpeg二进制的路径、大小与修改时间，任一变化都说明构建已更换"""
+        binary = shutil.which('ffmpeg')
+        if binary is None:
+            return None
+        binary = os.path.realpath(binary)
+        stat = os.stat(binary)
+        return {"path": binary, "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def get(self) -> Capabilities:
+        """返回当前构建的能力，依次使用内存、磁盘缓存，都没有时重新探测"""
+        with self._lock:
+            if self._capabilities is not None:
+                return self._capabilities
+
+            fingerprint = self._fingerprint()
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("binary") == fingerprint:
+                    self._capabilities = Capabilities(
+                        encoders=data["encoders"], muxers=data["muxers"], codecs=data["codecs"]
+                    )
+                    return self._capabilities
+            except (OSError, ValueError, KeyError):
+                pass
+
+            return self._probe(fingerprint)
+
+    def refresh(self) -> Capabilities:
+        """忽略缓存重新探测"""
+        with self._lock:
+            return self._probe(self._fingerprint())
+
+    def _probe(self, fingerprint: Optional[dict[str, Any]]) -> Capabilities:
+        capabilities = probe_capabilities()
+        self._capabilities = capabilities
+        try:
+            staging_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(staging_path, "w", encoding="utf-8") as f:
+                json.dump({"binary": fingerprint, **capabilities.to_dict()}, f)
+            os.replace(staging_path, self.path)
+        except OSError:
+            pass
+        return capabilities
+
+
+capability_cache = CapabilityCache()
@@ -0,0 +1,163 @@
+"""
+分块并行编码：在关键帧处切分输入，各分块并行编码后无损拼接
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from collections.abc import Sequence
+from typing import Any, Optional
+import os
+import shutil
+import tempfile
+import time
+
+from utils.command import Command
+from utils.metrics import InvocationMetrics
+from utils.probe import KeyframeIndex
+from utils.scheduler import JobTicket, PRIORITY_COPY, PRIORITY_ENCODE, scheduler
+
+# 分块可以用concat demuxer无损拼接的容器
+CHUNKABLE_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.mkv', '.webm'}
+
+# 每个分块的最短时长（秒），分块过短会增加码率开销
+MIN_CHUNK_SECONDS = 2.0
+
+# 等分点前后该比例的分块时长内有位于场景切换处的关键帧时优先在那里切分，码率控制的重启落在镜头切换上不易察觉
+SCENE_SNAP_FRACTION = 0.25
+# 关键帧与场景切换的时间相差不超过该值（秒）时视为同一位置
+SCENE_KEYFRAME_TOLERANCE = 0.1
+
+
+@dataclass
+class Chunk:
+    index: int
+    # 分块起点的关键帧时间（秒）
+    start: float
+    # 分块包含的帧数，最后一块为None表示编码到结尾
+    frames: Optional[int]
+    # 分块终点的时间（秒），最后一块为整个视频的时长
+    end: float = 0.0
+    # 按复杂度分配的视频码率，None表示使用统一的编码参数
+    bitrate: Optional[int] = None
+    # 分块内源视频码率相对全片平均值的比值，使用场景索引时才有
+    complexity: Optional[float] = None
+    seconds: float = 0.0
+    wait_seconds: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        data = {
+            "index": self.index,
+            "start": self.start,
+            "end": self.end,
+            "frames": self.frames,
+            "seconds": round(self.seconds, 4),
+            "wait_seconds": round(self.wait_seconds, 4)
+        }
+        if self.complexity is not None:
+            data["complexity"] = round(self.complexity, 3)
+        if self.bitrate is not None:
+            data["bitrate"] = self.bitrate
+        return data
+
+
+def _on_scene_cut(seconds: float, scene_cuts: Sequence[float]) -> bool:
+    return any(abs(cut - seconds) <= SCENE_KEYFRAME_TOLERANCE for cut in scene_cuts)
+
+
+def plan_chunks(keyframes: KeyframeIndex, duration: float, count: int,
+                scene_cuts: Sequence[float] = ()) -> list[Chunk]:
+    """在最接近等分点的关键帧处切分，返回少于两块时表示不值得分块
+
+    传入场景切换时间时，等分点附近位于场景切换处的关键帧优先
+    """
+    count = min(count, int(duration // MIN_CHUNK_SECONDS))
+    if count < 2 or len(keyframes.times) < 2:
+        return []
+
+    window = duration / count * SCENE_SNAP_FRACTION
+    boundaries = [0]
+    for i in range(1, count):
+        target = duration * i / count
+        candidates = [
+            k for k, t in enumerate(keyframes.times) if abs(t - target) <= window and _on_scene_cut(t, scene_cuts)
+        ] if scene_cuts else []
+        nearest = min(candidates or range(len(keyframes.times)), key=lambda k: abs(keyframes.times[k] - target))
+        if nearest > boundaries[-1]:
+            boundaries.append(nearest)
+    if len(boundaries) < 2:
+        return []
+
+    chunks = []
+    for n, first in enumerate(boundaries):
+        if n + 1 < len(boundaries):
+            # 第一块从文件开头计数，包含关键帧之前可能存在的包
+            frames = keyframes.packet_indexes[boundaries[n + 1]] - (0 if n == 0 else keyframes.packet_indexes[first])
+        else:
+            frames = None
+        end = keyframes.times[boundaries[n + 1]] if n + 1 < len(boundaries) else duration
+        chunks.append(Chunk(index=n, start=0.0 if n == 0 else keyframes.times[first], frames=frames, end=end))
+    return chunks
+
+
+def encode_chunked(in_path: str, out_path: str, chunks: list[Chunk], encode_args: dict[str, Any],
+                   has_audio: bool, workers: int, metrics: Optional[InvocationMetrics] = None,
+                   audio_args: Optional[dict[str, Any]] = None) -> JobTicket:
+    """并行编码各分块的视频，再与原始音频一起无损拼接为输出文件，返回拼接任务的调度信息
+
+    分块指定了码率时覆盖encode_args中的码率设置；audio_args为拼接时的音频编码参数
+    """
+    extension = os.path.splitext(out_path)[1]
+    # 中间文件与输出放在同一目录下，随调用的工作区一起清理
+    work_dir = tempfile.mkdtemp(prefix="chunked_encode_", dir=os.path.dirname(out_path) or None)
+
+    def run(command: Command, stage_name: str, expected_seconds: float) -> None:
+        # 传入metrics时每个分块与拼接各记为一个阶段
+        if metrics is None:
+            command.run()
+            return
+        with metrics.stage(stage_name) as stage:
+            stage.run(command, expected_seconds=expected_seconds)
+
+    try:
+        def encode(chunk: Chunk) -> str:
+            chunk_path = os.path.join(work_dir, f"chunk{chunk.index:04d}{extension}")
+            output_args = {'an': None, 'sn': None, **encode_args}
+            if chunk.frames is not None:
+                # 按帧数而不是时间截止，保证分块之间既不重叠也不缺帧
+                output_args['frames:v'] = chunk.frames
+            if chunk.bitrate is not None:
+                # 与两遍编码相同，限制峰值码率避免简单画面下超出分配的码率
+                output_args.update({'b:v': chunk.bitrate, 'maxrate': chunk.bitrate, 'bufsize': chunk.bitrate * 2})
+            # 每个分块单独申请槽位，并发数仍受插件级调度器限制
+            with scheduler.job(PRIORITY_ENCODE) as ticket:
+                started = time.monotonic()
+                run(
+                    Command()
+                    .input(in_path, ss=chunk.start)
+                    .output(chunk_path, threads=ticket.threads, **output_args),
+                    f"encode_chunk{chunk.index}",
+                    chunk.end - chunk.start
+                )
+            chunk.seconds = time.monotonic() - started
+            chunk.wait_seconds = ticket.wait_seconds
+            return chunk_path
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            chunk_paths = list(pool.map(encode, chunks))
+
+        list_path = os.path.join(work_dir, "chunks.txt")
+        with open(list_path, 'w') as f:
+            for chunk_path in chunk_paths:
+                f.write(f"file '{chunk_path}'\n")
+
+        command = Command().input(list_path, f='concat', safe=0)
+        streams = ['0:v']
+        if has_audio:
+            # 音频很快，与单次编码一样使用容器默认的编码器整体处理
+            command.input(in_path)
+            streams.append('1:a')
+
+        with scheduler.job(PRIORITY_COPY) as ticket:
+            run(command.output(out_path, *streams, **{'c:v': 'copy', **(audio_args or {})}), "concat", chunks[-1].end)
+        return ticket
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,151 @@
+"""
+ffmpeg命令构建与运行：输入、滤镜链与输出直接拼接为参数列表，不构建节点图；错误输出只保留末尾部分
+"""
+from collections import deque
+from typing import Any, Iterable, Union
+import subprocess
+
+# 命令行前缀。-hide_banner避免版本信息混入错误输出末尾，-benchmark让ffmpeg在结束时报告自身的CPU时间与峰值内存，-progress把进度写到标准输出
+PROGRESS_PREFIX = ('ffmpeg', '-hide_banner', '-benchmark', '-nostats', '-progress', 'pipe:1')
+# 不读取进度时标准输出直接丢弃
+QUIET_PREFIX = ('ffmpeg', '-hide_banner', '-nostats')
+
+# 只保留ffmpeg错误输出的末尾部分，长时间编码时内存占用不随时长增长
+STDERR_TAIL_BYTES = 64 * 1024
+
+# 滤镜参数与整个滤镜描述中需要转义的字符，与ffmpeg滤镜图的两级转义规则一致
+_OPTION_SPECIAL = "\\'=:"
+_GRAPH_SPECIAL = "\\'[],;"
+
+
+class FFmpegError(Exception):
+    """ffmpeg以非零状态退出，stderr为错误输出的末尾部分"""
+
+    def __init__(self, returncode: int, stderr: bytes):
+        self.returncode = returncode
+        self.stderr = stderr
+        detail = ""
+        for line in reversed(stderr.decode('utf-8', errors='replace').splitlines()):
+            line = line.strip()
+            if line and not line.startswith("bench:"):
+                detail = line
+                break
+        super().__init__(f"ffmpeg exited with code {returncode}" + (f": {detail}" if detail else ""))
+
+
+def _escape(text: Any, chars: str) -> str:
+    text = str(text)
+    for ch in chars:
+        if ch in text:
+            text = text.replace(ch, '\\' + ch)
+    return text
+
+
+def options(mapping: dict[str, Any]) -> list[str]:
+    """把选项字典转为命令行参数，值为None的选项只输出开关
+
+    按选项名排序输出，c 总是在 c:v、c:a 之前，更具体的流选择符覆盖通用的设置
+    """
+    args = []
+    for key in sorted(mapping):
+        args.append('-' + key)
+        value = mapping[key]
+        if value is not None:
+            args.append(str(value))
+    return args
+
+
+def filter_spec(name: str, *args: Any, **kwargs: Any) -> str:
+    """单个滤镜的描述，如 filter_spec('scale', 320, -2) -> 'scale=320:-2'
+
+    参数不变的滤镜可以在模块加载时预先生成，每次调用直接复用
+    """
+    params = [_escape(arg, _OPTION_SPECIAL) for arg in args]
+    params += [f"{_escape(key, _OPTION_SPECIAL)}={_escape(value, _OPTION_SPECIAL)}" for key, value in kwargs.items()]
+    spec = _escape(name, _OPTION_SPECIAL) + ('=' + ':'.join(params) if params else '')
+    return _escape(spec, _GRAPH_SPECIAL)
+
+
+def _label(stream: str) -> str:
+    return stream if stream.startswith('[') else f"[{stream}]"
+
+
+class Command:
+    """一条ffmpeg命令
+
+    流用字符串表示：输入流为按添加顺序编号的 "0:v"、"1:a" 等流选择符，滤镜输出为 chain/split 返回的 "[s0]" 等标签
+    """
+
+    __slots__ = ('_global', '_inputs', '_filters', '_label_count', '_outputs')
+
+    def __init__(self, *global_args: str):
+        self._global = list(global_args)
+        self._inputs: list[str] = []
+        self._filters: list[str] = []
+        self._label_count = 0
+        self._outputs: list[str] = []
+
+    def input(self, path: str, **input_options: Any) -> "Command":
+        """添加输入，选项作用于该输入（如 ss、f）"""
+        self._inputs += options(input_options)
+        self._inputs += ('-i', path)
+        return self
+
+    def _new_labels(self, count: int) -> list[str]:
+        labels = [f"[s{self._label_count + i}]" for i in range(count)]
+        self._label_count += count
+        return labels
+
+    def chain(self, sources: Union[str, Iterable[str]], *filters: str) -> str:
+        """添加一条滤镜链（filter_spec生成的各滤镜依次相连），返回输出标签"""
+        sources = [sources] if isinstance(sources, str) else sources
+        label = self._new_labels(1)[0]
+        self._filters.append(''.join(_label(source) for source in sources) + ','.join(filters) + label)
+        return label
+
+    def split(self, source: str, count: int, audio: bool = False) -> list[str]:
+        """把一路流复制为count路，返回各路的标签"""
+        labels = self._new_labels(count)
+        name = 'asplit' if audio else 'split'
+        self._filters.append(f"{_label(source)}{name}={count}{''.join(labels)}")
+        return labels
+
+    def output(self, path: str, *streams: str, **output_options: Any) -> "Command":
+        """添加输出，指定流时按顺序映射，否则由ffmpeg自动选择"""
+        for stream in streams:
+            self._outputs += ('-map', stream)
+        self._outputs += options(output_options)
+        self._outputs.append(path)
+        return self
+
+    def compile(self, prefix: tuple[str, ...] = QUIET_PREFIX) -> list[str]:
+        """返回完整的参数列表，总是覆盖已有输出"""
+        args = [*prefix, *self._global, *self._inputs]
+        if self._filters:
+            args += ('-filter_complex', ';'.join(self._filters))
+        args += self._outputs
+        args.append('-y')
+        return args
+
+    def run(self) -> str:
+        """不读取进度时运行：标准输出丢弃，错误输出只保留末尾并返回，失败时抛出 FFmpegError"""
+        process = subprocess.Popen(
+            self.compile(), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        err = read_tail(process.stderr)
+        process.wait()
+        if process.returncode != 0:
+            raise FFmpegError(process.returncode, err)
+        return err.decode('utf-8', errors='replace')
+
+
+def read_tail(pipe, limit: int = STDERR_TAIL_BYTES) -> bytes:
+    """逐行读取到管道结束，只保留最后约limit字节的完整行"""
+    tail = deque()
+    size = 0
+    for line in pipe:
+        tail.append(line)
+        size += len(line)
+        while size > limit and len(tail) > 1:
+            size -= len(tail.popleft())
+    return b''.join(tail)
@@ -0,0 +1,144 @@
+"""
+时间预算与取消：超时或调用方放弃请求时终止ffmpeg进程组，可选返回已完成的部分结果
+"""
+from collections.abc import Generator
+from typing import Any, Optional
+import os
+import signal
+import threading
+import time
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.media_io import stream_blob
+
+# 单次调用的时间预算（秒），需小于 main.py 中的 MAX_REQUEST_TIMEOUT，为返回结果留出余量
+DEFAULT_BUDGET_SECONDS = float(os.environ.get("FFMPEG_DEADLINE_SECONDS", "100"))
+
+# 超时时先让ffmpeg正常结束并写完文件尾，返回已处理的部分
+PARTIAL_ON_TIMEOUT = os.environ.get("FFMPEG_PARTIAL_ON_TIMEOUT", "").lower() in ("1", "true", "yes")
+
+# 发送SIGINT后等待ffmpeg写完文件尾的时间，超过后强制结束
+GRACE_SECONDS = 5.0
+
+# 检查预算的间隔（秒）
+POLL_SECONDS = 0.2
+
+REASON_DEADLINE = "deadline"
+REASON_PROJECTED = "projected"
+REASON_CANCELLED = "cancelled"
+
+
+class DeadlineExceeded(Exception):
+    """处理超出时间预算或被取消"""
+
+    def __init__(self, reason: str, stage: str, elapsed: float, budget: float, finalized: bool = False,
+                 detail: str = ""):
+        self.reason = reason
+        self.stage = stage
+        self.elapsed = elapsed
+        self.budget = budget
+        # ffmpeg收到SIGINT后正常退出，输出文件是完整可用的前一部分
+        self.finalized = finalized
+        self.detail = detail
+        if reason == REASON_CANCELLED:
+            message = f"Processing was cancelled during {stage}"
+        elif reason == REASON_PROJECTED:
+            message = f"Processing was stopped during {stage}: it would not finish within the {budget:.0f} s time budget"
+        else:
+            message = f"Processing exceeded the {budget:.0f} s time budget during {stage}"
+        super().__init__(message + (f" ({detail})" if detail else ""))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "reason": self.reason,
+            "stage": self.stage,
+            "elapsed_seconds": round(self.elapsed, 2),
+            "budget_seconds": self.budget,
+            "partial": self.finalized
+        }
+
+
+class Deadline:
+    """一次调用的时间预算，可被提前取消"""
+
+    def __init__(self, budget_seconds: Optional[float] = None, partial: Optional[bool] = None):
+        self.budget_seconds = budget_seconds if budget_seconds is not None else DEFAULT_BUDGET_SECONDS
+        self.partial = PARTIAL_ON_TIMEOUT if partial is None else partial
+        self._started = time.monotonic()
+        self._cancelled = threading.Event()
+        self.reason: Optional[str] = None
+        self.detail = ""
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    def remaining(self) -> float:
+        return max(0.0, self.budget_seconds - self.elapsed())
+
+    def cancel(self, reason: str = REASON_CANCELLED, detail: str = "") -> None:
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self.detail = detail
+            self._cancelled.set()
+
+    @property
+    def stopped(self) -> bool:
+        if not self._cancelled.is_set() and self.remaining() <= 0:
+            self.cancel(REASON_DEADLINE)
+        return self._cancelled.is_set()
+
+    def error(self, stage: str, finalized: bool = False) -> DeadlineExceeded:
+        return DeadlineExceeded(
+            self.reason or REASON_DEADLINE, stage, self.elapsed(), self.budget_seconds, finalized, self.detail
+        )
+
+    def check(self, stage: str) -> None:
+        """已超时或被取消时抛出 DeadlineExceeded"""
+        if self.stopped:
+            raise self.error(stage)
+
+    def supervise(self, process, finished: threading.Event) -> Optional[bool]:
+        """在进程运行期间检查预算，超时或取消时结束整个进程组
+
+        进程正常结束时返回None，被终止时返回ffmpeg是否在宽限期内正常退出（输出文件完整）
+        """
+        while not finished.wait(min(POLL_SECONDS, max(self.remaining(), 0.01))):
+            if not self.stopped:
+                continue
+            # 部分结果只在预算耗尽时返回，调用方已放弃请求时直接结束
+            if self.partial and self.reason != REASON_CANCELLED:
+                _signal_group(process, signal.SIGINT)
+                if finished.wait(GRACE_SECONDS) or process.poll() is not None:
+                    return True
+            _signal_group(process, signal.SIGKILL)
+            return False
+        return None
+
+
+def _signal_group(process, sig: int) -> None:
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def timeout_messages(tool: Tool, error: DeadlineExceeded, metrics, partial_path: Optional[str] = None,
+                     blob_meta: Optional[dict[str, Any]] = None) -> Generator[ToolInvokeMessage, None, None]:
+    """返回超时的结构化错误，ffmpeg已写完部分输出时一并返回该文件"""
+    result = {
+        "status": "error",
+        "error": "timeout",
+        "message": str(error),
+        "deadline": error.to_dict()
+    }
+    if error.finalized and partial_path and os.path.exists(partial_path) and os.path.getsize(partial_path) > 0:
+        yield from stream_blob(partial_path, blob_meta)
+        result["status"] = "partial"
+        result["partial_size"] = os.path.getsize(partial_path)
+    else:
+        result["deadline"]["partial"] = False
+    result["metrics"] = metrics.emit(result["status"])
+    yield tool.create_text_message(result["message"])
+    yield tool.create_json_message(result)
@@ -0,0 +1,190 @@
+"""
+跳过多余工作的决策层：根据探测结果为每次调用选择代价最小的处理路径
+"""
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from utils.probe import ProbeResult
+
+# 处理路径，代价从低到高
+PATH_PASSTHROUGH = "passthrough"
+PATH_REMUX = "remux"
+PATH_STREAM_COPY = "stream_copy"
+PATH_TRANSCODE = "transcode"
+
+# 目标格式对应的ffprobe容器名，同一容器族的格式可以原样返回
+FORMAT_FAMILIES = {
+    'mp4': 'mov,mp4,m4a,3gp,3g2,mj2',
+    'm4v': 'mov,mp4,m4a,3gp,3g2,mj2',
+    'mov': 'mov,mp4,m4a,3gp,3g2,mj2',
+    '3gp': 'mov,mp4,m4a,3gp,3g2,mj2',
+    'mkv': 'matroska,webm',
+    'webm': 'matroska,webm',
+    'avi': 'avi',
+    'flv': 'flv',
+    'wmv': 'asf'
+}
+
+# 各容器可以直接复制的编码，None表示不限制
+CONTAINER_CODECS: dict[str, dict[str, Optional[set[str]]]] = {
+    'mp4': {
+        'video': {'h264', 'hevc', 'mpeg4', 'av1', 'vp9'},
+        'audio': {'aac', 'mp3', 'opus', 'ac3', 'eac3', 'alac', 'flac'}
+    },
+    'm4v': {
+        'video': {'h264', 'hevc', 'mpeg4'},
+        'audio': {'aac', 'ac3', 'alac'}
+    },
+    'mov': {
+        'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'},
+        'audio': {'aac', 'mp3', 'ac3', 'alac', 'pcm_s16le', 'pcm_s24le', 'opus', 'flac'}
+    },
+    '3gp': {
+        'video': {'h263', 'h264', 'mpeg4'},
+        'audio': {'aac', 'amr_nb', 'amr_wb'}
+    },
+    'mkv': {'video': None, 'audio': None},
+    'webm': {
+        'video': {'vp8', 'vp9', 'av1'},
+        'audio': {'opus', 'vorbis'}
+    },
+    'avi': {
+        'video': {'h264', 'mpeg4', 'msmpeg4v2', 'msmpeg4v3', 'mjpeg', 'mpeg2video'},
+        'audio': {'mp3', 'ac3', 'pcm_s16le', 'mp2'}
+    },
+    'flv': {
+        'video': {'h264', 'flv1'},
+        'audio': {'aac', 'mp3'}
+    },
+    'wmv': {
+        'video': {'wmv1', 'wmv2', 'msmpeg4v3'},
+        'audio': {'wmav1', 'wmav2'}
+    }
+}
+
+# 音频格式可以直接复制的源编码
+AUDIO_FORMAT_CODECS = {
+    'mp3': {'mp3'},
+    'aac': {'aac'},
+    'wav': {'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le', 'pcm_u8'},
+    'ogg': {'vorbis', 'opus', 'flac'},
+    'flac': {'flac'}
+}
+
+# 压缩级别CRF对应的每像素比特数，低于此值的H.264源再次编码几乎不会变小，取值偏保守
+CRF_BITS_PER_PIXEL = {23: 0.02, 28: 0.01, 32: 0.006}
+
+
+@dataclass
+class Decision:
+    path: str
+    reason: str
+    # 该路径下ffmpeg的输出参数，直通时为空
+    output_args: dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"path": self.path, "reason": self.reason}
+
+
+def _same_family(probe: ProbeResult, target_format: str) -> bool:
+    return probe.info.get("format", {}).get("format_name") == FORMAT_FAMILIES.get(target_format)
+
+
+def _codec(stream: Optional[dict[str, Any]]) -> Optional[str]:
+    return stream.get("codec_name") if stream else None
+
+
+def _fits(target_format: str, codec_type: str, codec: Optional[str]) -> bool:
+    """没有该类型的流，或容器支持该编码时返回True"""
+    if codec is None:
+        return True
+    allowed = CONTAINER_CODECS.get(target_format, {}).get(codec_type, set())
+    return allowed is None or codec in allowed
+
+
+def _frame_rate(stream: dict[str, Any]) -> float:
+    num, _, den = (stream.get("avg_frame_rate") or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def decide_convert(probe: ProbeResult, input_extension: str, target_format: str) -> Decision:
+    """格式转换：同格式原样返回，编码兼容时只换容器，否则只重编码不兼容的流"""
+    if input_extension.lstrip('.').lower() == target_format and _same_family(probe, target_format):
+        return Decision(PATH_PASSTHROUGH, f"input is already {target_format}")
+
+    video = next(iter(probe.streams("video")), None)
+    audio = next(iter(probe.streams("audio")), None)
+    video_fits = _fits(target_format, "video", _codec(video))
+    audio_fits = _fits(target_format, "audio", _codec(audio))
+    if video_fits and audio_fits:
+        return Decision(PATH_REMUX, f"all codecs are supported by {target_format}", {'c:v': 'copy', 'c:a': 'copy'})
+
+    # 兼容的流照常复制，不兼容的流使用容器默认编码器
+    output_args = {}
+    copied = []
+    if video and video_fits:
+        output_args['c:v'] = 'copy'
+        copied.append("video")
+    if audio and audio_fits:
+        output_args['c:a'] = 'copy'
+        copied.append("audio")
+    unsupported = [c for c, fits in ((_codec(video), video_fits), (_codec(audio), audio_fits)) if c and not fits]
+    reason = f"{', '.join(unsupported)} not supported by {target_format}"
+    if copied:
+        reason += f"; {' and '.join(copied)} copied"
+    return Decision(PATH_TRANSCODE, reason, output_args)
+
+
+def decide_compress(probe: ProbeResult, crf: int, original_size: int, target_size: Optional[int] = None) -> Decision:
+    """压缩：已小于目标大小，或H.264源的码率已低于该CRF的典型码率时原样返回"""
+    if target_size is not None:
+        if original_size <= target_size:
+            return Decision(PATH_PASSTHROUGH, "input is already smaller than the target size")
+        return Decision(PATH_TRANSCODE, "input is larger than the target size")
+
+    video = next(iter(probe.streams("video")), None)
+    if not video or video.get("codec_name") != "h264":
+        return Decision(PATH_TRANSCODE, "source is not H.264")
+
+    bit_rate = video.get("bit_rate")
+    if not bit_rate or bit_rate == "N/A":
+        # 流码率未知时用容器码率扣除音频码率
+        bit_rate = float(probe.info.get("format", {}).get("bit_rate") or 0) - sum(
+            float(s.get("bit_rate") or 0) for s in probe.streams("audio")
+        )
+    pixels_per_second = int(video.get("width") or 0) * int(video.get("height") or 0) * _frame_rate(video)
+    if pixels_per_second <= 0 or float(bit_rate) <= 0:
+        return Decision(PATH_TRANSCODE, "source bitrate is unknown")
+
+    bits_per_pixel = float(bit_rate) / pixels_per_second
+    threshold = CRF_BITS_PER_PIXEL.get(crf)
+    if threshold is not None and bits_per_pixel <= threshold:
+        return Decision(
+            PATH_PASSTHROUGH,
+            f"H.264 source is already at {bits_per_pixel:.4f} bits per pixel, below the {threshold} expected for CRF {crf}"
+        )
+    return Decision(PATH_TRANSCODE, f"source is at {bits_per_pixel:.4f} bits per pixel")
+
+
+def decide_extract_audio(probe: ProbeResult, audio_format: str, has_custom_attrs: bool,
+                         normalize: bool = False) -> Decision:
+    """提取音频：源音频编码与目标格式一致时直接复制，纯音频的同格式文件原样返回"""
+    audio = next(iter(probe.streams("audio")), None)
+    if audio is None:
+        return Decision(PATH_TRANSCODE, "no audio stream found")
+    if has_custom_attrs:
+        return Decision(PATH_TRANSCODE, "custom audio attributes require encoding")
+    if normalize:
+        return Decision(PATH_TRANSCODE, "loudness normalization requires encoding")
+
+    if audio.get("codec_name") not in AUDIO_FORMAT_CODECS.get(audio_format, set()):
+        return Decision(PATH_TRANSCODE, f"{audio.get('codec_name')} cannot be stored as {audio_format}")
+
+    streams = probe.info.get("streams", [])
+    format_name = probe.info.get("format", {}).get("format_name", "")
+    if len(streams) == 1 and audio_format in format_name.split(","):
+        return Decision(PATH_PASSTHROUGH, f"input is already a {audio_format} audio file")
+    return Decision(PATH_STREAM_COPY, f"source audio is already {audio.get('codec_name')}", {'acodec': 'copy', 'vn': None})
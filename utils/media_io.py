@@ -0,0 +1,215 @@
+"""
+媒体输入输出层：流式落盘上传文件、分块发送输出文件，避免在内存中持有完整内容
+"""
+from collections.abc import Generator, Iterator
+from dataclasses import dataclass
+from typing import Any, Optional
+import hashlib
+import os
+import resource
+import tempfile
+import uuid
+
+import httpx
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.file.file import File
+
+# 每次读写的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 输出文件按块发送，与SDK拆分blob消息时的块大小一致，Dify拒绝超过8KB的分块
+BLOB_CHUNK_SIZE = 8192
+
+# 快速探测模式下读取的文件头部大小
+PROBE_HEADER_BYTES = int(os.environ.get("FFMPEG_PROBE_HEADER_MB", 8)) * 1024 * 1024
+
+# moov原子可能位于文件末尾的容器
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov', '.3gp', '.m4a'}
+
+
+@dataclass
+class SpooledInput:
+    path: str
+    content_hash: str
+    size: int
+    # 为False时文件只包含头部等探测所需的数据，其余部分是空洞
+    complete: bool = True
+
+    def release(self) -> None:
+        """删除临时输入文件，可重复调用"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def _iter_source(video_file: File) -> Iterator[bytes]:
+    """按块迭代上传文件内容，优先使用已加载的内容，否则从URL流式下载"""
+    blob = getattr(video_file, "_blob", None)
+    if blob is not None:
+        view = memoryview(blob)
+        for offset in range(0, len(view), CHUNK_SIZE):
+            yield view[offset:offset + CHUNK_SIZE]
+        return
+
+    with httpx.stream("GET", video_file.url) as response:
+        response.raise_for_status()
+        yield from response.iter_bytes(CHUNK_SIZE)
+
+
+def spool_input(video_file: File, suffix: str, directory: Optional[str] = None) -> SpooledInput:
+    """将上传文件分块写入临时文件（默认在系统临时目录，可指定作业工作区），同时计算内容哈希"""
+    hasher = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in _iter_source(video_file):
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    # 内容已落盘，释放SDK缓存的完整内容，需要时会从URL重新加载
+    video_file._blob = None
+    return SpooledInput(path=path, content_hash=hasher.hexdigest(), size=size)
+
+
+def _read_range(video_file: File, start: int, end: int) -> Optional[bytes]:
+    """读取[start, end)范围的内容，服务端不支持Range时返回None"""
+    blob = getattr(video_file, "_blob", None)
+    if blob is not None:
+        return bytes(blob[start:end])
+
+    with httpx.stream("GET", video_file.url, headers={"Range": f"bytes={start}-{end - 1}"}) as response:
+        if response.status_code != 206:
+            return None
+        return response.read()
+
+
+def _total_size(video_file: File) -> Optional[int]:
+    """获取上传文件的总大小"""
+    blob = getattr(video_file, "_blob", None)
+    if blob is not None:
+        return len(blob)
+    if video_file.size:
+        return video_file.size
+
+    response = httpx.head(video_file.url)
+    length = response.headers.get("Content-Length")
+    return int(length) if response.is_success and length else None
+
+
+def _locate_moov(video_file: File, head: bytes, total: int) -> Optional[tuple[int, bytes]]:
+    """沿顶层原子查找moov，返回其偏移与内容"""
+    offset = 0
+    for _ in range(64):
+        if offset + 8 > total:
+            return None
+        header = head[offset:offset + 16] if offset + 16 <= len(head) else _read_range(
+            video_file, offset, min(offset + 16, total)
+        )
+        if not header or len(header) < 8:
+            return None
+
+        atom_size = int.from_bytes(header[:4], "big")
+        atom_type = header[4:8]
+        if atom_size == 1 and len(header) >= 16:
+            atom_size = int.from_bytes(header[8:16], "big")
+        elif atom_size == 0:
+            atom_size = total - offset
+        if atom_size < 8:
+            return None
+
+        if atom_type == b"moov":
+            if offset + atom_size <= len(head):
+                return None
+            moov = _read_range(video_file, offset, offset + atom_size)
+            return (offset, moov) if moov else None
+        offset += atom_size
+    return None
+
+
+def spool_header(video_file: File, suffix: str, header_bytes: int = PROBE_HEADER_BYTES,
+                 directory: Optional[str] = None) -> SpooledInput:
+    """只落盘文件头部（MP4额外获取moov原子），写成与原文件等长的稀疏文件供ffprobe读取"""
+    total = _total_size(video_file)
+    head = _read_range(video_file, 0, header_bytes) if total and total > header_bytes else None
+    if head is None:
+        # 文件较小或服务端不支持Range请求，退回完整落盘
+        return spool_input(video_file, suffix, directory)
+
+    moov = _locate_moov(video_file, head, total) if suffix.lower() in MP4_EXTENSIONS else None
+
+    hasher = hashlib.sha256(f"header:{total}:".encode("utf-8"))
+    hasher.update(head)
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(head)
+            if moov:
+                f.seek(moov[0])
+                f.write(moov[1])
+                hasher.update(moov[1])
+            f.truncate(total)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return SpooledInput(path=path, content_hash=hasher.hexdigest(), size=total, complete=False)
+
+
+def stream_blob(path: str, meta: Optional[dict[str, Any]] = None) -> Generator[ToolInvokeMessage, None, None]:
+    """从输出文件按块生成blob_chunk消息，同一时间只在内存中持有一个分块，内存占用与输出大小无关
+
+    SDK收到完整的blob消息时也会拆成同样的分块发送，但需要先把整个文件读入内存
+    """
+    total = os.path.getsize(path)
+    blob_id = uuid.uuid4().hex
+    sequence = 0
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(BLOB_CHUNK_SIZE)
+            if not data:
+                break
+            yield ToolInvokeMessage(
+                type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+                message=ToolInvokeMessage.BlobChunkMessage(
+                    id=blob_id, sequence=sequence, total_length=total, blob=data, end=False
+                ),
+                meta=meta
+            )
+            sequence += 1
+
+    # 结束分块通知Dify组装文件
+    yield ToolInvokeMessage(
+        type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+        message=ToolInvokeMessage.BlobChunkMessage(id=blob_id, sequence=sequence, total_length=total, blob=b"", end=True),
+        meta=meta
+    )
+
+
+class PeakRSSTracker:
+    """记录单次调用期间插件进程的峰值常驻内存"""
+
+    def __init__(self):
+        # Linux下写入5可重置VmHWM，使峰值只覆盖本次调用
+        self._resettable = False
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self._resettable = True
+        except OSError:
+            pass
+
+    def peak(self) -> Optional[int]:
+        """返回峰值常驻内存字节数，不支持重置时返回进程生命周期内的峰值"""
+        if self._resettable:
+            try:
+                with open("/proc/self/status", "r") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            return int(line.split()[1]) * 1024
+            except (OSError, ValueError, IndexError):
+                pass
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -0,0 +1,197 @@
+"""
+单次调用的分阶段计时与资源统计：各阶段耗时、输入输出字节数、ffmpeg子进程的CPU与内存及完整命令行
+"""
+from contextlib import ContextDecorator
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import json
+import os
+import re
+import resource
+import shlex
+import subprocess
+import threading
+import time
+
+from utils.command import PROGRESS_PREFIX, Command, FFmpegError, read_tail
+from utils.progress import ProgressTracker
+
+# 设置后每次调用的统计以JSON行追加到该文件
+METRICS_LOG_ENV = "FFMPEG_METRICS_LOG"
+
+_BENCH_CPU = re.compile(r"bench: utime=([\d.]+)s stime=([\d.]+)s")
+_BENCH_RSS = re.compile(r"bench: maxrss=(\d+)k")
+
+_log_lock = threading.Lock()
+
+
+@dataclass
+class Stage:
+    name: str
+    seconds: float = 0.0
+    bytes_in: Optional[int] = None
+    bytes_out: Optional[int] = None
+    commands: list[str] = field(default_factory=list)
+    child_cpu_seconds: float = 0.0
+    child_max_rss_bytes: Optional[int] = None
+    progress: Optional[ProgressTracker] = field(default=None, repr=False)
+
+    def _record_child(self, args: list[str], before: resource.struct_rusage, stderr: str) -> None:
+        """记录子进程的命令行与资源占用，ffmpeg自身报告的数值优先于RUSAGE_CHILDREN的差值"""
+        self.commands.append(shlex.join(args))
+        cpu = _BENCH_CPU.search(stderr)
+        if cpu:
+            self.child_cpu_seconds += float(cpu.group(1)) + float(cpu.group(2))
+        else:
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.child_cpu_seconds += (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+        rss = _BENCH_RSS.search(stderr)
+        if rss:
+            self.child_max_rss_bytes = max(self.child_max_rss_bytes or 0, int(rss.group(1)) * 1024)
+
+    def run(self, command: Command, expected_seconds: Optional[float] = None) -> str:
+        """运行ffmpeg命令（覆盖已有输出），通过 -progress 逐块读取进度，失败时抛出 FFmpegError
+
+        expected_seconds为该命令预计输出的媒体时长，用于计算进度百分比；返回错误输出的末尾部分，
+        供需要读取滤镜汇总（如ebur128）的调用方解析
+        """
+        args = command.compile(PROGRESS_PREFIX)
+        task = self.progress.task(expected_seconds) if self.progress is not None else None
+        deadline = self.progress.deadline if self.progress is not None else None
+        if deadline is not None:
+            deadline.check(self.name)
+
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        # 单独的进程组，超时时可以结束ffmpeg及其全部子进程
+        process = subprocess.Popen(
+            args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True
+        )
+
+        finished = threading.Event()
+        stopped = {}
+        if deadline is not None:
+            def watch():
+                stopped["finalized"] = deadline.supervise(process, finished)
+
+            supervisor = threading.Thread(target=watch, daemon=True)
+            supervisor.start()
+
+        # 错误输出在单独的线程中读取，避免任一管道写满导致ffmpeg阻塞
+        stderr_tail = {}
+
+        def read_stderr():
+            stderr_tail["data"] = read_tail(process.stderr)
+
+        stderr_reader = threading.Thread(target=read_stderr, daemon=True)
+        stderr_reader.start()
+
+        values = {}
+        for raw in process.stdout:
+            key, _, value = raw.decode('utf-8', errors='replace').strip().partition('=')
+            values[key] = value
+            if key == 'progress':
+                if task is not None:
+                    task.feed(values)
+                values = {}
+        stderr_reader.join()
+        process.wait()
+        finished.set()
+        if deadline is not None:
+            supervisor.join()
+
+        err = stderr_tail.get("data", b'')
+        stderr = err.decode('utf-8', errors='replace')
+        self._record_child(args, before, stderr)
+        if stopped.get("finalized") is not None:
+            raise deadline.error(self.name, finalized=stopped["finalized"])
+        if process.returncode != 0:
+            raise FFmpegError(process.returncode, err)
+        return stderr
+
+    def run_command(self, args: list[str]) -> subprocess.CompletedProcess:
+        """运行任意子进程命令（如ffprobe），返回文本形式的结果"""
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        self._record_child(args, before, "")
+        return result
+
+    def to_dict(self) -> dict[str, Any]:
+        data = {"name": self.name, "seconds": round(self.seconds, 4)}
+        if self.bytes_in is not None:
+            data["bytes_in"] = self.bytes_in
+        if self.bytes_out is not None:
+            data["bytes_out"] = self.bytes_out
+        if self.commands:
+            data["commands"] = self.commands
+            data["child_cpu_seconds"] = round(self.child_cpu_seconds, 4)
+            data["child_max_rss_bytes"] = self.child_max_rss_bytes
+        return data
+
+
+class _StageContext(ContextDecorator):
+    """既可以用作上下文管理器，也可以用作装饰器"""
+
+    def __init__(self, metrics: "InvocationMetrics", name: str, bytes_in: Optional[int]):
+        self._metrics = metrics
+        self._name = name
+        self._bytes_in = bytes_in
+        self._stage: Optional[Stage] = None
+        self._started = 0.0
+
+    def __enter__(self) -> Stage:
+        self._stage = Stage(name=self._name, bytes_in=self._bytes_in, progress=self._metrics.progress)
+        self._started = time.monotonic()
+        return self._stage
+
+    def __exit__(self, *exc) -> bool:
+        self._stage.seconds = time.monotonic() - self._started
+        self._metrics.add(self._stage)
+        return False
+
+
+class InvocationMetrics:
+    """收集一次工具调用中各阶段的统计，并附加到JSON结果中"""
+
+    def __init__(self, tool_name: str, progress: Optional[ProgressTracker] = None):
+        self.tool_name = tool_name
+        # 设置后各阶段运行的ffmpeg进程向其报告进度
+        self.progress = progress
+        self.stages: list[Stage] = []
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, bytes_in: Optional[int] = None) -> _StageContext:
+        """记录一个阶段：with metrics.stage("probe") as stage: ... 或 @metrics.stage("encode")"""
+        return _StageContext(self, name, bytes_in)
+
+    def add(self, stage: Stage) -> None:
+        # 分块编码等场景下多个阶段会并发结束
+        with self._lock:
+            self.stages.append(stage)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            stages = [stage.to_dict() for stage in self.stages]
+        return {
+            "total_seconds": round(time.monotonic() - self._started, 4),
+            "child_cpu_seconds": round(sum(stage.child_cpu_seconds for stage in self.stages), 4),
+            "stages": stages
+        }
+
+    def emit(self, status: str) -> dict[str, Any]:
+        """返回用于JSON输出的统计，配置了日志文件时同时追加一行"""
+        data = self.to_dict()
+        log_path = os.environ.get(METRICS_LOG_ENV)
+        if log_path:
+            line = json.dumps({
+                "tool": self.tool_name,
+                "timestamp": time.time(),
+                "status": status,
+                **data
+            })
+            try:
+                with _log_lock, open(log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+        return data
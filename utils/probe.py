@@ -0,0 +1,204 @@
+"""
+共享的ffprobe服务：按内容哈希将探测结果记录在本地SQLite索引中
+"""
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Optional
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+
+from utils.metrics import Stage
+from utils.scheduler import JobTicket, PRIORITY_PROBE, scheduler
+
+# 索引中每张表保留的最大记录数
+DEFAULT_MAX_ENTRIES = 10000
+
+INDEX_TABLES = ("probes", "keyframes", "loudness", "scenes")
+
+
+class ProbeError(Exception):
+    """ffprobe无法解析输入文件"""
+
+    @classmethod
+    def from_result(cls, result: subprocess.CompletedProcess) -> "ProbeError":
+        """使用ffprobe的错误输出作为消息，没有输出时给出退出码"""
+        message = (result.stderr or "").strip()
+        return cls(message or f"ffprobe could not read the input (exit code {result.returncode})")
+
+
+@dataclass
+class ProbeResult:
+    info: dict[str, Any]
+    cached: bool
+    ticket: Optional[JobTicket] = None
+
+    @property
+    def duration(self) -> float:
+        """容器时长（秒），未知时返回0"""
+        return float(self.info.get("format", {}).get("duration", 0) or 0)
+
+    def streams(self, codec_type: str) -> list[dict[str, Any]]:
+        """返回指定类型的流"""
+        return [s for s in self.info.get("streams", []) if s.get("codec_type") == codec_type]
+
+
+@dataclass
+class KeyframeIndex:
+    # 关键帧的显示时间（秒），按解码顺序排列
+    times: list[float]
+    # 关键帧在解码顺序中的包序号
+    packet_indexes: list[int]
+
+    def packets_between(self, first: int, last: int) -> int:
+        """返回第first个与第last个关键帧之间（含前不含后）的包数量"""
+        return self.packet_indexes[last] - self.packet_indexes[first]
+
+
+class ProbeService:
+    """所有工具共用一份探测结果，相同内容不会重复调用ffprobe"""
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path or os.environ.get(
+            "FFMPEG_PROBE_DB", os.path.join(tempfile.gettempdir(), "dify_ffmpeg_probe.sqlite3")
+        )
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        """打开索引连接，退出时提交并关闭"""
+        with self._lock:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            try:
+                with conn:
+                    if not self._initialized:
+                        for table in INDEX_TABLES:
+                            conn.execute(
+                                f"CREATE TABLE IF NOT EXISTS {table} ("
+                                "content_hash TEXT PRIMARY KEY, data TEXT NOT NULL, last_used REAL NOT NULL)"
+                            )
+                        self._initialized = True
+                    yield conn
+            finally:
+                conn.close()
+
+    def _lookup(self, table: str, content_hash: str) -> Any:
+        try:
+            with self._connection() as conn:
+                row = conn.execute(f"SELECT data FROM {table} WHERE content_hash = ?", (content_hash,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute(f"UPDATE {table} SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+                return json.loads(row[0])
+        except (sqlite3.Error, ValueError):
+            return None
+
+    def _store(self, table: str, content_hash: str, data: Any) -> None:
+        try:
+            with self._connection() as conn:
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {table} (content_hash, data, last_used) VALUES (?, ?, ?)",
+                    (content_hash, json.dumps(data), time.time())
+                )
+                conn.execute(
+                    f"DELETE FROM {table} WHERE content_hash NOT IN "
+                    f"(SELECT content_hash FROM {table} ORDER BY last_used DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error:
+            pass
+
+    def warm(self) -> None:
+        """提前创建索引表，使第一次探测不再承担建表开销"""
+        try:
+            with self._connection():
+                pass
+        except sqlite3.Error:
+            pass
+
+    @staticmethod
+    def _run(command: list[str], stage: Optional[Stage]) -> subprocess.CompletedProcess:
+        if stage is not None:
+            return stage.run_command(command)
+        return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    def probe(self, path: str, content_hash: str, stage: Optional[Stage] = None) -> ProbeResult:
+        """返回文件的格式与流信息，优先使用索引中的记录；传入stage时记录ffprobe的命令行与资源占用"""
+        info = self._lookup("probes", content_hash)
+        if info is not None:
+            return ProbeResult(info=info, cached=True)
+
+        command = [
+            'ffprobe',
+            '-v', 'error',
+            '-print_format', 'json',
+            '-show_format',
+            '-show_streams',
+            path
+        ]
+        with scheduler.job(PRIORITY_PROBE) as ticket:
+            result = self._run(command, stage)
+
+        if result.returncode != 0:
+            raise ProbeError.from_result(result)
+
+        info = json.loads(result.stdout)
+        self._store("probes", content_hash, info)
+        return ProbeResult(info=info, cached=False, ticket=ticket)
+
+
+    def keyframes(self, path: str, content_hash: str, stage: Optional[Stage] = None) -> KeyframeIndex:
+        """返回第一条视频流的关键帧索引，只读取包信息而不解码"""
+        data = self._lookup("keyframes", content_hash)
+        if data is not None:
+            return KeyframeIndex(times=data["times"], packet_indexes=data["packet_indexes"])
+
+        command = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            path
+        ]
+        with scheduler.job(PRIORITY_PROBE):
+            result = self._run(command, stage)
+
+        if result.returncode != 0:
+            raise ProbeError.from_result(result)
+
+        index = KeyframeIndex(times=[], packet_indexes=[])
+        for packet_index, line in enumerate(result.stdout.splitlines()):
+            pts_time, _, flags = line.partition(',')
+            if 'K' in flags and pts_time not in ('', 'N/A'):
+                index.times.append(float(pts_time))
+                index.packet_indexes.append(packet_index)
+
+        self._store("keyframes", content_hash, {"times": index.times, "packet_indexes": index.packet_indexes})
+        return index
+
+    def loudness(self, content_hash: str) -> Optional[dict[str, Any]]:
+        """返回索引中记录的响度测量结果，没有记录时返回None"""
+        return self._lookup("loudness", content_hash)
+
+    def store_loudness(self, content_hash: str, data: dict[str, Any]) -> None:
+        """记录第一条音频流的响度测量结果，测量由提取命令的分支完成，不在这里运行ffmpeg"""
+        self._store("loudness", content_hash, data)
+
+    def scene_index(self, content_hash: str) -> Optional[dict[str, Any]]:
+        """返回索引中记录的场景与复杂度索引，没有记录时返回None"""
+        return self._lookup("scenes", content_hash)
+
+    def store_scene_index(self, content_hash: str, data: dict[str, Any]) -> None:
+        """记录场景与复杂度索引，分析由 utils.scene_index 完成"""
+        self._store("scenes", content_hash, data)
+
+
+probe_service = ProbeService()
@@ -0,0 +1,178 @@
+"""
+FFmpeg实时进度：解析 -progress 输出，在工具生成器中定期返回进度消息
+"""
+from collections.abc import Callable, Generator
+from typing import Any, Optional, TypeVar
+import os
+import threading
+import time
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+from utils.deadline import REASON_CANCELLED, REASON_PROJECTED, Deadline
+
+# 两条进度消息之间的最短间隔（秒）
+DEFAULT_INTERVAL = float(os.environ.get("FFMPEG_PROGRESS_INTERVAL", "2"))
+
+# 按ETA提前放弃前至少需要完成的比例，过早的ETA不可靠
+PROJECTION_MIN_FRACTION = 0.1
+
+# 生成器被关闭后等待ffmpeg进程退出、临时文件可以清理的最长时间（秒）
+CANCEL_WAIT_SECONDS = 10.0
+
+T = TypeVar("T")
+
+
+class ProgressTask:
+    """单个ffmpeg进程的进度，expected_seconds为该进程预计输出的媒体时长"""
+
+    def __init__(self, tracker: "ProgressTracker", expected_seconds: Optional[float]):
+        self._tracker = tracker
+        self.expected_seconds = expected_seconds
+        self.out_seconds = 0.0
+
+    def feed(self, values: dict[str, str]) -> None:
+        """处理 -progress 输出的一个数据块（以 progress=continue/end 结尾的若干 key=value 行）"""
+        out_time_us = values.get("out_time_us") or values.get("out_time_ms")
+        try:
+            # 部分版本的out_time_ms实际单位也是微秒
+            self.out_seconds = max(0.0, int(out_time_us) / 1_000_000)
+        except (TypeError, ValueError):
+            pass
+        if self.expected_seconds is not None:
+            self.out_seconds = min(self.out_seconds, self.expected_seconds)
+        if values.get("progress") == "end" and self.expected_seconds is not None:
+            self.out_seconds = self.expected_seconds
+        self._tracker._update(values)
+
+
+class ProgressTracker:
+    """汇总一次调用中所有ffmpeg进程的进度，total_seconds为全部进程预计输出的媒体时长之和
+
+    设置deadline后，各阶段运行的ffmpeg进程受其时间预算约束
+    """
+
+    def __init__(self, total_seconds: float = 0.0, interval: float = DEFAULT_INTERVAL,
+                 deadline: Optional[Deadline] = None):
+        self.total_seconds = total_seconds
+        self.interval = interval
+        self.deadline = deadline
+        self._tasks: list[ProgressTask] = []
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        # 第一个ffmpeg进程开始的时间，ETA不计入上传与探测的耗时
+        self._started: Optional[float] = None
+        self.fps: Optional[float] = None
+        self.speed: Optional[float] = None
+
+    def task(self, expected_seconds: Optional[float] = None) -> ProgressTask:
+        task = ProgressTask(self, expected_seconds)
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+            self._tasks.append(task)
+        return task
+
+    def reset(self) -> None:
+        """重试时丢弃已记录的进度"""
+        with self._lock:
+            self._tasks = []
+            self._started = None
+
+    def _update(self, values: dict[str, str]) -> None:
+        with self._lock:
+            try:
+                self.fps = float(values["fps"])
+            except (KeyError, ValueError):
+                pass
+            try:
+                self.speed = float(values.get("speed", "").rstrip("x"))
+            except ValueError:
+                pass
+        self._changed.set()
+
+    def snapshot(self) -> dict[str, Any]:
+        """当前进度：百分比、已输出时长、fps、速度与预计剩余时间"""
+        with self._lock:
+            done = sum(task.out_seconds for task in self._tasks if task.expected_seconds is not None)
+            out_seconds = max((task.out_seconds for task in self._tasks), default=0.0)
+            fps, speed = self.fps, self.speed
+            started = self._started
+        percent = eta = None
+        if self.total_seconds > 0:
+            fraction = min(1.0, done / self.total_seconds)
+            percent = round(fraction * 100, 1)
+            if fraction > 0 and started is not None:
+                # 按到目前为止的平均速度外推，多个进程串行或并行时同样适用
+                elapsed = time.monotonic() - started
+                eta = round(elapsed * (1 - fraction) / fraction, 1)
+        return {"percent": percent, "out_seconds": round(out_seconds, 2), "fps": fps, "speed": speed, "eta_seconds": eta}
+
+    def _check_projection(self) -> None:
+        """按ETA预计无法在预算内完成时提前结束，返回部分结果时则继续处理到预算耗尽"""
+        if self.deadline is None or self.deadline.partial:
+            return
+        progress = self.snapshot()
+        eta = progress["eta_seconds"]
+        if eta is None or (progress["percent"] or 0) < PROJECTION_MIN_FRACTION * 100:
+            return
+        remaining = self.deadline.remaining()
+        if eta > remaining:
+            self.deadline.cancel(REASON_PROJECTED, f"{progress['percent']:.0f}% done, ETA {eta:.0f} s, {remaining:.0f} s left")
+
+    def format(self, label: str) -> str:
+        progress = self.snapshot()
+        # 第一帧输出之前ffmpeg报告的fps与速度为0，不显示
+        parts = []
+        if progress["fps"]:
+            parts.append(f"fps {progress['fps']:.1f}")
+        if progress["speed"]:
+            parts.append(f"speed {progress['speed']:.2f}x")
+        if progress["eta_seconds"] is not None:
+            parts.append(f"ETA {progress['eta_seconds']:.0f}s")
+        head = f"{progress['percent']:.0f}%" if progress["percent"] is not None else f"{progress['out_seconds']:.1f}s processed"
+        return f"{label}: {head}" + (f" ({', '.join(parts)})" if parts else "")
+
+    def drive(self, tool: Tool, label: str, work: Callable[[], T]) -> Generator[ToolInvokeMessage, None, T]:
+        """在后台执行work，期间按间隔返回进度消息，结束后返回work的结果或抛出其异常"""
+        result: dict[str, Any] = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                result["value"] = work()
+            except BaseException as e:
+                result["error"] = e
+            finally:
+                done.set()
+                self._changed.set()
+
+        threading.Thread(target=target, daemon=True).start()
+
+        last_emit = time.monotonic()
+        last_message = None
+        try:
+            while not done.is_set():
+                self._changed.wait(self.interval)
+                self._changed.clear()
+                if done.is_set():
+                    continue
+                self._check_projection()
+                if time.monotonic() - last_emit < self.interval:
+                    continue
+                message = self.format(label)
+                if message != last_message:
+                    yield tool.create_text_message(message + "\n")
+                    last_message = message
+                    last_emit = time.monotonic()
+        except GeneratorExit:
+            # 调用方已放弃请求：结束ffmpeg并等待其退出，之后工具才清理临时文件
+            if self.deadline is not None:
+                self.deadline.cancel(REASON_CANCELLED)
+                done.wait(CANCEL_WAIT_SECONDS)
+            raise
+
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
@@ -0,0 +1,198 @@
+"""
+场景与复杂度索引：读取一遍包信息得到关键帧位置与源视频每秒的码率，在缩小的画面上解码一遍找出场景切换，
+结果按内容哈希记录在探测索引中；剪切可以对齐到场景边界，分块压缩可以在场景切换处分块并按各块的复杂度分配码率
+"""
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Any, Optional
+import math
+import os
+
+from utils.command import Command, filter_spec
+from utils.metrics import Stage
+from utils.probe import KeyframeIndex, ProbeError, probe_service
+from utils.scheduler import PRIORITY_ENCODE, PRIORITY_PROBE, scheduler
+
+# 判定为镜头切换的场景分数阈值（0-1），缩略图的场景模式使用同一阈值
+SCENE_THRESHOLD = 0.3
+# 场景分数在缩小到该宽度的画面上计算；耗时主要在解码，默认的bicubic缩放比省下的计算更贵，所以用最快的缩放算法
+ANALYSIS_WIDTH = 160
+# 源视频码率的统计粒度（秒）
+BUCKET_SECONDS = 1.0
+
+# 按复杂度分配码率时各块相对平均码率的上下限，避免静止画面分到的码率过低
+MIN_BITRATE_WEIGHT = 0.5
+MAX_BITRATE_WEIGHT = 2.0
+
+SELECT_CUTS = filter_spec('select', f"gt(scene,{SCENE_THRESHOLD})")
+
+
+@dataclass
+class SceneIndex:
+    duration: float
+    # 场景切换处第一帧的显示时间（秒），升序
+    scene_cuts: array
+    # 关键帧的显示时间与在解码顺序中的包序号，与 KeyframeIndex 相同
+    keyframe_times: array
+    keyframe_packets: array
+    # 源视频每BUCKET_SECONDS秒的包字节数，编码器为复杂画面分配更多码率，可以作为复杂度的近似
+    bucket_bytes: array
+
+    def keyframes(self) -> KeyframeIndex:
+        return KeyframeIndex(times=list(self.keyframe_times), packet_indexes=list(self.keyframe_packets))
+
+    def segments(self) -> list[tuple[float, float]]:
+        """按场景切换划分的各段起止时间"""
+        bounds = [0.0, *(cut for cut in self.scene_cuts if 0 < cut < self.duration), self.duration]
+        return list(zip(bounds, bounds[1:]))
+
+    def snap(self, seconds: float, tolerance: float) -> float:
+        """返回tolerance秒以内最近的场景切换时间，没有时原样返回"""
+        i = bisect_left(self.scene_cuts, seconds)
+        candidates = [self.scene_cuts[j] for j in (i - 1, i) if 0 <= j < len(self.scene_cuts)]
+        nearest = min(candidates, key=lambda cut: abs(cut - seconds), default=None)
+        return nearest if nearest is not None and abs(nearest - seconds) <= tolerance else seconds
+
+    def is_cut(self, seconds: float, tolerance: float) -> bool:
+        """该时间前后tolerance秒以内是否有场景切换"""
+        i = bisect_left(self.scene_cuts, seconds - tolerance)
+        return i < len(self.scene_cuts) and self.scene_cuts[i] <= seconds + tolerance
+
+    def _bucket_seconds(self, bucket: int) -> float:
+        """统计区间的实际时长，最后一个区间只到视频结尾"""
+        return max(0.0, min(BUCKET_SECONDS, self.duration - bucket * BUCKET_SECONDS))
+
+    def complexity(self, start: float, end: float) -> float:
+        """区间内源视频的平均码率相对全片平均码率的比值，1.0表示与全片持平"""
+        total = sum(self.bucket_bytes)
+        if total <= 0 or end <= start or self.duration <= 0:
+            return 1.0
+        first = int(start // BUCKET_SECONDS)
+        last = min(len(self.bucket_bytes), max(first + 1, math.ceil(end / BUCKET_SECONDS)))
+        seconds = sum(self._bucket_seconds(bucket) for bucket in range(first, last))
+        if seconds <= 0:
+            return 1.0
+        return (sum(self.bucket_bytes[first:last]) / seconds) / (total / self.duration)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "duration": self.duration,
+            "scene_cuts": list(self.scene_cuts),
+            "keyframe_times": list(self.keyframe_times),
+            "keyframe_packets": list(self.keyframe_packets),
+            "bucket_bytes": list(self.bucket_bytes)
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SceneIndex":
+        return cls(
+            duration=data["duration"],
+            scene_cuts=array('d', data["scene_cuts"]),
+            keyframe_times=array('d', data["keyframe_times"]),
+            keyframe_packets=array('q', data["keyframe_packets"]),
+            bucket_bytes=array('d', data["bucket_bytes"])
+        )
+
+    def summary(self, cached: bool) -> dict[str, Any]:
+        """JSON结果中附带的索引摘要"""
+        return {"scenes": len(self.segments()), "keyframes": len(self.keyframe_times), "cached": cached}
+
+
+def _read_cut_times(path: str) -> list[float]:
+    """读取metadata滤镜输出的各帧时间，每帧一行 frame:N pts:P pts_time:T"""
+    times = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                _, found, value = line.partition("pts_time:")
+                if found:
+                    times.append(float(value.split()[0]))
+    except (OSError, ValueError, IndexError):
+        return []
+    return sorted(times)
+
+
+def _read_packets(path: str, duration: float, stage: Stage) -> tuple[array, array, array]:
+    """读取第一条视频流的包信息，返回关键帧时间、关键帧包序号与每个统计区间的字节数，不解码"""
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,size,flags',
+        '-of', 'csv=p=0',
+        path
+    ]
+    with scheduler.job(PRIORITY_PROBE):
+        result = stage.run_command(command)
+    if result.returncode != 0:
+        raise ProbeError.from_result(result)
+
+    times, packets = array('d'), array('q')
+    bucket_bytes = array('d', bytes(8 * max(1, math.ceil(duration / BUCKET_SECONDS))))
+    for packet_index, line in enumerate(result.stdout.splitlines()):
+        # csv按字段定义的顺序输出：pts_time、size、flags
+        fields = line.split(',')
+        if len(fields) < 3 or fields[0] in ('', 'N/A'):
+            continue
+        pts_time = float(fields[0])
+        if 'K' in fields[2]:
+            times.append(pts_time)
+            packets.append(packet_index)
+        bucket = min(len(bucket_bytes) - 1, max(0, int(pts_time // BUCKET_SECONDS)))
+        bucket_bytes[bucket] += int(fields[1] or 0)
+    return times, packets, bucket_bytes
+
+
+def cached_scene_index(content_hash: str) -> Optional[SceneIndex]:
+    """返回探测索引中记录的场景索引，没有记录时返回None"""
+    data = probe_service.scene_index(content_hash)
+    return SceneIndex.from_dict(data) if data is not None else None
+
+
+def build_scene_index(path: str, content_hash: str, duration: float, stage: Stage) -> SceneIndex:
+    """读取包信息并解码一遍找出场景切换，结果记录到探测索引中
+
+    解码时跳过环路滤波，缩小后再计算场景分数；只输出场景切换处的帧时间，索引大小与视频时长无关
+    """
+    keyframe_times, keyframe_packets, bucket_bytes = _read_packets(path, duration, stage)
+
+    # 临时文件与输入放在同一个工作区中
+    cuts_path = os.path.join(os.path.dirname(path), "scene_cuts.txt")
+    try:
+        with scheduler.job(PRIORITY_ENCODE) as ticket:
+            command = Command().input(path, skip_loop_filter='all', threads=ticket.threads)
+            cuts = command.chain(
+                '0:v:0',
+                filter_spec('scale', ANALYSIS_WIDTH, -2, flags='fast_bilinear'),
+                SELECT_CUTS,
+                filter_spec('metadata', mode='print', file=cuts_path)
+            )
+            stage.run(command.output(os.devnull, cuts, f='null'), expected_seconds=duration)
+        scene_cuts = array('d', _read_cut_times(cuts_path))
+    finally:
+        if os.path.exists(cuts_path):
+            os.remove(cuts_path)
+
+    index = SceneIndex(
+        duration=duration,
+        scene_cuts=scene_cuts,
+        keyframe_times=keyframe_times,
+        keyframe_packets=keyframe_packets,
+        bucket_bytes=bucket_bytes
+    )
+    probe_service.store_scene_index(content_hash, index.to_dict())
+    return index
+
+
+def allocate_bitrates(index: SceneIndex, ranges: list[tuple[float, float]], bitrate: int) -> list[int]:
+    """按各区间的复杂度分配码率，时长加权后的平均码率等于bitrate"""
+    weights = [
+        min(MAX_BITRATE_WEIGHT, max(MIN_BITRATE_WEIGHT, index.complexity(start, end))) for start, end in ranges
+    ]
+    total_seconds = sum(end - start for start, end in ranges)
+    weighted = sum(weight * (end - start) for weight, (start, end) in zip(weights, ranges))
+    if total_seconds <= 0 or weighted <= 0:
+        return [bitrate for _ in ranges]
+    scale = total_seconds / weighted
+    return [int(bitrate * weight * scale) for weight in weights]
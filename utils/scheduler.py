@@ -0,0 +1,100 @@
+"""
+插件级ffmpeg任务调度器：限制并发数，按优先级排队并分配线程
+"""
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Optional
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+# 优先级，数值越小越先执行，同一优先级内按先进先出
+PRIORITY_PROBE = 0
+PRIORITY_COPY = 1
+# 按时间点定位后只解码少量帧，如缩略图
+PRIORITY_SEEK = 2
+PRIORITY_AUDIO = 3
+PRIORITY_ENCODE = 4
+
+
+def available_cpus() -> int:
+    """返回容器实际可用的CPU数，兼顾CPU亲和性与cgroup配额"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return max(1, cpus)
+
+
+@dataclass
+class JobTicket:
+    threads: int
+    queue_depth: int
+    wait_seconds: float
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self.queue_depth,
+            "wait_seconds": round(self.wait_seconds, 4),
+            "threads": self.threads
+        }
+
+
+class JobScheduler:
+    """限制同时运行的ffmpeg进程数，避免批量调用时CPU过载"""
+
+    def __init__(self, max_concurrency: Optional[int] = None, threads_per_job: Optional[int] = None):
+        cpus = available_cpus()
+        self.max_concurrency = max_concurrency or int(
+            os.environ.get("FFMPEG_MAX_CONCURRENCY", max(1, cpus // 2))
+        )
+        self.threads_per_job = threads_per_job or int(
+            os.environ.get("FFMPEG_THREADS_PER_JOB", max(1, cpus // self.max_concurrency))
+        )
+        self._cond = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._running = 0
+
+    @contextmanager
+    def job(self, priority: int = PRIORITY_ENCODE) -> Iterator[JobTicket]:
+        """申请一个执行槽位，退出上下文时释放"""
+        enqueued_at = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._counter))
+            heapq.heappush(self._waiting, entry)
+            queue_depth = self._running + len(self._waiting) - 1
+            while self._running >= self.max_concurrency or self._waiting[0] != entry:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._running += 1
+            # 队首变化后唤醒其他等待者，空闲槽位可以继续被占用
+            self._cond.notify_all()
+
+        ticket = JobTicket(
+            threads=self.threads_per_job,
+            queue_depth=queue_depth,
+            wait_seconds=time.monotonic() - enqueued_at
+        )
+        try:
+            yield ticket
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+
+scheduler = JobScheduler()
@@ -0,0 +1,52 @@
+"""
+启动预热：插件进程启动后在后台完成第一次调用原本要承担的冷启动工作，
+包括FFmpeg能力探测、ffmpeg/ffprobe二进制及其动态库进入页缓存、探测索引建表、
+导入SDK在第一次创建会话时才导入的模块
+"""
+from typing import Optional
+import os
+import subprocess
+import threading
+import time
+
+from dify_plugin.core.runtime import Session
+
+from utils.capabilities import capability_cache
+from utils.probe import probe_service
+
+# 设为0时不预热，第一次调用时再按需加载
+PREWARM = os.environ.get("FFMPEG_PREWARM", "1").lower() not in ("0", "false", "no")
+
+
+def _touch_binaries() -> None:
+    """各运行一次ffmpeg与ffprobe，使二进制与动态库进入页缓存"""
+    for binary in ('ffmpeg', 'ffprobe'):
+        subprocess.run([binary, '-version'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def warm_up() -> dict[str, float]:
+    """依次执行各项预热，返回成功项的耗时（秒）；失败的项留到第一次调用时重新执行并报告错误"""
+    steps = [
+        ("binaries", _touch_binaries),
+        ("capabilities", capability_cache.get),
+        ("probe_index", probe_service.warm),
+        ("sdk_session", Session.empty_session)
+    ]
+    timings = {}
+    for name, step in steps:
+        started = time.monotonic()
+        try:
+            step()
+        except Exception:
+            continue
+        timings[name] = round(time.monotonic() - started, 4)
+    return timings
+
+
+def start_warmup() -> Optional[threading.Thread]:
+    """在后台线程中预热，不阻塞插件开始接收请求；未启用时返回None"""
+    if not PREWARM:
+        return None
+    thread = threading.Thread(target=warm_up, name="ffmpeg-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,216 @@
+"""
+作业工作区：每次调用使用独立的临时目录，小文件优先放在tmpfs上，按作业与全局限额分配磁盘空间
+"""
+from typing import Any, Optional
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+
+# 作业目录所在的根目录名
+ROOT_NAME = "dify_ffmpeg_jobs"
+
+# tmpfs挂载点，设为空字符串时禁用
+TMPFS_DIR = os.environ.get("FFMPEG_TMPFS_DIR", "/dev/shm")
+
+# 预计占用不超过该值的作业才放在tmpfs上，tmpfs占用计入插件的内存限额（manifest.yaml中为256MB）
+TMPFS_MAX_JOB_BYTES = int(os.environ.get("FFMPEG_TMPFS_MAX_MB", 64)) * 1024 * 1024
+
+# 使用tmpfs后至少保留的剩余空间
+TMPFS_HEADROOM_BYTES = 256 * 1024 * 1024
+
+# 单个作业与全部作业可占用的临时空间上限
+JOB_QUOTA_BYTES = int(os.environ.get("FFMPEG_JOB_QUOTA_MB", 2048)) * 1024 * 1024
+GLOBAL_QUOTA_BYTES = int(os.environ.get("FFMPEG_WORKSPACE_QUOTA_MB", 8192)) * 1024 * 1024
+
+# 预留空间为输入大小的倍数：输入、输出与中间文件
+RESERVE_FACTOR = 3
+
+# 输入大小未知时的预留空间
+DEFAULT_RESERVE_BYTES = 256 * 1024 * 1024
+
+
+class WorkspaceQuotaError(Exception):
+    """作业所需的临时空间超出限额"""
+
+
+def _dir_usage(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+def _free_bytes(path: str) -> int:
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return 0
+    return stat.f_bavail * stat.f_frsize
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobWorkspace:
+    """单次调用的临时目录，release后整个目录被删除"""
+
+    def __init__(self, manager: "WorkspaceManager", path: str, tmpfs: bool, reserved_bytes: int):
+        self._manager = manager
+        self.path = path
+        self.tmpfs = tmpfs
+        self.reserved_bytes = reserved_bytes
+        self.peak_bytes = 0
+        self._released = False
+
+    def file(self, name: str) -> str:
+        """工作区内的文件路径"""
+        return os.path.join(self.path, name)
+
+    def mkdtemp(self, prefix: str) -> str:
+        """工作区内的子目录，随工作区一起删除"""
+        return tempfile.mkdtemp(prefix=prefix, dir=self.path)
+
+    def usage(self) -> int:
+        used = _dir_usage(self.path)
+        self.peak_bytes = max(self.peak_bytes, used)
+        return used
+
+    def check_quota(self) -> None:
+        """实际占用超过作业限额时抛出 WorkspaceQuotaError"""
+        used = self.usage()
+        if used > self._manager.job_quota_bytes:
+            raise WorkspaceQuotaError(
+                f"Job scratch space {used / 1048576:.0f} MB exceeds the {self._manager.job_quota_bytes / 1048576:.0f} MB quota"
+            )
+
+    def release(self) -> None:
+        """删除工作区并归还预留空间，可重复调用"""
+        if self._released:
+            return
+        self._released = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._manager._release(self)
+
+    def to_dict(self) -> dict[str, Any]:
+        """用于JSON输出的空间使用情况"""
+        return {
+            "tmpfs": self.tmpfs,
+            "used_bytes": self.usage(),
+            "peak_bytes": self.peak_bytes,
+            "reserved_bytes": self.reserved_bytes,
+            "active_jobs": self._manager.active_jobs
+        }
+
+    def __enter__(self) -> "JobWorkspace":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.release()
+        return False
+
+
+class WorkspaceManager:
+    """分配作业目录，目录名包含进程号，进程退出后遗留的目录在下次启动时清理"""
+
+    def __init__(self, disk_root: Optional[str] = None, tmpfs_root: Optional[str] = None,
+                 job_quota_bytes: int = JOB_QUOTA_BYTES, global_quota_bytes: int = GLOBAL_QUOTA_BYTES):
+        self.disk_root = disk_root or os.environ.get(
+            "FFMPEG_WORKSPACE_DIR", os.path.join(tempfile.gettempdir(), ROOT_NAME)
+        )
+        self.tmpfs_root = tmpfs_root if tmpfs_root is not None else (
+            os.path.join(TMPFS_DIR, ROOT_NAME) if TMPFS_DIR and os.path.isdir(TMPFS_DIR) else None
+        )
+        self.job_quota_bytes = job_quota_bytes
+        self.global_quota_bytes = global_quota_bytes
+        self._lock = threading.Lock()
+        self._reserved = 0
+        self._jobs = 0
+        self._swept = False
+
+    @property
+    def active_jobs(self) -> int:
+        return self._jobs
+
+    def sweep(self) -> int:
+        """删除已退出进程遗留的作业目录，返回删除的目录数"""
+        removed = 0
+        for root in filter(None, (self.disk_root, self.tmpfs_root)):
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                parts = entry.name.split("-")
+                if len(parts) != 3 or parts[0] != "job" or not parts[1].isdigit():
+                    continue
+                pid = int(parts[1])
+                # 首次清理时本进程还没有作业，同一进程号的目录来自重启前的进程
+                if _pid_alive(pid) and (pid != os.getpid() or self._swept):
+                    continue
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        self._swept = True
+        return removed
+
+    def job(self, expected_input_bytes: Optional[int] = None, factor: int = RESERVE_FACTOR) -> JobWorkspace:
+        """为一次调用分配工作区，按输入大小的factor倍预留空间，超出限额时抛出 WorkspaceQuotaError"""
+        reserve = expected_input_bytes * factor if expected_input_bytes else DEFAULT_RESERVE_BYTES
+        with self._lock:
+            if not self._swept:
+                self.sweep()
+            if reserve > self.job_quota_bytes:
+                raise WorkspaceQuotaError(
+                    f"Input needs about {reserve / 1048576:.1f} MB of scratch space, "
+                    f"more than the {self.job_quota_bytes / 1048576:.0f} MB per-job quota"
+                )
+            if self._reserved + reserve > self.global_quota_bytes:
+                raise WorkspaceQuotaError(
+                    f"Scratch space is exhausted: {self._reserved / 1048576:.0f} MB of "
+                    f"{self.global_quota_bytes / 1048576:.0f} MB is in use by {self._jobs} running jobs"
+                )
+            self._reserved += reserve
+            self._jobs += 1
+
+        try:
+            root, tmpfs = self._pick_root(reserve)
+            os.makedirs(root, exist_ok=True)
+            path = os.path.join(root, f"job-{os.getpid()}-{uuid.uuid4().hex}")
+            os.mkdir(path)
+        except BaseException:
+            with self._lock:
+                self._reserved -= reserve
+                self._jobs -= 1
+            raise
+        return JobWorkspace(self, path, tmpfs, reserve)
+
+    def _pick_root(self, reserve: int) -> tuple[str, bool]:
+        """小作业在tmpfs空间充足时放在tmpfs上，其余放在磁盘临时目录"""
+        if self.tmpfs_root and reserve <= TMPFS_MAX_JOB_BYTES:
+            if _free_bytes(os.path.dirname(self.tmpfs_root)) >= reserve + TMPFS_HEADROOM_BYTES:
+                return self.tmpfs_root, True
+        return self.disk_root, False
+
+    def _release(self, workspace: JobWorkspace) -> None:
+        with self._lock:
+            self._reserved -= workspace.reserved_bytes
+            self._jobs -= 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"active_jobs": self._jobs, "reserved_bytes": self._reserved}
+
+
+workspace_manager = WorkspaceManager()